@@ -0,0 +1,228 @@
+import base64
+import hashlib
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from src.object_storage import find_xml_text, get_canonical_query, sign_request
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+XML_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class FakeObjectStore:
+    # A stand-in for an S3 compatible object store with path-style buckets kept in memory. It checks
+    # the signature, Content-MD5 and payload hash of every request, like the real service.
+    ACCESS_KEY = 'AKIDFAKEOBJECTSTORE'
+    SECRET_KEY = 'fake-object-store-secret'
+    REGION = 'us-east-1'
+
+    def __init__(self, bucket: str = 'comics', latency: float = 0.0, host: str = '127.0.0.1',
+                 port: int = 0) -> None:
+        self.bucket = bucket
+        self.latency = latency
+        self.objects = {}
+        self.request_counts = {}
+        self.max_concurrent_requests = 0
+        self._uploads = {}
+        self._concurrent_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/{self.bucket}'
+
+    @property
+    def credentials(self) -> dict:
+        return {'region': self.REGION, 'access_key': self.ACCESS_KEY, 'secret_key': self.SECRET_KEY}
+
+    def __enter__(self) -> 'FakeObjectStore':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-object-store',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def get_pending_upload_count(self) -> int:
+        with self._lock:
+            return len(self._uploads)
+
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.request_counts[operation] = self.request_counts.get(operation, 0) + 1
+
+    def _handle(self, method: str, key: str, query: dict, headers, body: bytes) -> tuple:
+        if method == 'GET' and not key:
+            self._count('list')
+            return self._list_objects(query)
+        if method == 'POST' and 'uploads' in query:
+            self._count('create_multipart_upload')
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self._uploads[upload_id] = {}
+            return 200, self._xml('InitiateMultipartUploadResult',
+                                  f'<Bucket>{self.bucket}</Bucket><Key>{escape(key)}</Key>'
+                                  f'<UploadId>{upload_id}</UploadId>'), {}
+        if method == 'PUT' and 'uploadId' in query:
+            self._count('upload_part')
+            with self._lock:
+                if query['uploadId'] not in self._uploads:
+                    return self._error(404, 'NoSuchUpload')
+                self._uploads[query['uploadId']][int(query['partNumber'])] = body
+            return 200, b'', {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+        if method == 'POST' and 'uploadId' in query:
+            self._count('complete_multipart_upload')
+            return self._complete_multipart_upload(key, query['uploadId'], body)
+        if method == 'DELETE' and 'uploadId' in query:
+            self._count('abort_multipart_upload')
+            with self._lock:
+                self._uploads.pop(query['uploadId'], None)
+            return 204, b'', {}
+        if method == 'PUT':
+            self._count('put')
+            with self._lock:
+                self.objects[key] = body
+            return 200, b'', {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+        if method == 'DELETE':
+            self._count('delete')
+            with self._lock:
+                self.objects.pop(key, None)
+            return 204, b'', {}
+        if method in ('GET', 'HEAD'):
+            self._count(method.lower())
+            with self._lock:
+                data = self.objects.get(key)
+            if data is None:
+                return self._error(404, 'NoSuchKey')
+            return 200, data, {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+        return self._error(405, 'MethodNotAllowed')
+
+    def _list_objects(self, query: dict) -> tuple:
+        # Keys come back in order, max-keys at a time; the continuation token is the last key returned.
+        prefix = query.get('prefix', '')
+        max_keys = int(query.get('max-keys', 1000))
+        start_after = query.get('continuation-token', '')
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(prefix) and key > start_after)
+            page = [(key, len(self.objects[key])) for key in keys[:max_keys]]
+        truncated = len(keys) > max_keys
+        contents = ''.join(f'<Contents><Key>{escape(key)}</Key><Size>{size}</Size></Contents>'
+                           for key, size in page)
+        token = f'<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>' if truncated else ''
+        return 200, self._xml('ListBucketResult',
+                              f'<Name>{self.bucket}</Name><Prefix>{escape(prefix)}</Prefix>'
+                              f'<KeyCount>{len(page)}</KeyCount><IsTruncated>{str(truncated).lower()}'
+                              f'</IsTruncated>{token}{contents}'), {}
+
+    def _complete_multipart_upload(self, key: str, upload_id: str, body: bytes) -> tuple:
+        with self._lock:
+            parts = self._uploads.get(upload_id)
+            if parts is None:
+                return self._error(404, 'NoSuchUpload')
+            part_numbers = [int(number) for number in find_xml_text(body, 'PartNumber')]
+            etags = find_xml_text(body, 'ETag')
+            if part_numbers != sorted(parts) or any(
+                    etag != f'"{hashlib.md5(parts[number]).hexdigest()}"'
+                    for number, etag in zip(part_numbers, etags)):
+                return self._error(400, 'InvalidPart')
+            self.objects[key] = b''.join(parts[number] for number in part_numbers)
+            del self._uploads[upload_id]
+        etag = hashlib.md5(b''.join(hashlib.md5(parts[number]).digest() for number in part_numbers))
+        return 200, self._xml('CompleteMultipartUploadResult',
+                              f'<Key>{escape(key)}</Key><ETag>"{etag.hexdigest()}-{len(parts)}"</ETag>'), {}
+
+    def _check_request(self, method: str, raw_path: str, query: dict, headers, body: bytes) -> tuple:
+        authorization = headers.get('Authorization', '')
+        signed_headers = authorization.partition('SignedHeaders=')[2].partition(',')[0].split(';')
+        if not all(name in headers for name in signed_headers) or 'host' not in signed_headers:
+            return self._error(403, 'AccessDenied')
+        expected = sign_request(method, raw_path, get_canonical_query(query),
+                                {name: headers[name] for name in signed_headers}, self.ACCESS_KEY,
+                                self.SECRET_KEY, self.REGION)
+        if authorization != expected:
+            return self._error(403, 'SignatureDoesNotMatch')
+        if headers.get('x-amz-content-sha256') != hashlib.sha256(body).hexdigest():
+            return self._error(400, 'XAmzContentSHA256Mismatch')
+        content_md5 = headers.get('Content-MD5')
+        if content_md5 is not None and content_md5 != base64.b64encode(hashlib.md5(body).digest()).decode():
+            return self._error(400, 'BadDigest')
+
+    def _xml(self, root: str, content: str) -> bytes:
+        return f'{XML_DECLARATION}<{root} xmlns="{XML_NAMESPACE}">{content}</{root}>'.encode()
+
+    def _error(self, status_code: int, code: str) -> tuple:
+        return status_code, f'{XML_DECLARATION}<Error><Code>{code}</Code></Error>'.encode(), {}
+
+    def _create_handler(self) -> type:
+        fake_store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self._respond()
+
+            def do_HEAD(self) -> None:
+                self._respond()
+
+            def do_PUT(self) -> None:
+                self._respond()
+
+            def do_POST(self) -> None:
+                self._respond()
+
+            def do_DELETE(self) -> None:
+                self._respond()
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+            def _respond(self) -> None:
+                with fake_store._lock:
+                    fake_store._concurrent_requests += 1
+                    fake_store.max_concurrent_requests = max(fake_store.max_concurrent_requests,
+                                                             fake_store._concurrent_requests)
+                try:
+                    if fake_store.latency:
+                        time.sleep(fake_store.latency)
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    split_path = urlsplit(self.path)
+                    query = dict(parse_qsl(split_path.query, keep_blank_values=True))
+                    bucket, _, key = unquote(split_path.path).lstrip('/').partition('/')
+                    result = fake_store._check_request(self.command, split_path.path, query, self.headers,
+                                                       body)
+                    if result is None and bucket != fake_store.bucket:
+                        result = fake_store._error(404, 'NoSuchBucket')
+                    if result is None:
+                        result = fake_store._handle(self.command, key, query, self.headers, body)
+                finally:
+                    with fake_store._lock:
+                        fake_store._concurrent_requests -= 1
+                status_code, response_body, headers = result
+                self.send_response(status_code)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(response_body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(response_body)
+
+        return Handler
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeXkcdServer:
+    COMIC_INFO_PATH = re.compile(r'^/(\d+)/info\.0\.json$')
+    IMAGE_PATH = re.compile(r'^/comics/(\d+)\.png$')
+
+    def __init__(self, comic_count: int = 100, latency: float = 0.0, image_size: tuple = (20000, 120000),
+                 error_rate: float = 0.0, seed: int = 0, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.comic_count = comic_count
+        self.latency = latency
+        self.image_size = image_size if isinstance(image_size, tuple) else (image_size, image_size)
+        self.error_rate = error_rate
+        self.seed = seed
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    @property
+    def api_url(self) -> list:
+        return [self.base_url, '/info.0.json']
+
+    def __enter__(self) -> 'FakeXkcdServer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-xkcd-server',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def get_image(self, comic_id: int) -> bytes:
+        image_random = random.Random(f'{self.seed}-{comic_id}')
+        size = image_random.randint(*self.image_size)
+        return image_random.getrandbits(8 * size).to_bytes(size, 'little')
+
+    def get_comic_info(self, comic_id: int) -> dict:
+        return {'num': comic_id, 'title': f'Comic {comic_id}', 'safe_title': f'Comic {comic_id}',
+                'img': f'{self.base_url}comics/{comic_id}.png', 'alt': f'Alt text {comic_id}',
+                'year': str(2006 + comic_id // 365), 'month': str(comic_id % 12 + 1),
+                'day': str(comic_id % 28 + 1)}
+
+    def _route(self, path: str) -> tuple:
+        path = '/' + path.lstrip('/')
+        if path == '/info.0.json':
+            return 200, 'application/json', json.dumps(self.get_comic_info(self.comic_count)).encode()
+        match = self.COMIC_INFO_PATH.match(path)
+        if match and 1 <= int(match.group(1)) <= self.comic_count:
+            return 200, 'application/json', json.dumps(self.get_comic_info(int(match.group(1)))).encode()
+        match = self.IMAGE_PATH.match(path)
+        if match and 1 <= int(match.group(1)) <= self.comic_count:
+            return 200, 'image/png', self.get_image(int(match.group(1)))
+        return 404, 'text/plain', b'Not Found'
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.request_count += 1
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _create_handler(self) -> type:
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self._respond(send_body=True)
+
+            def do_HEAD(self) -> None:
+                self._respond(send_body=False)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+            def _respond(self, send_body: bool) -> None:
+                if fake_server.latency:
+                    time.sleep(fake_server.latency)
+                if fake_server._should_fail():
+                    status_code, content_type, body = 503, 'text/plain', b'Service Unavailable'
+                else:
+                    status_code, content_type, body = fake_server._route(self.path)
+                etag = f'"{hashlib.md5(body).hexdigest()}"' if status_code == 200 else None
+                if etag is not None and self.headers.get('If-None-Match') == etag:
+                    status_code, body = 304, b''
+                self.send_response(status_code)
+                if status_code != 304:
+                    self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_object_store import FakeObjectStore
+from benchmarks.fake_xkcd_server import FakeXkcdServer
+from src.storage import PackStorage
+
+ENGINES = ['sync', 'async', 'pipeline']
+
+
+def get_engine_class(engine: str) -> type:
+    if engine == 'async':
+        from src.async_downloader import AsyncXkcdDownloader
+        return AsyncXkcdDownloader
+    if engine == 'pipeline':
+        from src.pipeline_downloader import PipelineXkcdDownloader
+        return PipelineXkcdDownloader
+    from src.xkcd_downloader import XkcdDownloader
+    return XkcdDownloader
+
+
+def create_timed_downloader_class(engine_class: type) -> type:
+    # Every engine resolves metadata through _get_image_comic_url and stores the image through
+    # _persist_image_file_for_comic, so the time between both is the end to end latency of a comic.
+    class TimedDownloader(engine_class):
+        def __init__(self, **settings) -> None:
+            super().__init__(**settings)
+            self.comic_latencies = []
+            self._comic_started_at = {}
+            self._latency_lock = threading.Lock()
+
+        def _get_image_comic_url(self, comic_id: int) -> str:
+            with self._latency_lock:
+                self._comic_started_at[comic_id] = time.perf_counter()
+            return super()._get_image_comic_url(comic_id)
+
+        def _persist_image_file_for_comic(self, comic_id: int, comic_img_url: str, spooled_image) -> None:
+            super()._persist_image_file_for_comic(comic_id, comic_img_url, spooled_image)
+            with self._latency_lock:
+                self.comic_latencies.append(time.perf_counter() - self._comic_started_at.pop(comic_id))
+
+    return TimedDownloader
+
+
+def percentile(values: list, percent: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def get_peak_rss_bytes() -> int:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def get_bytes_written(directory: str, downloader) -> int:
+    # Bookkeeping files, including the -wal and -shm files of the SQLite stores, are not comic bytes.
+    ignored = (downloader.MANIFEST_FILE_NAME, downloader.HTTP_CACHE_FILE_NAME, downloader.JOURNAL_FILE_NAME,
+               downloader.CATALOG_FILE_NAME, PackStorage.INDEX_FILE_NAME)
+    return sum(entry.stat().st_size for entry in os.scandir(directory)
+               if entry.is_file() and not entry.name.startswith(ignored))
+
+
+def run_scenario(engine: str, api_url: list, settings: dict) -> dict:
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        downloader = create_timed_downloader_class(get_engine_class(engine))(
+            directory=directory, api_url=api_url, **settings)
+        with downloader:
+            started_at = time.perf_counter()
+            downloader.make_download()
+            elapsed = time.perf_counter() - started_at
+        latencies = downloader.comic_latencies
+        return {
+            'engine': engine,
+            'settings': settings,
+            'elapsed_seconds': round(elapsed, 4),
+            'comics_downloaded': downloader.get_count_of_comic_downloads,
+            'comics_per_second': round(len(latencies) / elapsed, 3) if elapsed else None,
+            'latency_p50_seconds': percentile(latencies, 50),
+            'latency_p95_seconds': percentile(latencies, 95),
+            'latency_p99_seconds': percentile(latencies, 99),
+            'peak_rss_bytes': get_peak_rss_bytes(),
+            'bytes_written': get_bytes_written(directory, downloader),
+        }
+
+
+def run_benchmark(engines: list, server_options: dict, engine_settings: dict) -> dict:
+    # Each scenario runs in a fresh process so that peak RSS belongs to that engine alone.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    object_store = FakeObjectStore(latency=server_options['latency'])
+    with FakeXkcdServer(**server_options) as server, object_store:
+        with context.Pool(processes=1, maxtasksperchild=1) as pool:
+            for engine in engines:
+                settings = dict(engine_settings.get(engine, {}))
+                if settings.get('storage') == 'object':
+                    # Uploads go to the local object store, under a prefix of their own per engine.
+                    settings.update(object_store_url=f'{object_store.url}/{engine}',
+                                    object_store_access_key=object_store.ACCESS_KEY,
+                                    object_store_secret_key=object_store.SECRET_KEY)
+                result = pool.apply(run_scenario, (engine, server.api_url, settings))
+                if settings.get('storage') == 'object':
+                    result['bytes_written'] = sum(len(data) for key, data in object_store.objects.items()
+                                                  if key.startswith(f'{engine}/'))
+                results.append(result)
+    baseline = next((result for result in results if result['engine'] == 'sync'), None)
+    for result in results:
+        if baseline is not None and result['elapsed_seconds']:
+            result['speedup_vs_sync'] = round(baseline['elapsed_seconds'] / result['elapsed_seconds'], 2)
+    return {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': sys.version.split()[0],
+            'server': server_options, 'results': results}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the xkcd downloader against a local fake server')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--comics', type=int, default=200, help='number of comics served')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every response')
+    parser.add_argument('--image-size', type=int, nargs=2, default=[20000, 120000], metavar=('MIN', 'MAX'),
+                        help='image size range in bytes')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of responses that are 503')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrency of the async engine')
+    parser.add_argument('--workers', type=int, default=16, help='metadata and fetch workers of the pipeline')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second (default: off)')
+    parser.add_argument('--storage', choices=['directory', 'pack', 'object'], default='directory',
+                        help='where the images go; object uploads them to a local stand-in object store')
+    parser.add_argument('--output', default='bench_output.json', help='file the JSON results are written to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    server_options = {'comic_count': args.comics, 'latency': args.latency,
+                      'image_size': tuple(args.image_size), 'error_rate': args.error_rate, 'seed': args.seed}
+    common_settings = {'rate_limit': args.rate_limit, 'storage': args.storage,
+                       'aimd_initial_limit': max(args.concurrency, args.workers), 'retry_backoff': 0.05}
+    engine_settings = {
+        'sync': dict(common_settings),
+        'async': dict(common_settings, concurrency=args.concurrency),
+        'pipeline': dict(common_settings, metadata_workers=args.workers, fetch_workers=args.workers),
+    }
+    report = run_benchmark(args.engines, server_options, engine_settings)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    for result in report['results']:
+        print(f'{result["engine"]:>8}: {result["comics_per_second"]} comics/s, '
+              f'p50 {result["latency_p50_seconds"]:.3f}s, p95 {result["latency_p95_seconds"]:.3f}s, '
+              f'p99 {result["latency_p99_seconds"]:.3f}s, peak RSS {result["peak_rss_bytes"] // 1024} KiB, '
+              f'{result["bytes_written"]} bytes written'
+              + (f', {result["speedup_vs_sync"]}x vs sync' if 'speedup_vs_sync' in result else ''))
+    print(f'Results saved in {args.output}')
+
+
+if __name__ == '__main__':
+    main()
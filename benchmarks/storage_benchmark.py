@@ -0,0 +1,73 @@
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_object_store import FakeObjectStore
+from src.object_storage import ObjectStorage
+from src.storage import STORAGE_BACKENDS, DirectoryStorage, PackStorage
+
+
+def create_storage(backend: str, directory: str, object_store: FakeObjectStore = None):
+    if backend == 'pack':
+        return PackStorage(directory)
+    if backend == 'object':
+        # Every scenario gets its own prefix, so it starts from an empty bucket.
+        return ObjectStorage(directory, f'{object_store.url}/{os.path.basename(directory)}',
+                             **object_store.credentials)
+    return DirectoryStorage(directory)
+
+
+def run_storage_scenario(backend: str, file_count: int, file_size: int, seed: int = 0,
+                         object_store: FakeObjectStore = None) -> dict:
+    data_random = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = create_storage(backend, directory, object_store)
+        try:
+            temporary_files = []
+            for _ in range(file_count):
+                content = data_random.getrandbits(8 * file_size).to_bytes(file_size, 'little')
+                with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-',
+                                                 delete=False) as temporary_file:
+                    temporary_file.write(content)
+                temporary_files.append((f'{hashlib.md5(content).hexdigest()}.png', temporary_file.name))
+            started_at = time.perf_counter()
+            for name, temporary_file_path in temporary_files:
+                storage.store(name, temporary_file_path)
+            if backend == 'pack':
+                storage.sync()
+            store_seconds = time.perf_counter() - started_at
+            started_at = time.perf_counter()
+            names = storage.list_names()
+            list_seconds = time.perf_counter() - started_at
+            started_at = time.perf_counter()
+            for name, _ in temporary_files:
+                storage.read(name)
+            read_seconds = time.perf_counter() - started_at
+        finally:
+            storage.close()
+        return {'backend': backend, 'files': file_count, 'file_size': file_size,
+                'stores_per_second': round(file_count / store_seconds, 1),
+                'list_seconds': round(list_seconds, 6), 'listed_entries': len(names),
+                'reads_per_second': round(file_count / read_seconds, 1)}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Compare the write, list and read speed of the storages')
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--file-size', type=int, default=4096)
+    parser.add_argument('--object-store-latency', type=float, default=0.0,
+                        help='seconds added to every request of the local object store')
+    args = parser.parse_args(argv)
+    with FakeObjectStore(latency=args.object_store_latency) as object_store:
+        for backend in sorted(STORAGE_BACKENDS):
+            result = run_storage_scenario(backend, args.files, args.file_size, object_store=object_store)
+            print(f'{result["backend"]:>9}: {result["stores_per_second"]} stores/s, '
+                  f'list {result["list_seconds"]}s ({result["listed_entries"]} entries), '
+                  f'{result["reads_per_second"]} reads/s')
+
+
+if __name__ == '__main__':
+    main()
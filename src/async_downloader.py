@@ -0,0 +1,42 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from src.config import AsyncDownloaderConfig
+from src.xkcd_downloader import XkcdDownloader
+
+
+class AsyncXkcdDownloader(XkcdDownloader, AsyncDownloaderConfig):
+    def __init__(self, **settings) -> None:
+        super().__init__(**settings)
+        if self.CONCURRENCY < 1:
+            raise ValueError(f'Concurrency must be at least 1, got {self.CONCURRENCY}')
+        self.POOL_MAXSIZE = max(self.POOL_MAXSIZE, self.CONCURRENCY)
+
+    def _download_comics(self, comic_ids: Iterable[int]) -> None:
+        asyncio.run(self._download_comics_concurrently(comic_ids))
+
+    async def _download_comics_concurrently(self, comic_ids: Iterable[int]) -> None:
+        # requests is blocking, so every comic runs on a worker thread while the
+        # semaphore keeps the number of comics in flight at CONCURRENCY.
+        semaphore = asyncio.Semaphore(self.CONCURRENCY)
+        loop = asyncio.get_running_loop()
+
+        async def download(comic_id: int) -> None:
+            async with semaphore:
+                if not self._stop_requested.is_set():
+                    await loop.run_in_executor(executor, self._download_image_file_for_comic, comic_id)
+
+        executor = ThreadPoolExecutor(max_workers=self.CONCURRENCY, thread_name_prefix='xkcd')
+        try:
+            await asyncio.gather(*(download(comic_id) for comic_id in comic_ids))
+        except BaseException:
+            # A second signal cancels this coroutine; leaving the executor's context would wait for every
+            # request in flight, so the queued comics are dropped and the run returns without them.
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
@@ -0,0 +1,235 @@
+import argparse
+import os
+import sys
+
+from src.config import AsyncDownloaderConfig, DownloaderConfig, PipelineDownloaderConfig
+from src.log import configure_logging, stop_logging
+
+# Only the configuration and the logging are imported up front. The downloaders (requests, urllib3,
+# asyncio), the storage and the profiler are imported by the mode that needs them, so --help and the
+# offline modes start without loading the HTTP stack.
+# The names of src.storage.STORAGE_BACKENDS, without importing it.
+STORAGE_NAMES = ('directory', 'pack', 'object')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Download every xkcd comic image')
+    parser.add_argument('--engine', choices=['sync', 'async', 'pipeline'], default='sync',
+                        help='download engine (default: sync)')
+    parser.add_argument('--concurrency', type=int, default=AsyncDownloaderConfig.CONCURRENCY,
+                        help='comics downloaded at once by the async engine '
+                             f'(default: {AsyncDownloaderConfig.CONCURRENCY})')
+    parser.add_argument('--directory', default=DownloaderConfig.DIRECTORY,
+                        help='directory of the images and of the run state '
+                             f'(default: {DownloaderConfig.DIRECTORY})')
+    parser.add_argument('--timeout', type=float, default=DownloaderConfig.TIMEOUT,
+                        help=f'seconds to wait for the xkcd API (default: {DownloaderConfig.TIMEOUT})')
+    parser.add_argument('--api-url', default=DownloaderConfig.API_URL[0],
+                        help=f'base URL of the xkcd API (default: {DownloaderConfig.API_URL[0]})')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='only retry the comics that failed in previous runs')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only download the comics newer than the highest comic already done')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and download new comics as soon as they are published')
+    parser.add_argument('--watch-interval', type=float, default=DownloaderConfig.WATCH_INTERVAL,
+                        help='seconds between polls in watch mode '
+                             f'(default: {DownloaderConfig.WATCH_INTERVAL})')
+    parser.add_argument('--shard', metavar='K/N',
+                        help='only download the comics of shard K out of N shards, e.g. 2/4')
+    parser.add_argument('--lease-queue', metavar='PATH',
+                        help='claim comics in batches from the lease queue shared by several workers at PATH')
+    parser.add_argument('--lease-batch-size', type=int, default=DownloaderConfig.LEASE_BATCH_SIZE,
+                        help='comics claimed at once from the lease queue '
+                             f'(default: {DownloaderConfig.LEASE_BATCH_SIZE})')
+    parser.add_argument('--sqlite-journal-mode', choices=['WAL', 'DELETE'], type=str.upper,
+                        help='journal of the SQLite files in the directory; DELETE is safe on a volume '
+                             'shared by several machines (default: DELETE with --shard or --lease-queue, '
+                             'WAL otherwise)')
+    parser.add_argument('--worker-id', help='name of this worker in the lease queue (default: host-pid)')
+    parser.add_argument('--storage', choices=STORAGE_NAMES, default=DownloaderConfig.STORAGE,
+                        help='one file per image, a single append-only pack file or an S3 compatible object '
+                             f'store (default: {DownloaderConfig.STORAGE})')
+    parser.add_argument('--object-store-url', metavar='URL', default=DownloaderConfig.OBJECT_STORE_URL,
+                        help='bucket of the object storage, e.g. https://host/bucket/prefix; the credentials '
+                             'are read from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY')
+    parser.add_argument('--object-store-region', default=DownloaderConfig.OBJECT_STORE_REGION,
+                        help=f'region signed into the object store requests '
+                             f'(default: {DownloaderConfig.OBJECT_STORE_REGION})')
+    parser.add_argument('--export-pack', metavar='DIR',
+                        help='copy every image of the pack storage to DIR as plain files and exit')
+    parser.add_argument('--verify', action='store_true',
+                        help='check every stored image against the md5 in its name and exit')
+    parser.add_argument('--quarantine', action='store_true',
+                        help='with --verify, move corrupt, truncated and orphaned files out of the store')
+    parser.add_argument('--verify-workers', type=int, default=DownloaderConfig.VERIFY_WORKERS,
+                        help='processes hashing the stored files with --verify (default: one per CPU)')
+    parser.add_argument('--stats', action='store_true',
+                        help='print what the manifest, journal, catalog and storage hold and exit')
+    parser.add_argument('--plan', metavar='PATH',
+                        help='work out the comics and bytes a download would fetch, using HEAD requests for '
+                             'the images already catalogued, save the plan to PATH and exit')
+    parser.add_argument('--plan-bandwidth', type=float, default=DownloaderConfig.PLAN_BANDWIDTH,
+                        help='bytes per second assumed by the estimated duration of a plan '
+                             f'(default: {DownloaderConfig.PLAN_BANDWIDTH})')
+    parser.add_argument('--execute-plan', metavar='PATH',
+                        help='download exactly the comics of the plan saved at PATH')
+    parser.add_argument('--rate-limit', type=float, default=DownloaderConfig.RATE_LIMIT,
+                        help=f'requests per second per host (default: {DownloaderConfig.RATE_LIMIT})')
+    parser.add_argument('--metadata-workers', type=int, default=PipelineDownloaderConfig.METADATA_WORKERS,
+                        help='metadata workers of the pipeline engine')
+    parser.add_argument('--fetch-workers', type=int, default=PipelineDownloaderConfig.FETCH_WORKERS,
+                        help='image fetch workers of the pipeline engine')
+    parser.add_argument('--persist-workers', type=int, default=PipelineDownloaderConfig.PERSIST_WORKERS,
+                        help='persist workers of the pipeline engine')
+    parser.add_argument('--queue-size', type=int, default=PipelineDownloaderConfig.QUEUE_SIZE,
+                        help='size of the queues between pipeline stages')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help='lowest level of the log lines written (default: INFO)')
+    parser.add_argument('--log-sample-rate', type=float, default=1.0,
+                        help='fraction of the comics whose INFO lines are logged, warnings and errors '
+                             'are always logged (default: 1.0)')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='write a JSON summary of the run metrics to PATH')
+    parser.add_argument('--metrics-prometheus', metavar='PATH',
+                        help='write the run metrics to PATH in the Prometheus text format')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='record a span per request, download and file write of every comic and write '
+                             'them to PATH in the Chrome trace event format')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='run under cProfile, including the worker threads, and write the pstats to PATH')
+    return parser.parse_args(argv)
+
+
+def get_settings(args: argparse.Namespace) -> dict:
+    # The options shared by every engine, as the keyword settings of the downloader classes.
+    return {'directory': args.directory, 'timeout': args.timeout,
+            'api_url': [args.api_url.rstrip('/') + '/', DownloaderConfig.API_URL[1]],
+            'rate_limit': args.rate_limit, 'incremental': args.incremental,
+            'watch_interval': args.watch_interval, 'shard': args.shard,
+            'lease_queue_file': args.lease_queue, 'lease_batch_size': args.lease_batch_size,
+            'worker_id': args.worker_id, 'sqlite_journal_mode': args.sqlite_journal_mode,
+            'storage': args.storage, 'trace': bool(args.trace),
+            'plan_bandwidth': args.plan_bandwidth, 'object_store_url': args.object_store_url,
+            'object_store_region': args.object_store_region}
+
+
+def get_storage_options(args: argparse.Namespace) -> dict:
+    # The options of the storage opened by the offline modes, which work without a downloader; they keep the
+    # journal mode the store was created with.
+    if args.storage == 'pack':
+        return {'journal_mode': None}
+    if args.storage == 'object':
+        return {'url': args.object_store_url, 'region': args.object_store_region}
+    return {}
+
+
+def create_downloader(args: argparse.Namespace):
+    settings = get_settings(args)
+    if args.engine == 'async':
+        from src.async_downloader import AsyncXkcdDownloader
+        return AsyncXkcdDownloader(concurrency=args.concurrency, **settings)
+    if args.engine == 'pipeline':
+        from src.pipeline_downloader import PipelineXkcdDownloader
+        return PipelineXkcdDownloader(
+            metadata_workers=args.metadata_workers, fetch_workers=args.fetch_workers,
+            persist_workers=args.persist_workers, queue_size=args.queue_size, **settings)
+    from src.xkcd_downloader import XkcdDownloader
+    return XkcdDownloader(**settings)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level, args.log_sample_rate)
+    try:
+        if args.profile:
+            from src.tracing import profile_run
+            with profile_run(args.profile):
+                return run(args)
+        return run(args)
+    finally:
+        stop_logging()
+
+
+def run(args: argparse.Namespace):
+    if args.export_pack or args.verify or args.stats:
+        # The offline modes only read an existing store and never create one.
+        if not os.path.isdir(args.directory):
+            print(f'No comic store in "{args.directory}/"', file=sys.stderr)
+            return 2
+        if args.export_pack:
+            return export_pack(args)
+        if args.verify:
+            return verify(args)
+        return print_stats(args)
+    if args.plan:
+        return plan(args)
+    download_plan = None
+    if args.execute_plan:
+        from src.download_plan import DownloadPlan
+        download_plan = DownloadPlan.read(args.execute_plan)
+    xkcd_downloader_instance = create_downloader(args)
+    try:
+        with xkcd_downloader_instance:
+            if download_plan is not None:
+                xkcd_downloader_instance.execute_plan(download_plan)
+            elif args.retry_failed:
+                xkcd_downloader_instance.retry_failed_comics()
+            elif args.watch:
+                xkcd_downloader_instance.watch()
+            else:
+                xkcd_downloader_instance.make_download()
+    except KeyboardInterrupt:
+        print('Download aborted')
+    if args.metrics_json:
+        xkcd_downloader_instance.metrics.write_json(args.metrics_json)
+    if args.metrics_prometheus:
+        xkcd_downloader_instance.metrics.write_prometheus_text_file(args.metrics_prometheus)
+    if args.trace:
+        xkcd_downloader_instance.tracer.write_chrome_trace(args.trace)
+    print('End of execution')
+    print(f'Resume: {xkcd_downloader_instance.get_count_of_comic_downloads}'
+          ' comics image files has been downloaded and saved '
+          f'in {xkcd_downloader_instance.DIRECTORY}/')
+
+
+def plan(args: argparse.Namespace) -> int:
+    with create_downloader(args) as xkcd_downloader_instance:
+        download_plan = xkcd_downloader_instance.plan_download()
+        if download_plan is None:
+            print('The last comic index could not be obtained from the xkcd API', file=sys.stderr)
+            return 1
+        download_plan.write(args.plan)
+        for name, value in xkcd_downloader_instance.get_plan_summary(download_plan).items():
+            print(f'{name}: {value}')
+    print(f'Plan saved to {args.plan}, run it with --execute-plan {args.plan}')
+    return 0
+
+
+def export_pack(args: argparse.Namespace) -> int:
+    from src.storage import PackStorage
+    pack_storage = PackStorage(args.directory, journal_mode=None)
+    try:
+        exported = pack_storage.export(args.export_pack)
+    finally:
+        pack_storage.close()
+    print(f'{exported} image files exported from the pack to {args.export_pack}/')
+    return 0
+
+
+def verify(args: argparse.Namespace) -> int:
+    from src.verify import verify_store
+    report = verify_store(args.directory, args.storage, args.verify_workers, args.quarantine,
+                          get_storage_options(args))
+    for problem in report.problems:
+        print(f'{problem.problem}: {problem.name} ({problem.detail})')
+    print(f'{report.checked} stored files verified, {len(report.problems)} problems found, '
+          f'{len(report.quarantined)} files quarantined')
+    return 1 if report.problems else 0
+
+
+def print_stats(args: argparse.Namespace) -> int:
+    from src.stats import get_store_stats
+    for name, value in get_store_stats(args.directory, args.storage, get_storage_options(args)).items():
+        print(f'{name}: {value}')
+    return 0
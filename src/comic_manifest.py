@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+import time
+
+from src.sqlite_journal import set_journal_mode
+
+
+class ComicManifest:
+    def __init__(self, path: str, journal_mode: str = 'WAL') -> None:
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        set_journal_mode(self._connection, journal_mode)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS comics ('
+                'comic_id INTEGER PRIMARY KEY, img_url TEXT NOT NULL, md5 TEXT NOT NULL, '
+                'file_name TEXT NOT NULL, size INTEGER NOT NULL, fetched_at REAL NOT NULL)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS failed_comics ('
+                'comic_id INTEGER PRIMARY KEY, reason TEXT NOT NULL, attempts INTEGER NOT NULL, '
+                'failed_at REAL NOT NULL)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM comics').fetchone()[0]
+
+    def record(self, comic_id: int, img_url: str, md5: str, file_name: str, size: int,
+               fetched_at: float = None) -> None:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO comics (comic_id, img_url, md5, file_name, size, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (comic_id, img_url, md5, file_name, size, fetched_at))
+            self._connection.execute('DELETE FROM failed_comics WHERE comic_id = ?', (comic_id,))
+
+    def record_failure(self, comic_id: int, reason: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO failed_comics (comic_id, reason, attempts, failed_at) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (comic_id) DO UPDATE SET reason = excluded.reason, attempts = attempts + 1, '
+                'failed_at = excluded.failed_at', (comic_id, reason, time.time()))
+
+    def get_failures(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT comic_id, reason, attempts, failed_at FROM failed_comics '
+                'ORDER BY comic_id').fetchall()
+        return {row[0]: dict(zip(('reason', 'attempts', 'failed_at'), row[1:])) for row in rows}
+
+    def get_failed_comic_ids(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                'SELECT comic_id FROM failed_comics ORDER BY comic_id')]
+
+    def get(self, comic_id: int) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT comic_id, img_url, md5, file_name, size, fetched_at FROM comics WHERE comic_id = ?',
+                (comic_id,)).fetchone()
+        if row is not None:
+            return dict(zip(('comic_id', 'img_url', 'md5', 'file_name', 'size', 'fetched_at'), row))
+
+    def get_file_names(self) -> dict:
+        with self._lock:
+            return dict(self._connection.execute('SELECT comic_id, file_name FROM comics'))
+
+    def get_file_sizes(self) -> dict:
+        with self._lock:
+            return dict(self._connection.execute('SELECT file_name, size FROM comics'))
+
+    def get_high_water_mark(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM state WHERE key = 'high_water_mark'").fetchone()
+        if row is not None:
+            return row[0]
+
+    def advance_high_water_mark(self, comic_id: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO state (key, value) VALUES ('high_water_mark', ?) "
+                'ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)', (comic_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
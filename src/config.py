@@ -0,0 +1,79 @@
+class DownloaderConfig:
+    # Default settings of the downloaders, overridden per instance by the lowercase keyword arguments
+    # of the constructor. They are kept apart from the downloader classes, which import requests, so
+    # the command line can show them and run the offline modes without loading the HTTP stack.
+    API_URL = ['https://xkcd.com/', '/info.0.json']
+    DIRECTORY = 'comics'
+    MANIFEST_FILE_NAME = 'manifest.sqlite3'
+    HTTP_CACHE_FILE_NAME = 'http_cache.sqlite3'
+    HTTP_CACHE_MAX_BYTES = 8 * 1024 * 1024
+    JOURNAL_FILE_NAME = 'progress.journal'
+    CATALOG_FILE_NAME = 'catalog.sqlite3'
+    JOURNAL_SYNC_EVERY = 64
+    JOURNAL_SYNC_INTERVAL = 1.0
+    STORAGE = 'directory'
+    PACK_SYNC_EVERY = 64
+    PACK_SYNC_INTERVAL = 1.0
+    # Bucket of the object storage as https://host/bucket or https://host/bucket/prefix; credentials
+    # left as None are read from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY.
+    OBJECT_STORE_URL = None
+    OBJECT_STORE_REGION = 'us-east-1'
+    OBJECT_STORE_ACCESS_KEY = None
+    OBJECT_STORE_SECRET_KEY = None
+    OBJECT_STORE_PART_SIZE = 8 * 1024 * 1024
+    OBJECT_STORE_UPLOAD_WORKERS = 4
+    OBJECT_STORE_POOL_SIZE = 16
+    TEMPORARY_FILE_PREFIX = '.tmp-'
+    STALE_TEMPORARY_FILE_AGE = 600
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = 10
+    HEADERS = {}
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 10
+    MAX_RETRIES = 0
+    RATE_LIMIT = 20
+    RATE_LIMIT_BURST = 20
+    AIMD_INITIAL_LIMIT = 8
+    AIMD_MAX_LIMIT = 64
+    AIMD_LATENCY_THRESHOLD = 2.0
+    THROTTLE_STATUS_CODES = (429, 503)
+    RETRIES = 3
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    RETRY_BACKOFF = 0.5
+    RETRY_BACKOFF_MAX = 30
+    MAX_RETRY_AFTER = 120
+    INCREMENTAL = False
+    WATCH_INTERVAL = 30
+    WATCH_BACKOFF_MAX = 900
+    TRACE = False
+    TRACE_MAX_EVENTS = 1000000
+    SHARD = None
+    LEASE_QUEUE_FILE = None
+    LEASE_BATCH_SIZE = 20
+    LEASE_SECONDS = 60
+    WORKER_ID = None
+    # The journal mode of the SQLite files in the directory; by default WAL, or the rollback journal
+    # (DELETE) when a shard or lease queue is set, since those workers may share the volume across machines.
+    SQLITE_JOURNAL_MODE = None
+    VERIFY_WORKERS = None
+    QUARANTINE_DIRECTORY_NAME = 'quarantine'
+    PLAN_WORKERS = 8
+    PLAN_SAMPLE_SIZE = 20
+    # Bytes per second assumed for the transfer when a plan estimates how long it takes.
+    PLAN_BANDWIDTH = 2 * 1024 * 1024
+    HOSTS_CONFIG = {
+        'xkcd.com': {},
+        'imgs.xkcd.com': {'timeout': 30},
+    }
+
+
+class AsyncDownloaderConfig(DownloaderConfig):
+    CONCURRENCY = 32
+
+
+class PipelineDownloaderConfig(DownloaderConfig):
+    METADATA_WORKERS = 8
+    FETCH_WORKERS = 8
+    PERSIST_WORKERS = 2
+    QUEUE_SIZE = 32
+    STATS_INTERVAL = 10
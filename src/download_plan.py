@@ -0,0 +1,41 @@
+import json
+import os
+from typing import NamedTuple
+
+PLAN_FORMAT_VERSION = 1
+
+
+class PlannedComic(NamedTuple):
+    comic_id: int
+    # Known when the comic is already in the metadata catalog; size and content type then come from a
+    # HEAD request and stay None if it failed.
+    img_url: str
+    size: int
+    content_type: str
+
+
+class DownloadPlan(NamedTuple):
+    api_url: str
+    first_comic_index: int
+    last_comic_index: int
+    comics: list
+    created_at: float
+
+    def write(self, path: str) -> None:
+        # A run started from a half written plan would silently skip comics.
+        document = {'version': PLAN_FORMAT_VERSION, 'api_url': self.api_url,
+                    'first_comic_index': self.first_comic_index, 'last_comic_index': self.last_comic_index,
+                    'created_at': self.created_at, 'comics': [comic._asdict() for comic in self.comics]}
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as plan_file:
+            json.dump(document, plan_file, separators=(',', ':'))
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def read(cls, path: str) -> 'DownloadPlan':
+        with open(path) as plan_file:
+            document = json.load(plan_file)
+        if document.get('version') != PLAN_FORMAT_VERSION:
+            raise ValueError(f'Unsupported download plan version: {document.get("version")}')
+        return cls(document['api_url'], document['first_comic_index'], document['last_comic_index'],
+                   [PlannedComic(**comic) for comic in document['comics']], document['created_at'])
@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+import time
+
+from src.sqlite_journal import set_journal_mode
+
+
+class HttpCache:
+    ENTRY_OVERHEAD_BYTES = 128
+    COLUMNS = ('url', 'etag', 'last_modified', 'body', 'stored_name', 'size', 'last_used')
+
+    def __init__(self, path: str, max_size_bytes: int, journal_mode: str = 'WAL') -> None:
+        self.max_size_bytes = max_size_bytes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        set_journal_mode(self._connection, journal_mode)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS http_cache ('
+                'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, stored_name TEXT, '
+                'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS http_cache_last_used ON http_cache (last_used)')
+            self._total_size = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+
+    @property
+    def total_size(self) -> int:
+        return self._total_size
+
+    def get(self, url: str) -> dict:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                f'SELECT {", ".join(self.COLUMNS)} FROM http_cache WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self._connection.execute('UPDATE http_cache SET last_used = ? WHERE url = ?',
+                                         (time.time(), url))
+                return dict(zip(self.COLUMNS, row))
+
+    def store(self, url: str, etag: str = None, last_modified: str = None, body: bytes = None,
+              stored_name: str = None) -> None:
+        size = (self.ENTRY_OVERHEAD_BYTES + len(url) + len(etag or '') + len(last_modified or '')
+                + len(body or b'') + len(stored_name or ''))
+        if size > self.max_size_bytes:
+            return
+        with self._lock, self._connection:
+            previous = self._connection.execute(
+                'SELECT size FROM http_cache WHERE url = ?', (url,)).fetchone()
+            self._connection.execute(
+                f'INSERT OR REPLACE INTO http_cache ({", ".join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, body, stored_name, size, time.time()))
+            self._total_size += size - (previous[0] if previous else 0)
+            self._evict()
+
+    def _evict(self) -> None:
+        # Least recently used entries go first until the cache fits its size budget again.
+        while self._total_size > self.max_size_bytes:
+            rows = self._connection.execute(
+                'SELECT url, size FROM http_cache ORDER BY last_used, rowid LIMIT 64').fetchall()
+            if not rows:
+                self._total_size = 0
+                break
+            for url, size in rows:
+                if self._total_size <= self.max_size_bytes:
+                    break
+                self._connection.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+                self._total_size -= size
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
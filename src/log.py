@@ -0,0 +1,76 @@
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = 'xkcd'
+LOG_FORMAT = '[%(asctime)s][%(levelname)s] %(message)s'
+# Passed through `extra` and appended to the line as key=value pairs.
+STRUCTURED_FIELDS = ('comic_id', 'phase', 'status', 'bytes', 'duration')
+
+logger = logging.getLogger(LOGGER_NAME)
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        fields = []
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                fields.append(f'{field}={value:.3f}' if isinstance(value, float) else f'{field}={value}')
+        return f'{message} {" ".join(fields)}' if fields else message
+
+
+class ComicSampler(logging.Filter):
+    def __init__(self, rate: float = 1.0) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Only the INFO lines of a comic are sampled, warnings and errors are always kept. The choice
+        # hashes the comic id (Knuth's multiplicative hash), so a sampled comic keeps all its lines
+        # and the sample does not line up with shards.
+        comic_id = getattr(record, 'comic_id', None)
+        if self.rate >= 1 or record.levelno != logging.INFO or comic_id is None:
+            return True
+        return (comic_id * 2654435761) % 2 ** 32 < self.rate * 2 ** 32
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record is queued as it is and the message is
+        # only formatted on the listener thread, never on the downloading threads.
+        return record
+
+
+def configure_logging(level='INFO', sample_rate: float = 1.0, stream=None) -> None:
+    # Records go through an unbounded queue to a listener thread that does the formatting and the
+    # writes, so logging never blocks the threads and the event loop that download comics.
+    global _listener
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    logger.addHandler(_InProcessQueueHandler(log_queue))
+    logger.addFilter(ComicSampler(sample_rate))
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def stop_logging() -> None:
+    # Waits until the listener has written every queued record.
+    global _listener
+    for handler in list(logger.handlers):
+        if isinstance(handler, _InProcessQueueHandler):
+            logger.removeHandler(handler)
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, ComicSampler):
+            logger.removeFilter(log_filter)
+    logger.propagate = True
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,100 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+from src.sqlite_journal import set_journal_mode
+
+
+class MetadataCatalog:
+    # The complete info.0.json of every comic is kept as a compact JSON document, next to the columns
+    # that are looked up, so queries touch the indexes and only the matching documents are parsed.
+    def __init__(self, path: str, journal_mode: str = 'WAL') -> None:
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        set_journal_mode(self._connection, journal_mode)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS comics ('
+                'comic_id INTEGER PRIMARY KEY, title TEXT NOT NULL COLLATE NOCASE, published TEXT, '
+                'img_url TEXT, metadata TEXT NOT NULL, fetched_at REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS comics_title ON comics (title)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS comics_published ON comics (published)')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM comics').fetchone()[0]
+
+    def __contains__(self, comic_id: int) -> bool:
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM comics WHERE comic_id = ?',
+                                            (comic_id,)).fetchone() is not None
+
+    def record(self, comic_id: int, metadata: dict, fetched_at: float = None) -> None:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO comics (comic_id, title, published, img_url, metadata, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (comic_id, metadata.get('title', ''), self._get_published_date(metadata),
+                 metadata.get('img'), json.dumps(metadata, separators=(',', ':')), fetched_at))
+
+    def get(self, comic_id: int) -> dict:
+        with self._lock:
+            row = self._connection.execute('SELECT metadata FROM comics WHERE comic_id = ?',
+                                           (comic_id,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+    def get_img_url(self, comic_id: int) -> str:
+        with self._lock:
+            row = self._connection.execute('SELECT img_url FROM comics WHERE comic_id = ?',
+                                           (comic_id,)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def get_comic_ids(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                'SELECT comic_id FROM comics ORDER BY comic_id')]
+
+    def find_by_title(self, text: str, exact: bool = False):
+        # Case insensitive. An exact title is answered from the index; a partial one scans the title
+        # column only and parses just the documents that match.
+        if exact:
+            return self._iterate_metadata('SELECT metadata FROM comics WHERE title = ? ORDER BY comic_id',
+                                          (text,))
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self._iterate_metadata(
+            "SELECT metadata FROM comics WHERE title LIKE ? ESCAPE '\\' ORDER BY comic_id", (pattern,))
+
+    def find_by_date(self, first_date, last_date=None):
+        # Dates are datetime.date objects or "YYYY-MM-DD" strings; the range includes both ends.
+        last_date = first_date if last_date is None else last_date
+        return self._iterate_metadata(
+            'SELECT metadata FROM comics WHERE published BETWEEN ? AND ? ORDER BY published, comic_id',
+            (str(first_date), str(last_date)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _iterate_metadata(self, query: str, parameters: tuple):
+        # Rows are fetched from the cursor in small batches as the caller iterates, so a broad query
+        # never loads the whole catalog.
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+            rows = cursor.fetchmany(64)
+        while rows:
+            for row in rows:
+                yield json.loads(row[0])
+            with self._lock:
+                rows = cursor.fetchmany(64)
+
+    def _get_published_date(self, metadata: dict) -> str:
+        try:
+            return datetime.date(int(metadata['year']), int(metadata['month']),
+                                 int(metadata['day'])).isoformat()
+        except (KeyError, ValueError):
+            return None
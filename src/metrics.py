@@ -0,0 +1,148 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def get_cumulative_counts(self) -> list:
+        cumulative_counts = []
+        total = 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            cumulative_counts.append(total)
+        return cumulative_counts
+
+    def to_dict(self) -> dict:
+        upper_bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {'count': self.count, 'sum': round(self.sum, 6), 'min': self.min, 'max': self.max,
+                'buckets': dict(zip(upper_bounds, self.get_cumulative_counts()))}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def adjust_gauge(self, name: str, value: float, **labels) -> None:
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._get_key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self._buckets)
+            self._histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    @contextlib.contextmanager
+    def track_in_flight(self, name: str, **labels):
+        self.adjust_gauge(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.adjust_gauge(name, -1, **labels)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._get_key(name, labels), 0)
+
+    def get_gauge(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._gauges.get(self._get_key(name, labels), 0)
+
+    def get_histogram(self, name: str, **labels) -> dict:
+        with self._lock:
+            histogram = self._histograms.get(self._get_key(name, labels))
+            return histogram.to_dict() if histogram is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': {self._format_key(key): value for key, value in sorted(self._counters.items())},
+                'gauges': {self._format_key(key): value for key, value in sorted(self._gauges.items())},
+                'histograms': {self._format_key(key): histogram.to_dict()
+                               for key, histogram in sorted(self._histograms.items())},
+            }
+
+    def to_prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            for metric_type, metrics in [('counter', self._counters), ('gauge', self._gauges)]:
+                for name in sorted({key[0] for key in metrics}):
+                    lines.append(f'# TYPE {name} {metric_type}')
+                    for key in sorted(key for key in metrics if key[0] == name):
+                        lines.append(f'{self._format_key(key)} {metrics[key]}')
+            for name in sorted({key[0] for key in self._histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for key in sorted(key for key in self._histograms if key[0] == name):
+                    histogram = self._histograms[key]
+                    upper_bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+                    for upper_bound, count in zip(upper_bounds, histogram.get_cumulative_counts()):
+                        bucket_key = (f'{name}_bucket', key[1] + (('le', upper_bound),))
+                        lines.append(f'{self._format_key(bucket_key)} {count}')
+                    lines.append(f'{self._format_key((f"{name}_sum", key[1]))} {histogram.sum}')
+                    lines.append(f'{self._format_key((f"{name}_count", key[1]))} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str) -> None:
+        self._write_atomically(path, json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus_text_file(self, path: str) -> None:
+        self._write_atomically(path, self.to_prometheus_text())
+
+    def _write_atomically(self, path: str, content: str) -> None:
+        # Collectors such as the node exporter textfile reader must never see a half written file.
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as metrics_file:
+            metrics_file.write(content)
+        os.replace(temporary_path, path)
+
+    def _get_key(self, name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def _format_key(self, key: tuple) -> str:
+        name, labels = key
+        if not labels:
+            return name
+        formatted_labels = ','.join(f'{label}="{self._escape(value)}"' for label, value in labels)
+        return f'{name}{{{formatted_labels}}}'
+
+    def _escape(self, value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
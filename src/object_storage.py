@@ -0,0 +1,250 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import mimetypes
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SIGNING_ALGORITHM = 'AWS4-HMAC-SHA256'
+
+
+class ObjectStoreError(OSError):
+    pass
+
+
+def quote_uri(text: str, safe: str = '/') -> str:
+    return quote(text, safe=f'{safe}-_.~')
+
+
+def get_canonical_query(query: dict) -> str:
+    return '&'.join(f'{quote_uri(name, "")}={quote_uri(value, "")}' for name, value in sorted(query.items()))
+
+
+def sign_request(method: str, path: str, canonical_query: str, headers: dict, access_key: str,
+                 secret_key: str, region: str) -> str:
+    # AWS Signature Version 4 for the S3 service; headers must include host, x-amz-date and
+    # x-amz-content-sha256, and every one of them is signed.
+    amz_date = headers['x-amz-date']
+    sorted_headers = sorted((name.lower(), ' '.join(str(value).split())) for name, value in headers.items())
+    signed_headers = ';'.join(name for name, _ in sorted_headers)
+    canonical_request = '\n'.join([
+        method, path, canonical_query, ''.join(f'{name}:{value}\n' for name, value in sorted_headers),
+        signed_headers, headers['x-amz-content-sha256']])
+    scope = f'{amz_date[:8]}/{region}/s3/aws4_request'
+    string_to_sign = '\n'.join([SIGNING_ALGORITHM, amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+    signing_key = f'AWS4{secret_key}'.encode()
+    for scope_part in scope.split('/'):
+        signing_key = hmac.new(signing_key, scope_part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return (f'{SIGNING_ALGORITHM} Credential={access_key}/{scope},SignedHeaders={signed_headers},'
+            f'Signature={signature}')
+
+
+def find_xml_text(document: bytes, tag: str) -> list:
+    # S3 answers in the 2006-03-01 namespace, compatible servers sometimes without it.
+    return [element.text or '' for element in ElementTree.fromstring(document).iter()
+            if element.tag.rsplit('}', 1)[-1] == tag]
+
+
+class ObjectStorage:
+    # Keeps the images as md5-keyed objects in a bucket of an S3 compatible object store, addressed
+    # by path (https://host/bucket/prefix), so it also works with MinIO, Ceph and other stand-ins.
+    # The run state (manifest, journal, catalog, spooled downloads) stays in the local directory.
+    MIN_PART_SIZE = 5 * 1024 * 1024
+    LIST_PAGE_SIZE = 1000
+    RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(self, directory: str, url: str = None, region: str = 'us-east-1', access_key: str = None,
+                 secret_key: str = None, session_token: str = None, part_size: int = 8 * 1024 * 1024,
+                 upload_workers: int = 4, pool_size: int = 16, timeout: float = 30) -> None:
+        if not url:
+            raise ValueError('The object storage needs the URL of a bucket, e.g. https://host/bucket')
+        split_url = urlsplit(url)
+        bucket, _, prefix = split_url.path.strip('/').partition('/')
+        if not bucket:
+            raise ValueError(f'The object store URL does not name a bucket: {url}')
+        self.directory = directory
+        self.bucket = bucket
+        self.prefix = f'{prefix.strip("/")}/' if prefix.strip('/') else ''
+        self._endpoint = f'{split_url.scheme}://{split_url.netloc}'
+        default_port = {'http': 80, 'https': 443}.get(split_url.scheme)
+        self._host = split_url.hostname if split_url.port in (None, default_port) else split_url.netloc
+        # Credentials come from the usual AWS variables when they are not given.
+        self._access_key = access_key or os.environ.get('AWS_ACCESS_KEY_ID')
+        self._secret_key = secret_key or os.environ.get('AWS_SECRET_ACCESS_KEY')
+        self._session_token = session_token or os.environ.get('AWS_SESSION_TOKEN')
+        if not self._access_key or not self._secret_key:
+            raise ValueError('The object storage needs credentials, set AWS_ACCESS_KEY_ID and '
+                             'AWS_SECRET_ACCESS_KEY')
+        self._region = region
+        self._part_size = max(part_size, self.MIN_PART_SIZE)
+        self._timeout = timeout
+        # One adapter holds the keep-alive pool shared by the per-thread sessions; the idempotent
+        # requests are retried on connection errors and 5xx answers.
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=Retry(
+            total=3, backoff_factor=0.3, status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE']), raise_on_status=False))
+        self._thread_local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._upload_executor = ThreadPoolExecutor(max_workers=upload_workers,
+                                                   thread_name_prefix='xkcd-upload')
+        self._sizes = None
+
+    def contains(self, name: str) -> bool:
+        # Answered from one listing of the bucket, fetched a page of LIST_PAGE_SIZE keys at a time on
+        # first use and kept up to date by this instance, instead of one request per image.
+        with self._lock:
+            if self._sizes is not None:
+                return name in self._sizes
+        return name in self._list_sizes()
+
+    def store(self, name: str, temporary_file_path: str) -> None:
+        size = os.path.getsize(temporary_file_path)
+        headers = {'Content-Type': mimetypes.guess_type(name)[0] or 'application/octet-stream'}
+        if size <= self._part_size:
+            with open(temporary_file_path, 'rb') as temporary_file:
+                data = temporary_file.read()
+            headers['Content-MD5'] = base64.b64encode(hashlib.md5(data).digest()).decode()
+            self._request('PUT', name, data=data, headers=headers)
+        else:
+            self._upload_multipart(name, temporary_file_path, size, headers)
+        with self._lock:
+            if self._sizes is not None:
+                self._sizes[name] = size
+        os.remove(temporary_file_path)
+
+    def read(self, name: str) -> bytes:
+        response = self._request('GET', name, allowed_status_codes=(404,))
+        if response.status_code == 404:
+            raise KeyError(name)
+        return response.content
+
+    def get_size(self, name: str) -> int:
+        with self._lock:
+            if self._sizes is not None and name in self._sizes:
+                return self._sizes[name]
+        response = self._request('HEAD', name, allowed_status_codes=(404,))
+        if response.status_code == 404:
+            raise FileNotFoundError(name)
+        return int(response.headers['Content-Length'])
+
+    def list_names(self) -> set:
+        return set(self._list_sizes())
+
+    def discard(self, name: str) -> None:
+        self._request('DELETE', name)
+        with self._lock:
+            if self._sizes is not None:
+                self._sizes.pop(name, None)
+
+    def close(self) -> None:
+        self._upload_executor.shutdown()
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+            self._thread_local = threading.local()
+        self._adapter.close()
+
+    def _upload_multipart(self, name: str, temporary_file_path: str, size: int, headers: dict) -> None:
+        # The parts are read and uploaded concurrently on the upload workers, so memory per part
+        # stays bounded by the part size; a failed upload is aborted to free its parts.
+        response = self._request('POST', name, query={'uploads': ''}, headers=headers)
+        upload_id = find_xml_text(response.content, 'UploadId')[0]
+        futures = [
+            self._upload_executor.submit(self._upload_part, name, upload_id, part_number, temporary_file_path,
+                                         offset, min(self._part_size, size - offset))
+            for part_number, offset in enumerate(range(0, size, self._part_size), start=1)]
+        try:
+            etags = [future.result() for future in futures]
+            parts = ''.join(f'<Part><PartNumber>{part_number}</PartNumber><ETag>{etag}</ETag></Part>'
+                            for part_number, etag in enumerate(etags, start=1))
+            completion = f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'
+            response = self._request('POST', name, query={'uploadId': upload_id}, data=completion.encode())
+            # The completion can fail after the 200 status line has been sent.
+            if find_xml_text(response.content, 'Error'):
+                raise ObjectStoreError(f'Multipart upload of {name} failed: '
+                                       f'{find_xml_text(response.content, "Code")}')
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            # Parts still in flight would outlive an abort sent before they finish.
+            wait(futures)
+            try:
+                self._request('DELETE', name, query={'uploadId': upload_id}, allowed_status_codes=(404,))
+            except Exception:
+                # The upload error is the one to report; an upload that could not be aborted is left
+                # to the lifecycle rules of the bucket.
+                pass
+            raise
+
+    def _upload_part(self, name: str, upload_id: str, part_number: int, temporary_file_path: str,
+                     offset: int, length: int) -> str:
+        with open(temporary_file_path, 'rb') as temporary_file:
+            data = os.pread(temporary_file.fileno(), length, offset)
+        response = self._request(
+            'PUT', name, query={'partNumber': str(part_number), 'uploadId': upload_id}, data=data,
+            headers={'Content-MD5': base64.b64encode(hashlib.md5(data).digest()).decode()})
+        return response.headers['ETag']
+
+    def _list_sizes(self) -> dict:
+        sizes = {}
+        query = {'list-type': '2', 'prefix': self.prefix, 'max-keys': str(self.LIST_PAGE_SIZE)}
+        while True:
+            document = self._request('GET', query=query).content
+            for key, size in zip(find_xml_text(document, 'Key'), find_xml_text(document, 'Size')):
+                name = key[len(self.prefix):]
+                # Keys under a deeper prefix belong to something else sharing the bucket.
+                if '/' not in name:
+                    sizes[name] = int(size)
+            next_token = find_xml_text(document, 'NextContinuationToken')
+            if find_xml_text(document, 'IsTruncated') != ['true'] or not next_token:
+                break
+            query['continuation-token'] = next_token[0]
+        with self._lock:
+            self._sizes = dict(sizes)
+        return sizes
+
+    def _request(self, method: str, name: str = None, query: dict = None, data: bytes = b'',
+                 headers: dict = None, allowed_status_codes: tuple = ()) -> requests.models.Response:
+        path = f'/{quote_uri(self.bucket)}'
+        if name is not None:
+            path = f'{path}/{quote_uri(self.prefix + name)}'
+        canonical_query = get_canonical_query(query or {})
+        headers = dict(headers or {})
+        amz_date = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        headers.update({'host': self._host, 'x-amz-content-sha256': hashlib.sha256(data).hexdigest(),
+                        'x-amz-date': amz_date})
+        if self._session_token:
+            headers['x-amz-security-token'] = self._session_token
+        headers['Authorization'] = sign_request(method, path, canonical_query, headers, self._access_key,
+                                                self._secret_key, self._region)
+        url = f'{self._endpoint}{path}?{canonical_query}' if canonical_query else f'{self._endpoint}{path}'
+        response = self._get_session().request(method, url, data=data, headers=headers, timeout=self._timeout)
+        if response.status_code >= 300 and response.status_code not in allowed_status_codes:
+            codes = find_xml_text(response.content, 'Code') if response.content.startswith(b'<') else []
+            raise ObjectStoreError(f'{method} {path} failed with HTTP {response.status_code}'
+                                   + (f' {codes[0]}' if codes else ''))
+        return response
+
+    def _get_session(self) -> requests.Session:
+        # requests.Session is not thread safe, so each thread gets its own session on the shared
+        # adapter.
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount(self._endpoint, self._adapter)
+            with self._lock:
+                self._sessions.append(session)
+            self._thread_local.session = session
+        return session
@@ -0,0 +1,142 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from src.config import PipelineDownloaderConfig
+from src.log import logger
+from src.xkcd_downloader import XkcdDownloader
+
+_END_OF_STREAM = object()
+
+
+class PipelineStage:
+    def __init__(self, name: str, handler: Callable, worker_count: int, queue_size: int) -> None:
+        if worker_count < 1:
+            raise ValueError(f'Pipeline stage {name} needs at least 1 worker, got {worker_count}')
+        self.name = name
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self._handler = handler
+        self._worker_count = worker_count
+        self._next_stage = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running_workers = 0
+        self._processed = 0
+        self._busy_seconds = 0.0
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self, next_stage: 'PipelineStage' = None) -> None:
+        self._next_stage = next_stage
+        self._started_at = time.monotonic()
+        self._running_workers = self._worker_count
+        for worker_number in range(self._worker_count):
+            thread = threading.Thread(target=self._work, name=f'{self.name}-{worker_number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, *item) -> None:
+        # Blocks while the queue is full, which is what propagates backpressure upstream.
+        self.input_queue.put(item)
+
+    def close(self) -> None:
+        for _ in range(self._worker_count):
+            self.input_queue.put(_END_OF_STREAM)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            end = self._finished_at or time.monotonic()
+            elapsed = end - self._started_at if self._started_at is not None else 0.0
+            return {'stage': self.name, 'workers': self._worker_count,
+                    'queue_depth': self.input_queue.qsize(), 'processed': self._processed,
+                    'busy_seconds': round(self._busy_seconds, 3),
+                    'throughput': round(self._processed / elapsed, 3) if elapsed else 0.0}
+
+    def _work(self) -> None:
+        while True:
+            item = self.input_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            started_at = time.perf_counter()
+            try:
+                result = self._handler(*item)
+            except Exception as error:
+                logger.error('%s in pipeline stage %s for item: %s', type(error).__name__, self.name, item,
+                             extra={'phase': self.name})
+                result = None
+            with self._lock:
+                self._processed += 1
+                self._busy_seconds += time.perf_counter() - started_at
+            if result is not None and self._next_stage is not None:
+                self._next_stage.put(*result)
+        with self._lock:
+            self._running_workers -= 1
+            last_worker = self._running_workers == 0
+            if last_worker:
+                self._finished_at = time.monotonic()
+        if last_worker and self._next_stage is not None:
+            self._next_stage.close()
+
+
+class PipelineXkcdDownloader(XkcdDownloader, PipelineDownloaderConfig):
+    def __init__(self, **settings) -> None:
+        super().__init__(**settings)
+        self.POOL_MAXSIZE = max(self.POOL_MAXSIZE, self.METADATA_WORKERS, self.FETCH_WORKERS)
+        self._stages = []
+
+    def get_stage_stats(self) -> list:
+        return [stage.get_stats() for stage in self._stages]
+
+    def _download_comics(self, comic_ids: list) -> None:
+        # Image hashing happens while the body is streamed, so it is part of the fetch stage.
+        self._stages = [
+            PipelineStage('metadata', self._resolve_image_comic_url, self.METADATA_WORKERS, self.QUEUE_SIZE),
+            PipelineStage('fetch', self._fetch_image_file_for_comic_stage, self.FETCH_WORKERS,
+                          self.QUEUE_SIZE),
+            PipelineStage('persist', self._persist_image_file_for_comic, self.PERSIST_WORKERS,
+                          self.QUEUE_SIZE),
+        ]
+        for stage, next_stage in zip(self._stages, self._stages[1:] + [None]):
+            stage.start(next_stage)
+        finished = threading.Event()
+        monitor = threading.Thread(target=self._log_stage_stats_periodically, args=(finished,), daemon=True)
+        monitor.start()
+        try:
+            for comic_id in comic_ids:
+                if self._stop_requested.is_set():
+                    break
+                self._stages[0].put(comic_id)
+            self._stages[0].close()
+            for stage in self._stages:
+                stage.join()
+        finally:
+            finished.set()
+            monitor.join()
+        self._log_stage_stats()
+
+    def _resolve_image_comic_url(self, comic_id: int) -> tuple:
+        # Comics still queued when a stop is requested are dropped; the ones past this stage finish.
+        if self._stop_requested.is_set():
+            return None
+        comic_img_url = self._get_image_comic_url(comic_id)
+        if comic_img_url:
+            return comic_id, comic_img_url
+
+    def _fetch_image_file_for_comic_stage(self, comic_id: int, comic_img_url: str) -> tuple:
+        spooled_image = self._fetch_image_file_for_comic(comic_id, comic_img_url)
+        if spooled_image is not None:
+            return comic_id, comic_img_url, spooled_image
+
+    def _log_stage_stats_periodically(self, finished: threading.Event) -> None:
+        while not finished.wait(self.STATS_INTERVAL):
+            self._log_stage_stats()
+
+    def _log_stage_stats(self) -> None:
+        for stats in self.get_stage_stats():
+            logger.info('Pipeline stage %s: queue depth %s, %s processed, %s items/s', stats['stage'],
+                        stats['queue_depth'], stats['processed'], stats['throughput'])
@@ -0,0 +1,119 @@
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+class ProgressJournal:
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+    def __init__(self, path: str, sync_every: int = 64, sync_interval: float = 1.0) -> None:
+        self._path = path
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._unsynced_entries = 0
+        self._synced_at = time.monotonic()
+        # Several processes can share a journal: appends hold a shared lock on the lock file and
+        # replay and compaction an exclusive one.
+        self._lock_file = open(f'{path}.lock', 'ab')
+        with self._file_lock(fcntl.LOCK_EX):
+            self._states, line_count = self._replay()
+            # Every run appends one line per comic, so the journal is rewritten with only the last
+            # state of each comic once most of its lines are superseded.
+            if line_count > 2 * len(self._states):
+                self._compact()
+            self._file = open(path, 'ab')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._states)
+
+    def get(self, comic_id: int) -> dict:
+        with self._lock:
+            return self._states.get(comic_id)
+
+    def get_states(self) -> dict:
+        with self._lock:
+            return dict(self._states)
+
+    def record(self, comic_id: int, state: str, **details) -> None:
+        entry = dict(details, comic_id=comic_id, state=state)
+        line = json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._reopen_if_compacted()
+            self._file.write(line)
+            self._file.flush()
+            self._states[comic_id] = entry
+            self._unsynced_entries += 1
+            if (self._unsynced_entries >= self._sync_every
+                    or time.monotonic() - self._synced_at >= self._sync_interval):
+                self._sync()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+                self._lock_file.close()
+
+    @contextlib.contextmanager
+    def _file_lock(self, operation: int):
+        fcntl.flock(self._lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_compacted(self) -> None:
+        # A compaction by another process replaces the file, appends must go to the new one.
+        if os.fstat(self._file.fileno()).st_ino != os.stat(self._path).st_ino:
+            self._sync()
+            self._file.close()
+            self._file = open(self._path, 'ab')
+
+    def _sync(self) -> None:
+        if self._unsynced_entries:
+            os.fsync(self._file.fileno())
+            self._unsynced_entries = 0
+        self._synced_at = time.monotonic()
+
+    def _replay(self) -> tuple:
+        states = {}
+        line_count = 0
+        valid_size = 0
+        try:
+            with open(self._path, 'rb') as journal_file:
+                for line in journal_file:
+                    # A crash can leave the last line half written; it and anything after it is dropped.
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    states[entry['comic_id']] = entry
+                    line_count += 1
+                    valid_size += len(line)
+        except FileNotFoundError:
+            return states, line_count
+        if os.path.getsize(self._path) != valid_size:
+            os.truncate(self._path, valid_size)
+        return states, line_count
+
+    def _compact(self) -> None:
+        temporary_path = f'{self._path}.compact'
+        with open(temporary_path, 'wb') as compacted_file:
+            for entry in self._states.values():
+                compacted_file.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+            compacted_file.flush()
+            os.fsync(compacted_file.fileno())
+        os.replace(temporary_path, self._path)
@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value: str) -> float:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if now >= self._blocked_until and (not self.rate or self._tokens >= 1):
+                    if self.rate:
+                        self._tokens -= 1
+                    return
+                wait = self._blocked_until - now
+                if self.rate:
+                    wait = max(wait, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class AimdLimiter:
+    def __init__(self, initial_limit: int, min_limit: int = 1, max_limit: int = 64, increase: float = 1.0,
+                 decrease_factor: float = 0.5, latency_threshold: float = 2.0,
+                 decrease_cooldown: float = 1.0) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_threshold = latency_threshold
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._last_decrease_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def __enter__(self) -> 'AimdLimiter':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def record_success(self, latency: float) -> None:
+        # Additive increase: the limit grows by `increase` once per window of `limit` healthy responses.
+        with self._condition:
+            if latency <= self.latency_threshold and self._limit < self.max_limit:
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+                self._condition.notify_all()
+
+    def record_throttle(self) -> None:
+        # Multiplicative decrease, at most once per cooldown so a burst of 429s from requests
+        # that were already in flight does not collapse the limit to the minimum.
+        with self._condition:
+            now = time.monotonic()
+            if self._last_decrease_at is None or now - self._last_decrease_at >= self.decrease_cooldown:
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                self._last_decrease_at = now
+
+
+class HostRateController:
+    def __init__(self, rate: float, burst: float, aimd_limiter: AimdLimiter) -> None:
+        self.token_bucket = TokenBucket(rate, burst)
+        self.aimd_limiter = aimd_limiter
+
+    def __enter__(self) -> 'HostRateController':
+        self.aimd_limiter.acquire()
+        try:
+            self.token_bucket.acquire()
+        except BaseException:
+            self.aimd_limiter.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.aimd_limiter.release()
+
+    def record_success(self, latency: float) -> None:
+        self.aimd_limiter.record_success(latency)
+
+    def record_failure(self) -> None:
+        self.aimd_limiter.record_throttle()
+
+    def record_throttle(self, delay: float) -> None:
+        self.aimd_limiter.record_throttle()
+        self.token_bucket.block_for(delay)
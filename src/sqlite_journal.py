@@ -0,0 +1,12 @@
+import sqlite3
+
+
+def set_journal_mode(connection: sqlite3.Connection, journal_mode: str = None) -> None:
+    # WAL with synchronous=NORMAL avoids an fsync on every commit while staying crash safe, but it keeps its
+    # index in memory shared by the processes of one machine, so several machines writing the same database
+    # on a shared volume can corrupt it. The rollback journal is safe there and needs synchronous=FULL to
+    # stay crash safe. Without a mode, a database opened only to be read keeps the one it was created with.
+    if journal_mode is None:
+        return
+    connection.execute(f'PRAGMA journal_mode={journal_mode}')
+    connection.execute(f"PRAGMA synchronous={'NORMAL' if journal_mode.upper() == 'WAL' else 'FULL'}")
@@ -0,0 +1,33 @@
+from src.comic_manifest import ComicManifest
+from src.config import DownloaderConfig
+from src.metadata_catalog import MetadataCatalog
+from src.progress_journal import ProgressJournal
+from src.storage import STORAGE_BACKENDS
+
+
+def get_store_stats(directory: str, storage: str = DownloaderConfig.STORAGE,
+                    storage_options: dict = None) -> dict:
+    # Read from the local state only, without a request to the xkcd API.
+    manifest = ComicManifest(f'{directory}/{DownloaderConfig.MANIFEST_FILE_NAME}', journal_mode=None)
+    journal = ProgressJournal(f'{directory}/{DownloaderConfig.JOURNAL_FILE_NAME}')
+    catalog = MetadataCatalog(f'{directory}/{DownloaderConfig.CATALOG_FILE_NAME}', journal_mode=None)
+    stored_files = STORAGE_BACKENDS[storage](directory, **(storage_options or {}))
+    try:
+        journal_states = [entry['state'] for entry in journal.get_states().values()]
+        stored_sizes = manifest.get_file_sizes()
+        stored_names = stored_files.list_names()
+        return {
+            'comics stored': sum(1 for file_name in manifest.get_file_names().values()
+                                 if file_name in stored_names),
+            'comics skipped': journal_states.count(ProgressJournal.SKIPPED),
+            'comics failed': len(manifest.get_failed_comic_ids()),
+            'high water mark': manifest.get_high_water_mark(),
+            'catalogued comics': len(catalog),
+            'image files': sum(1 for file_name in stored_sizes if file_name in stored_names),
+            'image bytes': sum(size for file_name, size in stored_sizes.items() if file_name in stored_names),
+        }
+    finally:
+        stored_files.close()
+        catalog.close()
+        journal.close()
+        manifest.close()
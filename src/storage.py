@@ -0,0 +1,252 @@
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+
+from src.sqlite_journal import set_journal_mode
+
+
+class DirectoryStorage:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def contains(self, name: str) -> bool:
+        return os.path.isfile(f'{self.directory}/{name}')
+
+    def store(self, name: str, temporary_file_path: str) -> None:
+        # The bytes are made durable before the rename publishes them, otherwise a crash could leave an
+        # empty or truncated file under a valid md5 name that the journal already counts as done.
+        with open(temporary_file_path, 'rb') as temporary_file:
+            os.fsync(temporary_file.fileno())
+        os.replace(temporary_file_path, f'{self.directory}/{name}')
+
+    def read(self, name: str) -> bytes:
+        try:
+            with open(f'{self.directory}/{name}', 'rb') as stored_file:
+                return stored_file.read()
+        except FileNotFoundError:
+            raise KeyError(name) from None
+
+    def get_size(self, name: str) -> int:
+        return os.path.getsize(f'{self.directory}/{name}')
+
+    def list_names(self) -> set:
+        return set(os.listdir(self.directory))
+
+    def close(self) -> None:
+        pass
+
+
+class PackStorage:
+    PACK_FILE_NAME = 'comics.pack'
+    INDEX_FILE_NAME = 'comics.pack.index'
+    # Every record is a header, the file name and the file bytes, so the index can be rebuilt
+    # from the pack alone.
+    RECORD_MAGIC = b'XKPK'
+    RECORD_HEADER = struct.Struct('>4sHQ')
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, directory: str, sync_every: int = 64, sync_interval: float = 1.0,
+                 journal_mode: str = 'WAL') -> None:
+        self.directory = directory
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._synced_at = time.monotonic()
+        self._mmap = None
+        self.pack_path = f'{directory}/{self.PACK_FILE_NAME}'
+        self._pack_file = open(self.pack_path, 'ab+', buffering=0)
+        self._connection = sqlite3.connect(f'{directory}/{self.INDEX_FILE_NAME}', timeout=30,
+                                           check_same_thread=False)
+        set_journal_mode(self._connection, journal_mode)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS packed_files ('
+                'name TEXT PRIMARY KEY, offset INTEGER NOT NULL, length INTEGER NOT NULL)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS discarded_records ('
+                'offset INTEGER PRIMARY KEY, length INTEGER NOT NULL)')
+        with self._lock, self._pack_lock():
+            self._recover_unindexed_records()
+
+    def contains(self, name: str) -> bool:
+        return self._locate(name) is not None
+
+    def store(self, name: str, temporary_file_path: str) -> None:
+        # Records are appended under an exclusive flock so several processes can share a pack; the
+        # index rows are only committed after the fsync that makes their bytes durable.
+        encoded_name = name.encode()
+        with self._lock:
+            if self._locate_unlocked(name) is None:
+                with open(temporary_file_path, 'rb') as temporary_file, self._pack_lock():
+                    length = os.fstat(temporary_file.fileno()).st_size
+                    record_offset = os.lseek(self._pack_file.fileno(), 0, os.SEEK_END)
+                    try:
+                        self._write_all(self.RECORD_HEADER.pack(self.RECORD_MAGIC, len(encoded_name), length)
+                                        + encoded_name)
+                        for chunk in iter(lambda: temporary_file.read(self.COPY_BUFFER_SIZE), b''):
+                            self._write_all(chunk)
+                    except BaseException:
+                        # A torn record would hide every record appended after it from recovery.
+                        os.truncate(self._pack_file.fileno(), record_offset)
+                        raise
+                self._pending[name] = (record_offset + self.RECORD_HEADER.size + len(encoded_name), length)
+                if (len(self._pending) >= self._sync_every
+                        or time.monotonic() - self._synced_at >= self._sync_interval):
+                    self._sync()
+        os.remove(temporary_file_path)
+
+    def read(self, name: str) -> bytes:
+        with self._lock:
+            location = self._locate_unlocked(name)
+            if location is None:
+                raise KeyError(name)
+            offset, length = location
+            if self._mmap is None or len(self._mmap) < offset + length:
+                self._remap()
+            return self._mmap[offset:offset + length]
+
+    def get_size(self, name: str) -> int:
+        location = self._locate(name)
+        if location is None:
+            raise FileNotFoundError(name)
+        return location[1]
+
+    def list_names(self) -> set:
+        with self._lock:
+            names = {row[0] for row in self._connection.execute('SELECT name FROM packed_files')}
+            return names | set(self._pending)
+
+    def get_records(self) -> dict:
+        with self._lock:
+            records = dict((row[0], (row[1], row[2])) for row in self._connection.execute(
+                'SELECT name, offset, length FROM packed_files'))
+            records.update(self._pending)
+            return records
+
+    def discard(self, name: str) -> None:
+        # Only the index row goes away; the bytes stay in the pack, and the name can be stored again
+        # as a new record. A tombstone keeps recovery from indexing the record again when it was the
+        # last one in the pack.
+        with self._lock:
+            location = self._locate_unlocked(name)
+            if location is None:
+                return
+            self._pending.pop(name, None)
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO discarded_records (offset, length) VALUES (?, ?)', location)
+                self._connection.execute('DELETE FROM packed_files WHERE name = ?', (name,))
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def export(self, output_directory: str) -> int:
+        os.makedirs(output_directory, exist_ok=True)
+        exported = 0
+        for name in sorted(self.list_names()):
+            if os.path.isfile(f'{output_directory}/{name}'):
+                continue
+            with tempfile.NamedTemporaryFile(dir=output_directory, prefix='.tmp-',
+                                             delete=False) as output_file:
+                output_file.write(self.read(name))
+            os.replace(output_file.name, f'{output_directory}/{name}')
+            exported += 1
+        return exported
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._pack_file.closed:
+                self._sync()
+                if self._mmap is not None:
+                    self._mmap.close()
+                    self._mmap = None
+                self._pack_file.close()
+                self._connection.close()
+
+    def _locate(self, name: str) -> tuple:
+        with self._lock:
+            return self._locate_unlocked(name)
+
+    def _locate_unlocked(self, name: str) -> tuple:
+        if name in self._pending:
+            return self._pending[name]
+        return self._connection.execute('SELECT offset, length FROM packed_files WHERE name = ?',
+                                        (name,)).fetchone()
+
+    def _sync(self) -> None:
+        if self._pending:
+            os.fsync(self._pack_file.fileno())
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO packed_files (name, offset, length) VALUES (?, ?, ?)',
+                    ((name, offset, length) for name, (offset, length) in self._pending.items()))
+            self._pending.clear()
+        self._synced_at = time.monotonic()
+
+    def _write_all(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[self._pack_file.write(view):]
+
+    def _remap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mmap.mmap(self._pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @contextlib.contextmanager
+    def _pack_lock(self):
+        fcntl.flock(self._pack_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._pack_file.fileno(), fcntl.LOCK_UN)
+
+    def _recover_unindexed_records(self) -> None:
+        # Records appended after the last indexed one were written by a process that died before
+        # its index rows were committed. Complete records whose md5 matches their name are indexed
+        # again and a torn record at the end is cut off. Discarded records count as indexed.
+        indexed_end = self._connection.execute(
+            'SELECT MAX(record_end) FROM (SELECT offset + length AS record_end FROM packed_files '
+            'UNION ALL SELECT offset + length FROM discarded_records)').fetchone()[0] or 0
+        pack_size = os.fstat(self._pack_file.fileno()).st_size
+        recovered = []
+        offset = indexed_end
+        with open(self._pack_file.name, 'rb') as pack_file:
+            pack_file.seek(offset)
+            while offset < pack_size:
+                header = pack_file.read(self.RECORD_HEADER.size)
+                if len(header) < self.RECORD_HEADER.size:
+                    break
+                magic, name_length, length = self.RECORD_HEADER.unpack(header)
+                name = pack_file.read(name_length).decode(errors='replace')
+                data = pack_file.read(length)
+                if magic != self.RECORD_MAGIC or len(data) < length or (
+                        hashlib.md5(data).hexdigest() != name.split('.')[0]):
+                    break
+                data_offset = offset + self.RECORD_HEADER.size + name_length
+                recovered.append((name, data_offset, length))
+                offset = data_offset + length
+        if offset < pack_size:
+            os.truncate(self._pack_file.name, offset)
+        if recovered:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO packed_files (name, offset, length) VALUES (?, ?, ?)', recovered)
+
+
+def create_object_storage(directory: str, **options):
+    # Imported on use, the object store client loads the HTTP stack.
+    from src.object_storage import ObjectStorage
+    return ObjectStorage(directory, **options)
+
+
+STORAGE_BACKENDS = {'directory': DirectoryStorage, 'pack': PackStorage, 'object': create_object_storage}
@@ -0,0 +1,111 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+_current_comic_id = contextvars.ContextVar('current_comic_id', default=None)
+
+
+class TraceRecorder:
+    def __init__(self, max_events: int = 1000000) -> None:
+        self._max_events = max_events
+        self._lock = threading.Lock()
+        self._events = []
+        self._thread_names = {}
+        self._dropped_events = 0
+        self._started_at = time.perf_counter()
+        self._pid = os.getpid()
+
+    @property
+    def dropped_events(self) -> int:
+        return self._dropped_events
+
+    @contextlib.contextmanager
+    def span(self, name: str, comic_id: int = None, **args):
+        # Spans opened inside a span with a comic id belong to the same comic, also in a coroutine or
+        # a thread that only got the comic id through the context. The caller can add arguments to
+        # the yielded dict, e.g. the status code once the response arrives.
+        token = _current_comic_id.set(comic_id) if comic_id is not None else None
+        comic_id = _current_comic_id.get()
+        if comic_id is not None:
+            args['comic_id'] = comic_id
+        started_at = time.perf_counter()
+        try:
+            yield args
+        finally:
+            finished_at = time.perf_counter()
+            if token is not None:
+                _current_comic_id.reset(token)
+            self._add_event(name, started_at, finished_at, args)
+
+    def get_events(self) -> list:
+        with self._lock:
+            return list(self._events)
+
+    def to_chrome_trace(self) -> dict:
+        # Complete ("X") events with microsecond timestamps, plus the thread names so every worker
+        # gets its own labelled row in chrome://tracing or Perfetto.
+        with self._lock:
+            thread_names = [{'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': thread_id,
+                             'args': {'name': thread_name}}
+                            for thread_id, thread_name in self._thread_names.items()]
+            return {'traceEvents': thread_names + self._events, 'displayTimeUnit': 'ms',
+                    'otherData': {'dropped_events': self._dropped_events}}
+
+    def write_chrome_trace(self, path: str) -> None:
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file, separators=(',', ':'))
+        os.replace(temporary_path, path)
+
+    def _add_event(self, name: str, started_at: float, finished_at: float, args: dict) -> None:
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': 'xkcd', 'ph': 'X', 'pid': self._pid, 'tid': thread.ident,
+                 'ts': round((started_at - self._started_at) * 1e6, 3),
+                 'dur': round((finished_at - started_at) * 1e6, 3), 'args': args}
+        with self._lock:
+            if len(self._events) >= self._max_events:
+                self._dropped_events += 1
+                return
+            self._events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+
+@contextlib.contextmanager
+def profile_run(path: str):
+    # cProfile only sees the thread that enabled it, so every thread started during the run gets its
+    # own profiler and all of them are merged into one pstats file. From Python 3.12 cProfile is
+    # built on sys.monitoring and one profiler already covers every thread; enabling a second one
+    # fails and is skipped.
+    profilers = []
+    lock = threading.Lock()
+
+    def start_thread_profiler(*_) -> None:
+        # Called once as the profile function of each new thread, which it replaces by a profiler.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return
+        with lock:
+            profilers.append(profiler)
+
+    main_profiler = cProfile.Profile()
+    main_profiler.enable()
+    threading.setprofile(start_thread_profiler)
+    try:
+        yield
+    finally:
+        threading.setprofile(None)
+        main_profiler.disable()
+        stats = pstats.Stats(main_profiler)
+        with lock:
+            for profiler in profilers:
+                stats.add(profiler)
+        stats.dump_stats(path)
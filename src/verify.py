@@ -0,0 +1,193 @@
+import hashlib
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+from src.comic_manifest import ComicManifest
+from src.config import DownloaderConfig
+from src.log import logger
+from src.progress_journal import ProgressJournal
+from src.storage import STORAGE_BACKENDS, DirectoryStorage, PackStorage
+
+# Stored images are named after the md5 of their content; every other file in the directory
+# (manifest, journal, caches, pack, lease queue, temporary files) is not part of the store.
+IMAGE_FILE_NAME = re.compile(r'^[0-9a-f]{32}\.\w+$')
+
+
+class StoreProblem(NamedTuple):
+    name: str
+    problem: str
+    detail: str
+
+
+class VerificationReport(NamedTuple):
+    checked: int
+    problems: list
+    quarantined: list
+
+
+def hash_file(path: str) -> tuple:
+    # Hashing the mmap neither copies the file into Python objects nor holds the GIL while md5 runs.
+    with open(path, 'rb') as stored_file:
+        size = os.fstat(stored_file.fileno()).st_size
+        if size == 0:
+            return hashlib.md5().hexdigest(), 0
+        with mmap.mmap(stored_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return hashlib.md5(mapped_file).hexdigest(), size
+
+
+def _hash_files(directory: str, names: list) -> list:
+    results = []
+    for name in names:
+        try:
+            md5, size = hash_file(f'{directory}/{name}')
+        except FileNotFoundError:
+            # Removed while the scan was running, there is nothing left to verify.
+            continue
+        except OSError as error:
+            results.append((name, None, 0, f'{type(error).__name__}: {error}'))
+        else:
+            results.append((name, md5, size, None))
+    return results
+
+
+def _hash_pack_records(pack_path: str, records: list) -> list:
+    results = []
+    with open(pack_path, 'rb') as pack_file:
+        pack_size = os.fstat(pack_file.fileno()).st_size
+        if pack_size == 0:
+            return [(name, hashlib.md5().hexdigest(), 0, None) for name, _, _ in records]
+        with mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_pack:
+            for name, offset, length in records:
+                available = max(0, min(length, pack_size - offset))
+                data = memoryview(mapped_pack)[offset:offset + available]
+                try:
+                    results.append((name, hashlib.md5(data).hexdigest(), available, None))
+                finally:
+                    data.release()
+    return results
+
+
+class StoreVerifier:
+    TRUNCATED = 'truncated'
+    CORRUPT = 'corrupt'
+    ORPHANED = 'orphaned'
+    MISSING = 'missing'
+    BATCH_SIZE = 64
+
+    def __init__(self, storage, manifest: ComicManifest, journal: ProgressJournal,
+                 workers: int = None) -> None:
+        self._storage = storage
+        self._manifest = manifest
+        self._journal = journal
+        self._workers = workers or os.cpu_count() or 1
+
+    def verify(self, quarantine_directory: str = None) -> VerificationReport:
+        hashed_files = self._hash_stored_files()
+        # The references are read after hashing, so a comic stored while the scan was running
+        # already has its manifest row and is not taken for an orphan.
+        expected_sizes = self._get_expected_sizes()
+        problems = []
+        for name, md5, size, error in sorted(hashed_files):
+            problem = self._check_stored_file(name, md5, size, error, expected_sizes)
+            if problem is not None:
+                logger.warning('%s is %s: %s', problem.name, problem.problem, problem.detail)
+                problems.append(problem)
+        stored_names = {hashed_file[0] for hashed_file in hashed_files}
+        for name in sorted(set(expected_sizes) - stored_names):
+            # Missing files need no quarantine, the next run downloads their comics again.
+            logger.warning('%s is %s: referenced by the manifest but not stored', name, self.MISSING)
+            problems.append(StoreProblem(name, self.MISSING, 'referenced by the manifest but not stored'))
+        quarantined = []
+        if quarantine_directory is not None:
+            for problem in problems:
+                if problem.problem != self.MISSING:
+                    self._quarantine(problem.name, quarantine_directory)
+                    quarantined.append(problem.name)
+        return VerificationReport(len(hashed_files), problems, quarantined)
+
+    def _hash_stored_files(self) -> list:
+        if not isinstance(self._storage, (DirectoryStorage, PackStorage)):
+            return self._hash_stored_objects()
+        if isinstance(self._storage, PackStorage):
+            # Records are hashed in pack order so every worker reads one contiguous region.
+            records = sorted(((name, offset, length)
+                              for name, (offset, length) in self._storage.get_records().items()),
+                             key=lambda record: record[1])
+            tasks = [(_hash_pack_records, self._storage.pack_path, records[start:start + self.BATCH_SIZE])
+                     for start in range(0, len(records), self.BATCH_SIZE)]
+        else:
+            names = sorted(name for name in self._storage.list_names() if IMAGE_FILE_NAME.match(name))
+            tasks = [(_hash_files, self._storage.directory, names[start:start + self.BATCH_SIZE])
+                     for start in range(0, len(names), self.BATCH_SIZE)]
+        if self._workers == 1 or len(tasks) <= 1:
+            batch_results = [function(location, batch) for function, location, batch in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self._workers, len(tasks))) as executor:
+                futures = [executor.submit(function, location, batch) for function, location, batch in tasks]
+                batch_results = [future.result() for future in futures]
+        return [result for results in batch_results for result in results]
+
+    def _hash_stored_objects(self) -> list:
+        # The images of a remote store are downloaded to be hashed, on threads so the transfers overlap.
+        names = sorted(name for name in self._storage.list_names() if IMAGE_FILE_NAME.match(name))
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='xkcd-verify') as executor:
+            results = list(executor.map(self._hash_stored_object, names))
+        return [result for result in results if result is not None]
+
+    def _hash_stored_object(self, name: str) -> tuple:
+        try:
+            data = self._storage.read(name)
+        except KeyError:
+            # Removed while the scan was running, there is nothing left to verify.
+            return None
+        except OSError as error:
+            return name, None, 0, f'{type(error).__name__}: {error}'
+        return name, hashlib.md5(data).hexdigest(), len(data), None
+
+    def _get_expected_sizes(self) -> dict:
+        # The journal covers the comics whose manifest row was lost, without their size.
+        expected_sizes = {entry['file_name']: None for entry in self._journal.get_states().values()
+                          if entry['state'] == ProgressJournal.DONE}
+        expected_sizes.update(self._manifest.get_file_sizes())
+        return expected_sizes
+
+    def _check_stored_file(self, name: str, md5: str, size: int, error: str,
+                           expected_sizes: dict) -> StoreProblem:
+        expected_size = expected_sizes.get(name)
+        if error is not None:
+            return StoreProblem(name, self.CORRUPT, error)
+        if (expected_size is not None and size < expected_size) or size == 0:
+            return StoreProblem(name, self.TRUNCATED, f'{size} of {expected_size or "unknown"} bytes')
+        if md5 != name.split('.')[0]:
+            return StoreProblem(name, self.CORRUPT, f'content md5 is {md5}')
+        if name not in expected_sizes:
+            return StoreProblem(name, self.ORPHANED, 'not referenced by the manifest or the journal')
+
+    def _quarantine(self, name: str, quarantine_directory: str) -> None:
+        # Once out of the store, the comics of a quarantined file are downloaded again by the next run.
+        os.makedirs(quarantine_directory, exist_ok=True)
+        if isinstance(self._storage, DirectoryStorage):
+            os.replace(f'{self._storage.directory}/{name}', f'{quarantine_directory}/{name}')
+        else:
+            with open(f'{quarantine_directory}/{name}', 'wb') as quarantined_file:
+                quarantined_file.write(self._storage.read(name))
+            self._storage.discard(name)
+
+
+def verify_store(directory: str, storage: str = DownloaderConfig.STORAGE,
+                 workers: int = DownloaderConfig.VERIFY_WORKERS, quarantine: bool = False,
+                 storage_options: dict = None) -> VerificationReport:
+    # Opens the store of a directory on its own, so it can be verified without creating a downloader.
+    stored_files = STORAGE_BACKENDS[storage](directory, **(storage_options or {}))
+    manifest = ComicManifest(f'{directory}/{DownloaderConfig.MANIFEST_FILE_NAME}', journal_mode=None)
+    journal = ProgressJournal(f'{directory}/{DownloaderConfig.JOURNAL_FILE_NAME}')
+    quarantine_directory = f'{directory}/{DownloaderConfig.QUARANTINE_DIRECTORY_NAME}' if quarantine else None
+    try:
+        return StoreVerifier(stored_files, manifest, journal, workers).verify(quarantine_directory)
+    finally:
+        stored_files.close()
+        manifest.close()
+        journal.close()
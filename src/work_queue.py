@@ -0,0 +1,111 @@
+import contextlib
+import sqlite3
+import threading
+import time
+
+
+def parse_shard_spec(spec) -> tuple:
+    # Accepts "k/N" or "k of N" with 1 <= k <= N, or an already parsed (k, N) tuple.
+    if isinstance(spec, str):
+        parts = spec.replace(' of ', '/').split('/')
+        try:
+            index, count = (int(part) for part in parts)
+        except ValueError:
+            raise ValueError(f'Invalid shard spec: {spec!r}, expected "k/N"') from None
+    else:
+        index, count = spec
+    if not 1 <= index <= count:
+        raise ValueError(f'Invalid shard spec: {spec!r}, shard must be between 1 and the shard count')
+    return index, count
+
+
+def is_in_shard(comic_id: int, shard: tuple) -> bool:
+    index, count = shard
+    return (comic_id - 1) % count == index - 1
+
+
+class LeaseQueue:
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+
+    def __init__(self, path: str, lease_seconds: float = 60) -> None:
+        # The default rollback journal is kept instead of WAL, which needs shared memory and so
+        # does not work when the queue lives on a volume shared by several machines.
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.lease_seconds = lease_seconds
+        with self._lock:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'comic_id INTEGER PRIMARY KEY, state TEXT NOT NULL, owner TEXT, '
+                'expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS leases_state ON leases (state, expires_at)')
+
+    def add(self, comic_ids: list) -> None:
+        # Workers only add the comics they found pending in the shared store, so a comic marked done
+        # here by an earlier run (it failed, or its image was quarantined since) is handed out again;
+        # comics leased by another worker keep their lease.
+        comic_ids = list(comic_ids)
+        with self._lock, self._transaction():
+            self._connection.executemany(
+                'UPDATE leases SET state = ? WHERE comic_id = ? AND state = ?',
+                ((self.PENDING, comic_id, self.DONE) for comic_id in comic_ids))
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO leases (comic_id, state) VALUES (?, ?)',
+                ((comic_id, self.PENDING) for comic_id in comic_ids))
+
+    def claim(self, owner: str, batch_size: int) -> list:
+        now = time.time()
+        with self._lock, self._transaction():
+            comic_ids = [row[0] for row in self._connection.execute(
+                'SELECT comic_id FROM leases WHERE state = ? OR (state = ? AND expires_at < ?) '
+                'ORDER BY comic_id LIMIT ?', (self.PENDING, self.LEASED, now, batch_size))]
+            self._connection.executemany(
+                'UPDATE leases SET state = ?, owner = ?, expires_at = ?, attempts = attempts + 1 '
+                'WHERE comic_id = ?',
+                ((self.LEASED, owner, now + self.lease_seconds, comic_id) for comic_id in comic_ids))
+        return comic_ids
+
+    def heartbeat(self, owner: str) -> int:
+        with self._lock, self._transaction():
+            return self._connection.execute(
+                'UPDATE leases SET expires_at = ? WHERE state = ? AND owner = ?',
+                (time.time() + self.lease_seconds, self.LEASED, owner)).rowcount
+
+    def complete(self, owner: str, comic_ids: list) -> None:
+        self._set_state(owner, comic_ids, self.DONE)
+
+    def release(self, owner: str, comic_ids: list) -> None:
+        self._set_state(owner, comic_ids, self.PENDING)
+
+    def get_counts(self) -> dict:
+        with self._lock:
+            counts = dict(self._connection.execute('SELECT state, COUNT(*) FROM leases GROUP BY state'))
+        return {state: counts.get(state, 0) for state in (self.PENDING, self.LEASED, self.DONE)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _set_state(self, owner: str, comic_ids: list, state: str) -> None:
+        # Only leases still held by the owner change, a lease that expired and was claimed by
+        # another worker belongs to that worker now.
+        with self._lock, self._transaction():
+            self._connection.executemany(
+                'UPDATE leases SET state = ?, owner = NULL, expires_at = NULL '
+                'WHERE comic_id = ? AND state = ? AND owner = ?',
+                ((state, comic_id, self.LEASED, owner) for comic_id in comic_ids))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can not both read the same
+        # pending rows before either of them marks them as leased.
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        else:
+            self._connection.execute('COMMIT')
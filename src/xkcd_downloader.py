@@ -1,91 +1,871 @@
+import contextlib
 import hashlib
-import logging
+import itertools
 import os
+import random
+import signal
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from src.comic_manifest import ComicManifest
+from src.config import DownloaderConfig
+from src.download_plan import DownloadPlan, PlannedComic
+from src.http_cache import HttpCache
+from src.log import logger
+from src.metadata_catalog import MetadataCatalog
+from src.metrics import MetricsRegistry
+from src.object_storage import ObjectStorage
+from src.progress_journal import ProgressJournal
+from src.rate_limiter import AimdLimiter, HostRateController, parse_retry_after
+from src.storage import STORAGE_BACKENDS, DirectoryStorage, PackStorage
+from src.tracing import TraceRecorder
+from src.work_queue import LeaseQueue, is_in_shard, parse_shard_spec
 
-class XkcdDownloader:
-    API_URL = ['https://xkcd.com/', '/info.0.json']
-    DIRECTORY = 'comics'
-    TIMEOUT = 10
-    HEADERS = {}
 
+class SpooledImage(NamedTuple):
+    md5: str
+    file_extension: str
+    temporary_file_path: str
+    size: int
+    headers: dict
+
+
+class EnvironmentCachingSession(requests.Session):
+    # requests scans os.environ for proxy and CA bundle settings on every request, which is a
+    # noticeable share of the CPU spent per comic; the result only depends on scheme and host.
     def __init__(self) -> None:
-        logging.basicConfig(
-            format='[%(asctime)s][%(levelname)s] %(message)s', level=logging.INFO)
+        super().__init__()
+        self._environment_settings = {}
+
+    def merge_environment_settings(self, url: str, proxies: dict, stream: bool, verify, cert) -> dict:
+        if not self.trust_env or proxies or verify is not None or cert is not None:
+            return super().merge_environment_settings(url, proxies, stream, verify, cert)
+        split_url = urlsplit(url)
+        key = (split_url.scheme, split_url.hostname)
+        if key not in self._environment_settings:
+            self._environment_settings[key] = super().merge_environment_settings(url, {}, None, None, None)
+        settings = dict(self._environment_settings[key])
+        settings['proxies'] = dict(settings['proxies'])
+        settings['stream'] = self.stream if stream is None else stream
+        return settings
+
+
+class XkcdDownloader(DownloaderConfig):
+    RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError)
+
+    def __init__(self, **settings) -> None:
+        self._apply_settings(settings)
+        self._shard = parse_shard_spec(self.SHARD) if self.SHARD is not None else None
+        if self.STORAGE not in STORAGE_BACKENDS:
+            raise ValueError(f'Unknown storage: {self.STORAGE}, '
+                             f'expected one of: {", ".join(STORAGE_BACKENDS)}')
+        if self.STORAGE == 'object' and not self.OBJECT_STORE_URL:
+            raise ValueError('The object storage needs OBJECT_STORE_URL, e.g. https://host/bucket')
+        self._worker_id = self.WORKER_ID or f'{socket.gethostname()}-{os.getpid()}'
         self._create_directory()
         self._count_of_comic_downloads = 0
+        self._count_lock = threading.Lock()
+        self._adapters = None
+        self._adapters_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._sessions = []
+        self._rate_controllers = {}
+        self._manifest = None
+        self._http_cache = None
+        self._journal = None
+        self._lease_queue = None
+        self._storage = None
+        self._catalog = None
+        self._manifest_lock = threading.Lock()
+        self._stop_requested = threading.Event()
+        self._temporary_file_paths = set()
+        self._metrics = MetricsRegistry()
+        self._tracer = TraceRecorder(self.TRACE_MAX_EVENTS) if self.TRACE else None
+
+    def _apply_settings(self, settings: dict) -> None:
+        for name, value in settings.items():
+            attribute = name.upper()
+            if not attribute.isupper() or not hasattr(type(self), attribute):
+                raise TypeError(f'Unknown setting for {type(self).__name__}: {name}')
+            setattr(self, attribute, value)
+
+    def __enter__(self) -> 'XkcdDownloader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._adapters_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+            for adapter in (self._adapters or {}).values():
+                adapter.close()
+            self._adapters = None
+            self._thread_local = threading.local()
+        with self._manifest_lock:
+            if self._manifest is not None:
+                self._manifest.close()
+                self._manifest = None
+            if self._http_cache is not None:
+                self._http_cache.close()
+                self._http_cache = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._lease_queue is not None:
+                self._lease_queue.close()
+                self._lease_queue = None
+            if self._storage is not None:
+                self._storage.close()
+                self._storage = None
+            if self._catalog is not None:
+                self._catalog.close()
+                self._catalog = None
+        # Transfers cut short by a second interrupt leave their temporary files behind.
+        for temporary_file_path in list(self._temporary_file_paths):
+            self._remove_temporary_file(temporary_file_path)
 
     @property
     def get_count_of_comic_downloads(self) -> int:
         return self._count_of_comic_downloads
 
+    @property
+    def metrics(self) -> MetricsRegistry:
+        return self._metrics
+
+    @property
+    def tracer(self) -> TraceRecorder:
+        return self._tracer
+
     def make_download(self) -> None:
+        with self._stop_on_interrupt():
+            last_comic_index = self._get_last_index_from_api()
+            if last_comic_index:
+                self._download_comic_range(self._get_first_comic_index(), last_comic_index)
+                self._log_if_stopped()
+
+    def plan_download(self) -> DownloadPlan:
+        # Works out what make_download would fetch without downloading any image: the comics already
+        # in the catalog get a HEAD request for the size and type of their image, the others are
+        # estimated from the average size. A sample of up to PLAN_SAMPLE_SIZE uncatalogued comics,
+        # spread over the range, has its metadata fetched first so a new store has sizes to average.
         last_comic_index = self._get_last_index_from_api()
-        if last_comic_index:
-            for index in range(1, last_comic_index + 1):
-                self._download_image_file_for_comic(index)
+        if not last_comic_index:
+            return None
+        first_comic_index = self._get_first_comic_index()
+        pending_comic_ids = self._get_pending_comic_ids(last_comic_index, first_comic_index)
+        catalog = self._get_catalog()
+        img_urls = {comic_id: catalog.get_img_url(comic_id) for comic_id in pending_comic_ids}
+        uncatalogued_comic_ids = [comic_id for comic_id in pending_comic_ids if not img_urls[comic_id]]
+        sample_step = max(1, len(uncatalogued_comic_ids) // max(1, self.PLAN_SAMPLE_SIZE))
+        sampled_comic_ids = uncatalogued_comic_ids[::sample_step][:self.PLAN_SAMPLE_SIZE]
+        with ThreadPoolExecutor(max_workers=self.PLAN_WORKERS, thread_name_prefix='xkcd-plan') as executor:
+            sampled_img_urls = executor.map(self._look_up_image_comic_url, sampled_comic_ids)
+            img_urls.update(zip(sampled_comic_ids, sampled_img_urls))
+            known_comic_ids = [comic_id for comic_id in pending_comic_ids if img_urls[comic_id]]
+            image_heads = dict(zip(known_comic_ids, executor.map(
+                self._head_image_file_for_comic, known_comic_ids,
+                [img_urls[comic_id] for comic_id in known_comic_ids])))
+        comics = [PlannedComic(comic_id, img_urls[comic_id], *image_heads.get(comic_id, (None, None)))
+                  for comic_id in pending_comic_ids]
+        logger.info('Plan of %s comics, %s image sizes known', len(comics),
+                    sum(1 for comic in comics if comic.size is not None))
+        return DownloadPlan(self.API_URL[0], first_comic_index, last_comic_index, comics, time.time())
+
+    def get_plan_summary(self, plan: DownloadPlan) -> dict:
+        # The duration is bounded by the rate limit of each host and by PLAN_BANDWIDTH; comics whose
+        # image is known not to be an image are skipped by the run and transfer nothing.
+        image_comics = [comic for comic in plan.comics
+                        if comic.content_type is None or comic.content_type.startswith('image')]
+        known_sizes = [comic.size for comic in image_comics if comic.size is not None]
+        if known_sizes:
+            average_size = sum(known_sizes) / len(known_sizes)
+        else:
+            stored_sizes = [size for size in self._get_manifest().get_file_sizes().values() if size]
+            average_size = sum(stored_sizes) / len(stored_sizes) if stored_sizes else 0
+        estimated_bytes = sum(known_sizes) + round((len(image_comics) - len(known_sizes)) * average_size)
+        metadata_requests = sum(1 for comic in plan.comics if comic.img_url is None)
+        image_url = next((comic.img_url for comic in plan.comics if comic.img_url), plan.api_url)
+        estimated_seconds = max(self._get_request_seconds(plan.api_url, metadata_requests),
+                                self._get_request_seconds(image_url, len(image_comics)),
+                                estimated_bytes / self.PLAN_BANDWIDTH)
+        return {
+            'last comic index': plan.last_comic_index,
+            'comics to download': len(plan.comics),
+            'comics not images': len(plan.comics) - len(image_comics),
+            'image sizes known': len(known_sizes),
+            'metadata requests': metadata_requests,
+            'estimated bytes': estimated_bytes,
+            'estimated seconds': round(estimated_seconds, 1),
+        }
+
+    def execute_plan(self, plan: DownloadPlan) -> None:
+        # Downloads exactly the comics of the plan, leaving out the ones another run finished since.
+        if plan.api_url != self.API_URL[0]:
+            raise ValueError(f'The plan was made for {plan.api_url}, not for {self.API_URL[0]}')
+        with self._stop_on_interrupt():
+            self._remove_stale_temporary_files()
+            known_comic_ids = self._get_known_comic_ids()
+            pending_comic_ids = [comic.comic_id for comic in plan.comics
+                                 if comic.comic_id not in known_comic_ids]
+            logger.info('%s comics of the plan already done, %s comics to download',
+                        len(plan.comics) - len(pending_comic_ids), len(pending_comic_ids))
+            self._download_pending_comics(pending_comic_ids)
+            self._log_if_stopped()
+
+    def watch(self) -> None:
+        # Every poll is a conditional request answered by a 304 while no comic is published, and
+        # failed polls back off exponentially up to WATCH_BACKOFF_MAX.
+        with self._stop_on_interrupt():
+            delay = self.WATCH_INTERVAL
+            while not self._stop_requested.is_set():
+                last_comic_index = self._poll_last_index_from_api()
+                if last_comic_index is None:
+                    delay = min(delay * 2, self.WATCH_BACKOFF_MAX)
+                    logger.warning('Polling the xkcd API failed, next poll in %.0fs', delay)
+                else:
+                    delay = self.WATCH_INTERVAL
+                    high_water_mark = self._get_manifest().get_high_water_mark() or 0
+                    if last_comic_index > high_water_mark:
+                        logger.info('New comics up to comic id: %s', last_comic_index)
+                        self._download_comic_range(high_water_mark + 1, last_comic_index)
+                self._stop_requested.wait(random.uniform(0.9, 1.1) * delay)
+            logger.info('Watch stopped')
+
+    def retry_failed_comics(self) -> None:
+        with self._stop_on_interrupt():
+            failed_comic_ids = self._get_manifest().get_failed_comic_ids()
+            logger.info('%s failed comics to retry', len(failed_comic_ids))
+            self._download_comics(failed_comic_ids)
+            self._log_if_stopped()
+
+    def request_stop(self) -> None:
+        if not self._stop_requested.is_set():
+            self._stop_requested.set()
+            logger.warning('Stop requested, finishing the comics in flight (interrupt again to abort)')
+
+    def _download_comic_range(self, first_comic_index: int, last_comic_index: int) -> None:
+        self._remove_stale_temporary_files()
+        self._download_pending_comics(self._get_pending_comic_ids(last_comic_index, first_comic_index))
+
+    def _download_pending_comics(self, pending_comic_ids: list) -> None:
+        if self.LEASE_QUEUE_FILE:
+            self._download_leased_comics(pending_comic_ids)
+        else:
+            self._download_comics(pending_comic_ids)
+        self._advance_high_water_mark()
+
+    def _download_leased_comics(self, comic_ids: list) -> None:
+        # Workers sharing the lease queue claim batches of comics; a worker that dies stops sending
+        # heartbeats and its leases expire after LEASE_SECONDS, so the others claim them again.
+        lease_queue = self._get_lease_queue()
+        lease_queue.add(comic_ids)
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._send_lease_heartbeats, args=(finished,), daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop_requested.is_set():
+                leased_comic_ids = lease_queue.claim(self._worker_id, self.LEASE_BATCH_SIZE)
+                if not leased_comic_ids:
+                    # Comics leased by other workers may still come back if one of them dies.
+                    if not lease_queue.get_counts()[LeaseQueue.LEASED]:
+                        break
+                    self._stop_requested.wait(self.LEASE_SECONDS / 3)
+                    continue
+                logger.info('Worker %s leased comic ids: %s to %s', self._worker_id, leased_comic_ids[0],
+                            leased_comic_ids[-1])
+                self._download_comics(leased_comic_ids)
+                self._return_leased_comics(leased_comic_ids)
+        finally:
+            finished.set()
+            heartbeat.join()
+
+    def _return_leased_comics(self, leased_comic_ids: list) -> None:
+        lease_queue = self._get_lease_queue()
+        if self._stop_requested.is_set():
+            journal_states = self._get_journal().get_states()
+            lease_queue.complete(self._worker_id, [comic_id for comic_id in leased_comic_ids
+                                                   if comic_id in journal_states])
+            lease_queue.release(self._worker_id, [comic_id for comic_id in leased_comic_ids
+                                                  if comic_id not in journal_states])
+        else:
+            lease_queue.complete(self._worker_id, leased_comic_ids)
+
+    def _send_lease_heartbeats(self, finished: threading.Event) -> None:
+        while not finished.wait(self.LEASE_SECONDS / 3):
+            self._get_lease_queue().heartbeat(self._worker_id)
+
+    def _advance_high_water_mark(self) -> None:
+        # The mark only moves over ids that all reached a final outcome, so the holes an interrupted
+        # concurrent run leaves behind are still fetched by the next incremental run. A failed comic
+        # stops the mark too, or incremental runs and watch would never retry it.
+        manifest = self._get_manifest()
+        reached_comic_ids = {comic_id for comic_id, entry in self._get_journal().get_states().items()
+                             if entry['state'] != ProgressJournal.FAILED}
+        reached_comic_ids.update(manifest.get_file_names())
+        high_water_mark = manifest.get_high_water_mark() or 0
+        while high_water_mark + 1 in reached_comic_ids:
+            high_water_mark += 1
+        if high_water_mark:
+            manifest.advance_high_water_mark(high_water_mark)
+
+    def _download_comics(self, comic_ids: list) -> None:
+        for index in comic_ids:
+            if self._stop_requested.is_set():
+                break
+            self._download_image_file_for_comic(index)
+
+    @contextlib.contextmanager
+    def _stop_on_interrupt(self):
+        # The first SIGINT or SIGTERM only stops new comics from starting, so the ones in flight
+        # are saved and journaled; the previous handlers come back for a second signal.
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        previous_handlers = {signal_number: signal.getsignal(signal_number)
+                             for signal_number in (signal.SIGINT, signal.SIGTERM)}
+
+        def handle_signal(signal_number, frame) -> None:
+            for restored_signal, previous_handler in previous_handlers.items():
+                signal.signal(restored_signal, previous_handler or signal.SIG_DFL)
+            self.request_stop()
+
+        for signal_number in previous_handlers:
+            signal.signal(signal_number, handle_signal)
+        try:
+            yield
+        finally:
+            for signal_number, previous_handler in previous_handlers.items():
+                signal.signal(signal_number, previous_handler or signal.SIG_DFL)
+
+    def _log_if_stopped(self) -> None:
+        if self._stop_requested.is_set():
+            logger.warning('Download stopped before the end, the next run resumes from the journal')
+
+    def _record_stored_comic(self, comic_id: int, comic_img_url: str, md5: str, img_name_file: str,
+                             size: int) -> None:
+        self._get_manifest().record(comic_id, comic_img_url, md5, img_name_file, size)
+        self._get_journal().record(comic_id, ProgressJournal.DONE, file_name=img_name_file)
+
+    def _record_skipped_comic(self, comic_id: int, reason: str) -> None:
+        self._metrics.increment('xkcd_comics_skipped_total', reason=reason)
+        self._get_journal().record(comic_id, ProgressJournal.SKIPPED, reason=reason)
+
+    def _record_failed_comic(self, comic_id: int, reason: str) -> None:
+        self._metrics.increment('xkcd_comics_failed_total')
+        self._get_manifest().record_failure(comic_id, reason)
+        self._get_journal().record(comic_id, ProgressJournal.FAILED, reason=reason)
+
+    def _get_sqlite_journal_mode(self) -> str:
+        if self.SQLITE_JOURNAL_MODE is not None:
+            return self.SQLITE_JOURNAL_MODE
+        return 'DELETE' if self.SHARD is not None or self.LEASE_QUEUE_FILE is not None else 'WAL'
+
+    def _get_manifest(self) -> ComicManifest:
+        with self._manifest_lock:
+            if self._manifest is None:
+                self._manifest = ComicManifest(f'{self.DIRECTORY}/{self.MANIFEST_FILE_NAME}',
+                                               self._get_sqlite_journal_mode())
+            return self._manifest
+
+    def _get_http_cache(self) -> HttpCache:
+        with self._manifest_lock:
+            if self._http_cache is None:
+                self._http_cache = HttpCache(f'{self.DIRECTORY}/{self.HTTP_CACHE_FILE_NAME}',
+                                             self.HTTP_CACHE_MAX_BYTES, self._get_sqlite_journal_mode())
+            return self._http_cache
+
+    @contextlib.contextmanager
+    def _measure_phase(self, phase: str, comic_id: int):
+        with self._metrics.time('xkcd_phase_duration_seconds', phase=phase), self._trace(phase, comic_id):
+            yield
+
+    def _trace(self, name: str, comic_id: int = None, **args):
+        # Without tracing the span is a no-op that still yields a dict for the span arguments.
+        if self._tracer is None:
+            return contextlib.nullcontext({})
+        return self._tracer.span(name, comic_id, **args)
+
+    def _get_catalog(self) -> MetadataCatalog:
+        with self._manifest_lock:
+            if self._catalog is None:
+                self._catalog = MetadataCatalog(f'{self.DIRECTORY}/{self.CATALOG_FILE_NAME}',
+                                                self._get_sqlite_journal_mode())
+            return self._catalog
+
+    def _get_storage(self):
+        with self._manifest_lock:
+            if self._storage is None:
+                if self.STORAGE == 'pack':
+                    self._storage = PackStorage(self.DIRECTORY, self.PACK_SYNC_EVERY, self.PACK_SYNC_INTERVAL,
+                                                self._get_sqlite_journal_mode())
+                elif self.STORAGE == 'object':
+                    self._storage = ObjectStorage(
+                        self.DIRECTORY, self.OBJECT_STORE_URL, self.OBJECT_STORE_REGION,
+                        self.OBJECT_STORE_ACCESS_KEY, self.OBJECT_STORE_SECRET_KEY,
+                        part_size=self.OBJECT_STORE_PART_SIZE,
+                        upload_workers=self.OBJECT_STORE_UPLOAD_WORKERS,
+                        pool_size=self.OBJECT_STORE_POOL_SIZE)
+                else:
+                    self._storage = DirectoryStorage(self.DIRECTORY)
+            return self._storage
+
+    def _get_lease_queue(self) -> LeaseQueue:
+        with self._manifest_lock:
+            if self._lease_queue is None:
+                self._lease_queue = LeaseQueue(self.LEASE_QUEUE_FILE, self.LEASE_SECONDS)
+            return self._lease_queue
+
+    def _get_journal(self) -> ProgressJournal:
+        with self._manifest_lock:
+            if self._journal is None:
+                self._journal = ProgressJournal(f'{self.DIRECTORY}/{self.JOURNAL_FILE_NAME}',
+                                                self.JOURNAL_SYNC_EVERY, self.JOURNAL_SYNC_INTERVAL)
+            return self._journal
+
+    def _get_first_comic_index(self) -> int:
+        high_water_mark = self._get_manifest().get_high_water_mark()
+        if self.INCREMENTAL and high_water_mark is not None:
+            logger.info('Incremental mode, comics up to comic id: %s are already done', high_water_mark)
+            return high_water_mark + 1
+        return 1
+
+    def _get_known_comic_ids(self) -> set:
+        stored_files = self._get_storage().list_names()
+        known_comic_ids = {comic_id for comic_id, file_name in self._get_manifest().get_file_names().items()
+                           if file_name in stored_files}
+        # The journal also knows the comics that have no image to download, and stays authoritative
+        # for stored comics whose manifest row was lost.
+        for comic_id, entry in self._get_journal().get_states().items():
+            if entry['state'] == ProgressJournal.SKIPPED or (
+                    entry['state'] == ProgressJournal.DONE and entry['file_name'] in stored_files):
+                known_comic_ids.add(comic_id)
+        return known_comic_ids
+
+    def _get_pending_comic_ids(self, last_comic_index: int, first_comic_index: int = 1) -> list:
+        known_comic_ids = self._get_known_comic_ids()
+        comic_ids = range(first_comic_index, last_comic_index + 1)
+        if self._shard is not None:
+            comic_ids = [comic_id for comic_id in comic_ids if is_in_shard(comic_id, self._shard)]
+        pending_comic_ids = [comic_id for comic_id in comic_ids if comic_id not in known_comic_ids]
+        done_count = len(comic_ids) - len(pending_comic_ids)
+        logger.info('%s comics already done, %s comics to download', done_count, len(pending_comic_ids))
+        return pending_comic_ids
 
     def _get_last_index_from_api(self) -> int:
         api_response = self._make_request(
             url=''.join(self.API_URL), except_log_message='in request last comic index from xkcd API')
 
         if api_response is not None:
-            if api_response.status_code == 200:
+            if api_response.status_code in (200, 304):
                 last_comic_index = api_response.json()['num']
-                logging.info(f'Last comic index (comic id): {last_comic_index}')
+                logger.info('Last comic index (comic id): %s', last_comic_index)
                 return last_comic_index
             else:
-                logging.warning(f'Error {api_response.status_code} when getting last comic index '
-                                'from xkcd API')
+                logger.warning('Error %s when getting last comic index from xkcd API',
+                               api_response.status_code, extra={'status': api_response.status_code})
                 exit()
 
+    def _poll_last_index_from_api(self) -> int:
+        api_response = self._make_request(
+            url=''.join(self.API_URL), except_log_message='in poll for last comic index from xkcd API')
+        if api_response is not None:
+            if api_response.status_code in (200, 304):
+                return api_response.json()['num']
+            logger.warning('Error %s when polling last comic index from xkcd API', api_response.status_code,
+                           extra={'status': api_response.status_code})
+
+    def _head_image_file_for_comic(self, comic_id: int, comic_img_url: str) -> tuple:
+        # Size and content type of the image without its body; a failed request leaves both unknown
+        # and, unlike a download, is not recorded as a failure of the comic.
+        response = self._make_request(
+            url=comic_img_url, except_log_message=f'in HEAD request for comic id image file: {comic_id}',
+            method='HEAD')
+        if response is None:
+            return None, None
+        try:
+            if response.status_code != 200:
+                logger.warning('Error %s in HEAD request for comic id: %s', response.status_code, comic_id,
+                               extra={'comic_id': comic_id, 'phase': 'plan', 'status': response.status_code})
+                return None, None
+            content_length = response.headers.get('Content-Length', '')
+            return (int(content_length) if content_length.isdigit() else None,
+                    response.headers.get('Content-Type'))
+        finally:
+            response.close()
+
+    def _get_request_seconds(self, url: str, request_count: int) -> float:
+        rate_limit = self._get_host_settings(url)['rate_limit']
+        return request_count / rate_limit if rate_limit else 0.0
+
     def _download_image_file_for_comic(self, comic_id: int) -> None:
         comic_img_url = self._get_image_comic_url(comic_id)
         if comic_img_url:
-            response_for_image_file = self._make_request(
-                url=comic_img_url,
-                except_log_message=(f'in request for comic id image file: {comic_id}')
-                )
-            if response_for_image_file is not None:
-                if response_for_image_file.status_code == 200:
-                    response_headers = response_for_image_file.headers
-                    if self._content_is_a_image(response_headers):
-                        md5 = self._get_md5_from_file(
-                            response_for_image_file.content)
-                        file_extension = response_headers['Content-Type'][6:]
-                        img_name_file = f'{md5}.{file_extension}'
-                        self._save_comic_img_file_in_local_storage(img_name_file,
-                                                                   response_for_image_file.content,
-                                                                   comic_id)
-                    else:
-                        logging.info(f'The file for comic id: {comic_id} is not a image')
-                else:
-                    logging.warning(f'Error {response_for_image_file.status_code} in request for '
-                                    f'comic id: {comic_id}')
+            spooled_image = self._fetch_image_file_for_comic(comic_id, comic_img_url)
+            if spooled_image is not None:
+                self._persist_image_file_for_comic(comic_id, comic_img_url, spooled_image)
+
+    def _fetch_image_file_for_comic(self, comic_id: int, comic_img_url: str) -> SpooledImage:
+        # The body of a streamed image is read after _make_request returns, so a transfer that breaks
+        # partway through is retried here, with the same backoff and exceptions as the request and
+        # out of the same budget of attempts.
+        with self._measure_phase('image_fetch', comic_id):
+            attempts = iter(range(self.RETRIES + 1))
+            attempt = next(attempts)
+            while True:
+                response_for_image_file = self._make_request(
+                    url=comic_img_url,
+                    except_log_message=(f'in request for comic id image file: {comic_id}'),
+                    stream=True, attempts=itertools.chain([attempt], attempts)
+                    )
+                if response_for_image_file is None:
+                    self._record_failed_comic(comic_id, 'image request failed')
+                    return None
+                try:
+                    return self._read_image_response(comic_id, comic_img_url, response_for_image_file)
+                except Exception as error:
+                    stream_error = error
+                finally:
+                    response_for_image_file.close()
+                self._get_rate_controller(comic_img_url).record_failure()
+                retryable = isinstance(stream_error, self.RETRY_EXCEPTIONS)
+                next_attempt = next(attempts, None) if retryable else None
+                if next_attempt is None:
+                    logger.error('%s when download image file for comic id: %s', type(stream_error).__name__,
+                                 comic_id, extra={'comic_id': comic_id, 'phase': 'image_fetch'})
+                    self._record_failed_comic(comic_id,
+                                              f'{type(stream_error).__name__} while streaming image')
+                    return None
+                delay = self._get_retry_delay(next_attempt - 1)
+                logger.warning('%s while streaming image for comic id: %s, retrying in %.1fs',
+                               type(stream_error).__name__, comic_id, delay,
+                               extra={'comic_id': comic_id, 'phase': 'image_fetch'})
+                self._metrics.increment('xkcd_retries_total', reason=type(stream_error).__name__)
+                time.sleep(delay)
+                attempt = next_attempt
+
+    def _read_image_response(self, comic_id: int, comic_img_url: str,
+                             response_for_image_file: requests.models.Response) -> SpooledImage:
+        if response_for_image_file.status_code == 200:
+            if self._content_is_a_image(response_for_image_file.headers):
+                return self._spool_image_file_to_temporary_file(comic_id, response_for_image_file)
+            logger.info('The file for comic id: %s is not a image', comic_id,
+                        extra={'comic_id': comic_id, 'phase': 'image_fetch'})
+            self._record_skipped_comic(comic_id, 'not an image')
+        elif response_for_image_file.status_code == 304:
+            self._record_unchanged_image_file(comic_id, comic_img_url)
+        else:
+            status_code = response_for_image_file.status_code
+            logger.warning('Error %s in request for comic id: %s', status_code, comic_id,
+                           extra={'comic_id': comic_id, 'phase': 'image_fetch', 'status': status_code})
+            self._record_failed_comic(comic_id, f'HTTP {status_code} from image request')
+
+    def _spool_image_file_to_temporary_file(self, comic_id: int,
+                                            response: requests.models.Response) -> SpooledImage:
+        # The body is hashed chunk by chunk while it is written to a temporary file in
+        # DIRECTORY, so memory per transfer stays bounded by CHUNK_SIZE. A transfer that breaks
+        # leaves no partial file behind for the next attempt.
+        md5_from_file = hashlib.md5()
+        size = 0
+        spool_started_at = time.perf_counter()
+        hash_seconds = 0.0
+        write_seconds = 0.0
+        temporary_file = tempfile.NamedTemporaryFile(dir=self.DIRECTORY, prefix=self.TEMPORARY_FILE_PREFIX,
+                                                     delete=False)
+        self._temporary_file_paths.add(temporary_file.name)
+        try:
+            with temporary_file, self._trace('spool_image') as span_args:
+                for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                    started_at = time.perf_counter()
+                    md5_from_file.update(chunk)
+                    hashed_at = time.perf_counter()
+                    temporary_file.write(chunk)
+                    write_seconds += time.perf_counter() - hashed_at
+                    hash_seconds += hashed_at - started_at
+                    size += len(chunk)
+                span_args.update(bytes=size, hash_seconds=round(hash_seconds, 6))
+        except BaseException:
+            self._remove_temporary_file(temporary_file.name)
+            logger.debug('Transfer of image file for comic id: %s broke after %s bytes', comic_id, size,
+                         extra={'comic_id': comic_id, 'phase': 'image_fetch', 'bytes': size})
+            raise
+        self._metrics.observe('xkcd_phase_duration_seconds', hash_seconds, phase='hash')
+        self._metrics.observe('xkcd_phase_duration_seconds', write_seconds, phase='write')
+        self._metrics.increment('xkcd_bytes_downloaded_total', size)
+        logger.debug('Image file for comic id: %s has been downloaded', comic_id,
+                     extra={'comic_id': comic_id, 'phase': 'image_fetch', 'bytes': size,
+                            'duration': time.perf_counter() - spool_started_at})
+        file_extension = response.headers['Content-Type'][6:]
+        return SpooledImage(md5_from_file.hexdigest(), file_extension, temporary_file.name, size,
+                            response.headers)
+
+    def _persist_image_file_for_comic(self, comic_id: int, comic_img_url: str,
+                                      spooled_image: SpooledImage) -> None:
+        with self._measure_phase('persist', comic_id):
+            img_name_file = f'{spooled_image.md5}.{spooled_image.file_extension}'
+            if self._save_comic_img_file_in_local_storage(img_name_file, spooled_image.temporary_file_path,
+                                                          comic_id):
+                self._record_stored_comic(comic_id, comic_img_url, spooled_image.md5, img_name_file,
+                                          spooled_image.size)
+                self._store_validators_in_http_cache(comic_img_url, spooled_image.headers,
+                                                     stored_name=img_name_file)
+            else:
+                self._record_failed_comic(comic_id, 'image file could not be saved')
 
     def _get_image_comic_url(self, comic_id: int) -> str:
-        api_response = self._make_request(url=f'{self.API_URL[0]}{comic_id}{self.API_URL[1]}',
-                                          except_log_message=f'in request comic id: {comic_id} '
-                                          'from xkcd API')
-        if api_response is not None:
-            if api_response.status_code == 200:
-                comic_title = api_response.json()['title']
-                logging.info(f'URL from image comic id: {comic_id}, title: {comic_title}, has been obtained '
-                             'from xkcd API')
-                return api_response.json()['img']
+        # The metadata of a comic does not change once published, so a comic already in the catalog
+        # (a retry, or a comic whose image was removed) needs no request to the xkcd API.
+        comic_img_url = self._get_catalog().get_img_url(comic_id)
+        if comic_img_url is not None:
+            logger.info('URL from image comic id: %s has been obtained from the metadata catalog', comic_id,
+                        extra={'comic_id': comic_id, 'phase': 'metadata'})
+            return comic_img_url
+        with self._measure_phase('metadata', comic_id):
+            api_response = self._request_comic_metadata(comic_id)
+            if api_response is not None:
+                if api_response.status_code in (200, 304):
+                    return self._catalog_comic_metadata(comic_id, api_response)
+                else:
+                    logger.warning('Error %s in xkcd API request from comic id: %s', api_response.status_code,
+                                   comic_id, extra={'comic_id': comic_id, 'phase': 'metadata',
+                                                    'status': api_response.status_code})
+                    if api_response.status_code == 404:
+                        self._record_skipped_comic(comic_id, 'comic does not exist')
+                    else:
+                        self._record_failed_comic(comic_id, f'HTTP {api_response.status_code} from xkcd API')
             else:
-                logging.warning(f'Error {api_response.status_code} in xkcd API request from '
-                                f'comic id: {comic_id}')
+                self._record_failed_comic(comic_id, 'request to xkcd API failed')
 
-    def _make_request(self, url: str, except_log_message: str) -> requests.models.Response:
-        try:
-            return requests.get(
-                url, headers=self.HEADERS, timeout=self.TIMEOUT
-            )
-        except Exception as error:
-            logging.error(f'{type(error).__name__} {except_log_message}')
+    def _look_up_image_comic_url(self, comic_id: int) -> str:
+        # The lookup of the plan, which must not change what the next run or --retry-failed does: the
+        # metadata only goes to the catalog, and a failed request leaves the image unknown instead of
+        # being recorded in the manifest and the journal.
+        api_response = self._request_comic_metadata(comic_id)
+        if api_response is not None and api_response.status_code in (200, 304):
+            return self._catalog_comic_metadata(comic_id, api_response)
+
+    def _request_comic_metadata(self, comic_id: int) -> requests.models.Response:
+        return self._make_request(url=f'{self.API_URL[0]}{comic_id}{self.API_URL[1]}',
+                                  except_log_message=f'in request comic id: {comic_id} from xkcd API')
+
+    def _catalog_comic_metadata(self, comic_id: int, api_response: requests.models.Response) -> str:
+        comic_metadata = api_response.json()
+        self._get_catalog().record(comic_id, comic_metadata)
+        logger.info('URL from image comic id: %s, title: %s, has been obtained from xkcd API',
+                    comic_id, comic_metadata['title'], extra={'comic_id': comic_id, 'phase': 'metadata'})
+        return comic_metadata['img']
+
+    def _record_unchanged_image_file(self, comic_id: int, comic_img_url: str) -> None:
+        cache_entry = self._get_http_cache().get(comic_img_url)
+        if cache_entry is not None and cache_entry['stored_name']:
+            img_name_file = cache_entry['stored_name']
+            self._record_stored_comic(comic_id, comic_img_url, img_name_file.split('.')[0], img_name_file,
+                                      self._get_storage().get_size(img_name_file))
+            logger.info('File of Comic id: %s has not changed since it was saved with name: %s', comic_id,
+                        img_name_file, extra={'comic_id': comic_id, 'phase': 'image_fetch', 'status': 304})
+        else:
+            logger.warning('Image for comic id: %s has not changed but its cache entry is gone', comic_id,
+                           extra={'comic_id': comic_id, 'phase': 'image_fetch', 'status': 304})
+            self._record_failed_comic(comic_id, 'image not modified but cache entry is gone')
+
+    def _make_request(self, url: str, except_log_message: str, stream: bool = False,
+                      method: str = 'GET', attempts=None) -> requests.models.Response:
+        # Validators are left out of HEAD requests, a 304 would hide the size they are sent for.
+        # A caller that retries on its own passes an iterator over the attempt numbers it shares
+        # with this loop, so both draw from the same budget of RETRIES + 1 attempts.
+        cache_entry = self._get_usable_cache_entry(url) if method == 'GET' else None
+        host_settings = self._get_host_settings(url)
+        rate_controller = self._get_rate_controller(url)
+        for attempt in (range(self.RETRIES + 1) if attempts is None else attempts):
+            request_slot = contextlib.ExitStack()
+            try:
+                with request_slot:
+                    request_slot.enter_context(rate_controller)
+                    request_slot.enter_context(self._metrics.track_in_flight('xkcd_requests_in_flight'))
+                    started_at = time.monotonic()
+                    with self._trace('make_request', url=url, attempt=attempt) as span_args:
+                        if method == 'HEAD':
+                            # Unlike get, requests does not follow redirects for head by default.
+                            response = self._get_session().head(
+                                url, headers=self._get_request_headers(cache_entry),
+                                timeout=host_settings['timeout'], allow_redirects=True
+                            )
+                        else:
+                            response = self._get_session().get(
+                                url, headers=self._get_request_headers(cache_entry),
+                                timeout=host_settings['timeout'], stream=stream
+                            )
+                        span_args['status'] = response.status_code
+                    if stream:
+                        # A streamed body is read after this method returns, so the AIMD slot and the
+                        # in-flight gauge are held until the response is closed.
+                        request_slot = request_slot.pop_all()
+            except Exception as error:
+                rate_controller.record_failure()
+                if isinstance(error, self.RETRY_EXCEPTIONS) and attempt < self.RETRIES:
+                    delay = self._get_retry_delay(attempt)
+                    logger.warning('%s %s, retrying in %.1fs', type(error).__name__, except_log_message,
+                                   delay)
+                    self._metrics.increment('xkcd_retries_total', reason=type(error).__name__)
+                    time.sleep(delay)
+                    continue
+                logger.error('%s %s', type(error).__name__, except_log_message)
+                self._metrics.increment('xkcd_request_failures_total', status_code=type(error).__name__)
+                return None
+            self._metrics.increment('xkcd_responses_total', status_code=response.status_code)
+            delay = self._get_retry_delay(attempt, response)
+            if response.status_code in self.THROTTLE_STATUS_CODES:
+                rate_controller.record_throttle(delay)
+            elif isinstance(response.status_code, int) and response.status_code >= 500:
+                rate_controller.record_failure()
+            elif stream:
+                request_slot.callback(self._record_streamed_success, response, rate_controller, started_at)
+            else:
+                rate_controller.record_success(time.monotonic() - started_at)
+            if stream:
+                self._release_request_slot_on_close(response, request_slot)
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.RETRIES:
+                logger.warning('Error %s %s, retrying in %.1fs', response.status_code, except_log_message,
+                               delay, extra={'status': response.status_code})
+                response.close()
+                self._metrics.increment('xkcd_retries_total', reason=response.status_code)
+                time.sleep(delay)
+                continue
+            if isinstance(response.status_code, int) and response.status_code >= 400:
+                self._metrics.increment('xkcd_request_failures_total', status_code=response.status_code)
+            if method == 'HEAD':
+                return response
+            return self._apply_http_cache(url, response, cache_entry)
+
+    def _release_request_slot_on_close(self, response: requests.models.Response,
+                                       request_slot: contextlib.ExitStack) -> None:
+        close = response.close
+
+        def close_and_release() -> None:
+            try:
+                close()
+            finally:
+                request_slot.close()
+
+        response.close = close_and_release
+
+    def _record_streamed_success(self, response: requests.models.Response,
+                                 rate_controller: HostRateController, started_at: float) -> None:
+        # The latency of a streamed response covers the whole transfer, and a body that was not read
+        # to the end tells nothing about the health of the host.
+        if response._content_consumed:
+            rate_controller.record_success(time.monotonic() - started_at)
+
+    def _get_retry_delay(self, attempt: int, response: requests.models.Response = None) -> float:
+        # Full jitter keeps workers that failed together from retrying together; a Retry-After
+        # sent by the server is a lower bound.
+        delay = random.uniform(0, min(self.RETRY_BACKOFF_MAX, self.RETRY_BACKOFF * 2 ** attempt))
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.MAX_RETRY_AFTER))
+        return delay
+
+    def _get_rate_controller(self, url: str) -> HostRateController:
+        host = urlsplit(url).hostname
+        with self._adapters_lock:
+            if host not in self._rate_controllers:
+                host_settings = self._get_host_settings(url)
+                self._rate_controllers[host] = HostRateController(
+                    host_settings['rate_limit'], host_settings['rate_limit_burst'],
+                    AimdLimiter(host_settings['aimd_initial_limit'],
+                                max_limit=host_settings['aimd_max_limit'],
+                                latency_threshold=self.AIMD_LATENCY_THRESHOLD))
+            return self._rate_controllers[host]
+
+    def _get_usable_cache_entry(self, url: str) -> dict:
+        # Validators are only worth sending when a 304 can be answered locally, either with
+        # the cached body or with the image file saved by a previous run.
+        cache_entry = self._get_http_cache().get(url)
+        if cache_entry is not None:
+            stored_name = cache_entry['stored_name']
+            if cache_entry['body'] is not None or (stored_name and self._get_storage().contains(stored_name)):
+                return cache_entry
+
+    def _get_request_headers(self, cache_entry: dict) -> dict:
+        headers = dict(self.HEADERS)
+        if cache_entry is not None:
+            if cache_entry['etag']:
+                headers['If-None-Match'] = cache_entry['etag']
+            if cache_entry['last_modified']:
+                headers['If-Modified-Since'] = cache_entry['last_modified']
+        return headers
+
+    def _apply_http_cache(self, url: str, response: requests.models.Response,
+                          cache_entry: dict) -> requests.models.Response:
+        if response.status_code == 304 and cache_entry is not None:
+            if cache_entry['body'] is not None:
+                response._content = cache_entry['body']
+            logger.info('%s has not been modified since the last request', url, extra={'status': 304})
+        elif response.status_code == 200 and self._content_is_json(response.headers):
+            self._store_validators_in_http_cache(url, response.headers, body=response.content)
+        return response
+
+    def _store_validators_in_http_cache(self, url: str, headers: dict, body: bytes = None,
+                                        stored_name: str = None) -> None:
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag or last_modified:
+            self._get_http_cache().store(url, etag, last_modified, body=body, stored_name=stored_name)
+
+    def _content_is_json(self, headers: dict) -> bool:
+        return headers.get('Content-Type', '').startswith('application/json')
+
+    def _get_host_settings(self, url: str) -> dict:
+        settings = {'pool_connections': self.POOL_CONNECTIONS, 'pool_maxsize': self.POOL_MAXSIZE,
+                    'max_retries': self.MAX_RETRIES, 'timeout': self.TIMEOUT, 'rate_limit': self.RATE_LIMIT,
+                    'rate_limit_burst': self.RATE_LIMIT_BURST, 'aimd_initial_limit': self.AIMD_INITIAL_LIMIT,
+                    'aimd_max_limit': self.AIMD_MAX_LIMIT}
+        settings.update(self.HOSTS_CONFIG.get(urlsplit(url).hostname, {}))
+        return settings
+
+    def _get_session(self) -> requests.Session:
+        # requests.Session is not thread safe, so each thread gets its own session while
+        # the adapters, which hold the keep-alive connection pools, are shared by all of them.
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = EnvironmentCachingSession()
+            for prefix, adapter in self._get_adapters().items():
+                session.mount(prefix, adapter)
+            with self._adapters_lock:
+                self._sessions.append(session)
+            self._thread_local.session = session
+        return session
+
+    def _get_adapters(self) -> dict:
+        with self._adapters_lock:
+            if self._adapters is None:
+                self._adapters = {'https://': self._create_adapter(self._get_host_settings('')),
+                                  'http://': self._create_adapter(self._get_host_settings(''))}
+                for host in self.HOSTS_CONFIG:
+                    adapter = self._create_adapter(self._get_host_settings(f'https://{host}/'))
+                    self._adapters[f'https://{host}/'] = adapter
+                    self._adapters[f'http://{host}/'] = adapter
+            return self._adapters
+
+    def _create_adapter(self, host_settings: dict) -> HTTPAdapter:
+        max_retries = host_settings['max_retries']
+        if isinstance(max_retries, int):
+            max_retries = Retry(total=max_retries, backoff_factor=0.3, allowed_methods=False)
+        return HTTPAdapter(pool_connections=host_settings['pool_connections'],
+                           pool_maxsize=host_settings['pool_maxsize'], max_retries=max_retries)
 
     def _content_is_a_image(self, headers: dict) -> bool:
         if (headers['Content-Type'].startswith('image')):
@@ -93,40 +873,69 @@ class XkcdDownloader:
         else:
             return False
 
-    def _save_comic_img_file_in_local_storage(self, name_img_file: str, img_file_content: bytes,
-                                              comic_id: int) -> None:
-        if not os.path.isfile(f'{self.DIRECTORY}/{name_img_file}'):
-            self._create_file_in_local_storage(
+    def _save_comic_img_file_in_local_storage(self, name_img_file: str, temporary_file_path: str,
+                                              comic_id: int) -> bool:
+        # Safe with several writers in the same directory: every writer spools into its own unique
+        # temporary file and the name is the md5 of the content, so when two of them race past the
+        # check below the directory storage only swaps in identical bytes and the pack storage keeps
+        # the first record indexed under that name.
+        if not self._get_storage().contains(name_img_file):
+            return self._create_file_in_local_storage(
                 file_name=name_img_file,
-                file_content=img_file_content,
-                info_log_msg=(f'Comic id: {comic_id} has been saved with name: {name_img_file}'),
-                error_log_msg=(f'when save file image for comic id: {comic_id} with name: {name_img_file}'))
+                temporary_file_path=temporary_file_path,
+                info_log_msg='Comic id: %s has been saved with name: %s',
+                error_log_msg='when save file image for comic id: %s with name: %s',
+                comic_id=comic_id)
         else:
-            logging.info(f'File of Comic id: {comic_id} alredy exits with name: {name_img_file}')
-
-    def _get_md5_from_file(self, file_content: bytes) -> str:
-        md5_from_file = hashlib.md5()
-        md5_from_file.update(file_content)
-        return md5_from_file.hexdigest()
+            self._remove_temporary_file(temporary_file_path)
+            logger.info('File of Comic id: %s alredy exits with name: %s', comic_id, name_img_file,
+                        extra={'comic_id': comic_id, 'phase': 'persist'})
+            return True
 
-    def _create_file_in_local_storage(self, file_name: str, file_content: bytes, info_log_msg: str = '',
-                                      error_log_msg: str = '') -> None:
+    def _create_file_in_local_storage(self, file_name: str, temporary_file_path: str, info_log_msg: str = '',
+                                      error_log_msg: str = '', comic_id: int = None) -> bool:
+        # With a comic id the messages are templates for the comic id and the file name, formatted
+        # only if the line is actually written.
+        log_args = (comic_id, file_name) if comic_id is not None else ()
+        log_fields = {'comic_id': comic_id, 'phase': 'persist'}
         try:
-            with open(f'{self.DIRECTORY}/{file_name}', 'wb') as img_file:
-                img_file.write(file_content)
+            with self._trace('create_file', file_name=file_name):
+                self._get_storage().store(file_name, temporary_file_path)
+            self._temporary_file_paths.discard(temporary_file_path)
         except Exception as error:
-            logging.error(f'{type(error).__name__} {error_log_msg}')
+            self._remove_temporary_file(temporary_file_path)
+            logger.error(f'%s {error_log_msg}', type(error).__name__, *log_args, extra=log_fields)
+            return False
         else:
-            self._count_of_comic_downloads += 1
-            logging.info(info_log_msg)
+            with self._count_lock:
+                self._count_of_comic_downloads += 1
+            self._metrics.increment('xkcd_comics_downloaded_total')
+            logger.info(info_log_msg, *log_args, extra=log_fields)
+            return True
+
+    def _remove_temporary_file(self, temporary_file_path: str) -> None:
+        self._temporary_file_paths.discard(temporary_file_path)
+        try:
+            os.remove(temporary_file_path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_stale_temporary_files(self) -> None:
+        # Temporary files left by a killed run are removed, but only once they are old enough not to
+        # belong to another process writing into the same directory.
+        stale_before = time.time() - self.STALE_TEMPORARY_FILE_AGE
+        with os.scandir(self.DIRECTORY) as entries:
+            for entry in entries:
+                if entry.name.startswith(self.TEMPORARY_FILE_PREFIX) and entry.stat().st_mtime < stale_before:
+                    self._remove_temporary_file(entry.path)
 
     def _create_directory(self) -> None:
         try:
             os.mkdir(self.DIRECTORY)
         except FileExistsError:
-            logging.info(f'The directory: "{self.DIRECTORY}/" alredy exists')
+            logger.info('The directory: "%s/" alredy exists', self.DIRECTORY)
         except Exception as error:
-            logging.error(f'{type(error).__name__} when create directory "{self.DIRECTORY}/"')
+            logger.error('%s when create directory "%s/"', type(error).__name__, self.DIRECTORY)
             exit()
         else:
-            logging.info(f'The directory: "{self.DIRECTORY}/" has been created')
+            logger.info('The directory: "%s/" has been created', self.DIRECTORY)
@@ -0,0 +1,105 @@
+import threading
+import unittest
+
+from src.async_downloader import AsyncXkcdDownloader
+from unittest.mock import patch
+
+
+class TestInitMethod(unittest.TestCase):
+    def test_concurrency_can_be_set_by_keyword(self):
+        instance = AsyncXkcdDownloader(concurrency=4)
+        self.assertEqual(instance.CONCURRENCY, 4)
+
+    def test_raises_value_error_when_concurrency_is_lower_than_one(self):
+        with self.assertRaises(ValueError):
+            AsyncXkcdDownloader(concurrency=0)
+
+
+class TestMakeDownloadMethod(unittest.TestCase):
+    def setUp(self):
+        self.instance = AsyncXkcdDownloader(concurrency=8)
+        self.max_index = 40
+
+    @patch('src.async_downloader.AsyncXkcdDownloader._download_image_file_for_comic')
+    @patch('src.async_downloader.AsyncXkcdDownloader._get_last_index_from_api')
+    def test_download_every_comic_id_once(self, mock_get_last_index, mock_download_img_file):
+        mock_get_last_index.return_value = self.max_index
+        self.instance.make_download()
+        downloaded_ids = sorted(call.args[0] for call in mock_download_img_file.call_args_list)
+        self.assertEqual(downloaded_ids, list(range(1, self.max_index + 1)))
+
+    @patch('src.async_downloader.AsyncXkcdDownloader._download_image_file_for_comic')
+    @patch('src.async_downloader.AsyncXkcdDownloader._get_last_index_from_api', return_value=None)
+    def test_not_download_when_last_index_is_not_obtained(self, mock_get_last_index, mock_download_img_file):
+        self.instance.make_download()
+        mock_download_img_file.assert_not_called()
+
+    @patch('src.async_downloader.AsyncXkcdDownloader._get_last_index_from_api')
+    def test_download_comics_concurrently_up_to_the_concurrency_limit(self, mock_get_last_index):
+        mock_get_last_index.return_value = self.max_index
+        lock = threading.Lock()
+        in_flight = {'current': 0, 'peak': 0}
+        # Every round of comics meets at the barrier, so the peak is reached without relying on timing and
+        # a run that falls short of the limit breaks the barrier instead of passing slowly.
+        all_slots_busy = threading.Barrier(self.instance.CONCURRENCY, timeout=10)
+
+        def slow_download(comic_id):
+            with lock:
+                in_flight['current'] += 1
+                in_flight['peak'] = max(in_flight['peak'], in_flight['current'])
+            all_slots_busy.wait()
+            with lock:
+                in_flight['current'] -= 1
+
+        with patch.object(self.instance, '_download_image_file_for_comic', side_effect=slow_download):
+            self.instance.make_download()
+        self.assertEqual(in_flight['peak'], self.instance.CONCURRENCY)
+
+    @patch('src.async_downloader.AsyncXkcdDownloader._get_last_index_from_api')
+    def test_no_comic_starts_after_stop_is_requested(self, mock_get_last_index):
+        mock_get_last_index.return_value = self.max_index
+        started = []
+
+        def download_and_stop(comic_id):
+            started.append(comic_id)
+            if len(started) == self.instance.CONCURRENCY:
+                self.instance.request_stop()
+            # No comic finishes before the stop, so only the ones already holding a slot start.
+            self.instance._stop_requested.wait(10)
+
+        with patch.object(self.instance, '_download_image_file_for_comic', side_effect=download_and_stop):
+            self.instance.make_download()
+        self.assertEqual(len(started), self.instance.CONCURRENCY)
+
+    def test_interrupted_run_does_not_wait_for_comics_in_flight(self):
+        release = threading.Event()
+        finished = []
+
+        def download_or_interrupt(comic_id):
+            if comic_id == 1:
+                raise KeyboardInterrupt
+            release.wait(10)
+            finished.append(comic_id)
+
+        with patch.object(self.instance, '_download_image_file_for_comic', side_effect=download_or_interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.instance._download_comics(range(1, self.max_index + 1))
+            self.assertEqual(finished, [])
+            release.set()
+
+
+class TestCountOfComicDownloads(unittest.TestCase):
+    @patch('src.storage.DirectoryStorage.store')
+    def test_count_every_file_saved_from_worker_threads(self, mock_store):
+        instance = AsyncXkcdDownloader()
+        threads = [threading.Thread(target=instance._create_file_in_local_storage,
+                                    args=(f'{i}.png', f'.tmp-{i}')) for i in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(instance.get_count_of_comic_downloads, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from src.comic_manifest import ComicManifest
+
+
+class TestComicManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'manifest.sqlite3')
+        self.manifest = ComicManifest(self.path)
+        self.record = {'comic_id': 123, 'img_url': 'https://imgs.xkcd.com/comics/centrifugal_force.png',
+                       'md5': '733050eabfd65f2120a5ec201273a369',
+                       'file_name': '733050eabfd65f2120a5ec201273a369.png', 'size': 11, 'fetched_at': 1.5}
+
+    def tearDown(self):
+        self.manifest.close()
+        self.directory.cleanup()
+
+    def test_get_returns_recorded_comic(self):
+        self.manifest.record(**self.record)
+        self.assertEqual(self.manifest.get(123), self.record)
+
+    def test_get_returns_none_for_unknown_comic(self):
+        self.assertIsNone(self.manifest.get(1))
+
+    def test_record_replaces_previous_entry_for_same_comic(self):
+        self.manifest.record(**self.record)
+        self.manifest.record(**dict(self.record, size=20))
+        self.assertEqual(len(self.manifest), 1)
+        self.assertEqual(self.manifest.get(123)['size'], 20)
+
+    def test_records_persist_after_reopening(self):
+        self.manifest.record(**self.record)
+        self.manifest.close()
+        self.manifest = ComicManifest(self.path)
+        self.assertEqual(self.manifest.get_file_names(), {123: self.record['file_name']})
+
+    def test_rollback_journal_is_kept_after_reopening_without_a_mode(self):
+        self.manifest.close()
+        self.manifest = ComicManifest(self.path, journal_mode='DELETE')
+        self.manifest.close()
+        self.manifest = ComicManifest(self.path, journal_mode=None)
+        journal_mode = self.manifest._connection.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(journal_mode, 'delete')
+
+    def test_record_failure_counts_attempts_and_keeps_last_reason(self):
+        self.manifest.record_failure(5, 'HTTP 503 from xkcd API')
+        self.manifest.record_failure(5, 'image request failed')
+        self.manifest.record_failure(2, 'image request failed')
+        self.assertEqual(self.manifest.get_failed_comic_ids(), [2, 5])
+        failure = self.manifest.get_failures()[5]
+        self.assertEqual((failure['reason'], failure['attempts']), ('image request failed', 2))
+
+    def test_high_water_mark_only_moves_forward(self):
+        self.assertIsNone(self.manifest.get_high_water_mark())
+        self.manifest.advance_high_water_mark(10)
+        self.manifest.advance_high_water_mark(7)
+        self.assertEqual(self.manifest.get_high_water_mark(), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
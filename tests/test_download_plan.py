@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.download_plan import DownloadPlan, PlannedComic
+
+
+class TestDownloadPlan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = f'{self.directory.name}/plan.json'
+        self.plan = DownloadPlan('https://xkcd.com/', 1, 3, [
+            PlannedComic(1, 'https://imgs.xkcd.com/comics/a.png', 2048, 'image/png'),
+            PlannedComic(2, None, None, None),
+            PlannedComic(3, 'https://imgs.xkcd.com/comics/c.html', 512, 'text/html'),
+        ], 1700000000.0)
+
+    def test_read_the_plan_written(self):
+        self.plan.write(self.path)
+        self.assertEqual(DownloadPlan.read(self.path), self.plan)
+        self.assertEqual(os.listdir(self.directory.name), ['plan.json'])
+
+    def test_refuse_a_plan_of_another_version(self):
+        self.plan.write(self.path)
+        with open(self.path) as plan_file:
+            document = json.load(plan_file)
+        document['version'] = 0
+        with open(self.path, 'w') as plan_file:
+            json.dump(document, plan_file)
+        with self.assertRaises(ValueError):
+            DownloadPlan.read(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
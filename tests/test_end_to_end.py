@@ -0,0 +1,248 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from benchmarks.fake_object_store import FakeObjectStore
+from benchmarks.fake_xkcd_server import FakeXkcdServer
+from benchmarks.run_benchmark import get_engine_class, percentile, run_scenario
+from src.download_plan import DownloadPlan
+from src.storage import PackStorage
+from src.verify import verify_store
+
+
+class TestDownloadFromFakeServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeXkcdServer(comic_count=12, image_size=(100, 400))
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.directory.cleanup()
+
+    def _create_downloader(self, engine: str):
+        return get_engine_class(engine)(directory=self.directory.name, api_url=self.server.api_url,
+                                        rate_limit=None)
+
+    def test_every_engine_stores_every_image_under_its_md5(self):
+        expected_files = {f'{hashlib.md5(self.server.get_image(comic_id)).hexdigest()}.png'
+                          for comic_id in range(1, self.server.comic_count + 1)}
+        for engine in ['sync', 'async', 'pipeline']:
+            with self.subTest(engine=engine), tempfile.TemporaryDirectory() as directory:
+                with get_engine_class(engine)(directory=directory, api_url=self.server.api_url,
+                                              rate_limit=None) as downloader:
+                    downloader.make_download()
+                self.assertEqual(downloader.get_count_of_comic_downloads, self.server.comic_count)
+                stored_files = {name for name in os.listdir(directory) if name.endswith('.png')}
+                self.assertEqual(stored_files, expected_files)
+
+    def test_pack_storage_keeps_every_image_in_one_file(self):
+        for _ in range(2):
+            with get_engine_class('async')(directory=self.directory.name, api_url=self.server.api_url,
+                                           rate_limit=None, storage='pack') as downloader:
+                downloader.make_download()
+        self.assertEqual(downloader.get_count_of_comic_downloads, 0)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith('.png')], [])
+        storage = PackStorage(self.directory.name)
+        for comic_id in range(1, self.server.comic_count + 1):
+            image = self.server.get_image(comic_id)
+            self.assertEqual(storage.read(f'{hashlib.md5(image).hexdigest()}.png'), image)
+        storage.close()
+
+    def test_object_storage_uploads_every_image_while_downloading(self):
+        with FakeObjectStore(latency=0.01) as object_store:
+            settings = {'directory': self.directory.name, 'api_url': self.server.api_url, 'rate_limit': None,
+                        'storage': 'object', 'object_store_url': f'{object_store.url}/xkcd',
+                        'object_store_access_key': object_store.ACCESS_KEY,
+                        'object_store_secret_key': object_store.SECRET_KEY}
+            with get_engine_class('async')(**settings) as downloader:
+                downloader.make_download()
+            self.assertEqual(downloader.get_count_of_comic_downloads, self.server.comic_count)
+            self.assertEqual(object_store.request_counts['put'], self.server.comic_count)
+            self.assertEqual(object_store.request_counts.get('head', 0), 0)
+            for comic_id in range(1, self.server.comic_count + 1):
+                image = self.server.get_image(comic_id)
+                self.assertEqual(object_store.objects[f'xkcd/{hashlib.md5(image).hexdigest()}.png'], image)
+            self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith('.png')], [])
+            with get_engine_class('pipeline')(**settings) as downloader:
+                downloader.make_download()
+            self.assertEqual(downloader.get_count_of_comic_downloads, 0)
+            corrupt_name = f'{hashlib.md5(self.server.get_image(3)).hexdigest()}.png'
+            object_store.objects[f'xkcd/{corrupt_name}'] = b'\0' * 16
+            report = verify_store(self.directory.name, 'object', quarantine=True, storage_options={
+                'url': settings['object_store_url'], 'access_key': object_store.ACCESS_KEY,
+                'secret_key': object_store.SECRET_KEY})
+            self.assertEqual([(problem.name, problem.problem) for problem in report.problems],
+                             [(corrupt_name, 'truncated')])
+            self.assertTrue(os.path.isfile(f'{self.directory.name}/quarantine/{corrupt_name}'))
+            self.assertNotIn(f'xkcd/{corrupt_name}', object_store.objects)
+
+    def test_verify_quarantines_a_corrupt_image_and_the_next_run_downloads_it_again(self):
+        with self._create_downloader('sync') as downloader:
+            downloader.make_download()
+        corrupt_name = f'{hashlib.md5(self.server.get_image(3)).hexdigest()}.png'
+        with open(f'{self.directory.name}/{corrupt_name}', 'r+b') as image_file:
+            image_file.write(b'\0' * 16)
+        report = verify_store(self.directory.name, quarantine=True)
+        self.assertEqual(report.checked, self.server.comic_count)
+        self.assertEqual([(problem.name, problem.problem) for problem in report.problems],
+                         [(corrupt_name, 'corrupt')])
+        self.assertTrue(os.path.isfile(f'{self.directory.name}/quarantine/{corrupt_name}'))
+        with self._create_downloader('sync') as downloader:
+            downloader.make_download()
+        self.assertEqual(downloader.get_count_of_comic_downloads, 1)
+        self.assertEqual(verify_store(self.directory.name).problems, [])
+
+    def test_images_removed_from_the_store_are_downloaded_again_without_metadata_requests(self):
+        with self._create_downloader('sync') as downloader:
+            downloader.make_download()
+        for name in os.listdir(self.directory.name):
+            if name.endswith('.png'):
+                os.remove(f'{self.directory.name}/{name}')
+        with self._create_downloader('async') as downloader:
+            downloader.make_download()
+            self.assertEqual(downloader.get_count_of_comic_downloads, self.server.comic_count)
+            self.assertIsNone(downloader.metrics.get_histogram('xkcd_phase_duration_seconds',
+                                                               phase='metadata'))
+            self.assertEqual(downloader._get_catalog().get(5), self.server.get_comic_info(5))
+
+    def test_trace_spans_of_every_comic_in_the_pipeline(self):
+        with get_engine_class('pipeline')(directory=self.directory.name, api_url=self.server.api_url,
+                                          rate_limit=None, trace=True) as downloader:
+            downloader.make_download()
+        spans = {}
+        for event in downloader.tracer.get_events():
+            spans.setdefault(event['name'], set()).add(event['args'].get('comic_id'))
+        comic_ids = set(range(1, self.server.comic_count + 1))
+        for name in ['metadata', 'image_fetch', 'spool_image', 'persist', 'create_file']:
+            self.assertEqual(spans[name], comic_ids)
+        self.assertEqual(spans['make_request'], comic_ids | {None})
+
+    def test_plan_fetches_no_image_and_its_execution_downloads_the_planned_comics(self):
+        with self._create_downloader('sync') as downloader:
+            downloader._get_catalog().record(4, self.server.get_comic_info(4))
+            plan = downloader.plan_download()
+            summary = downloader.get_plan_summary(plan)
+        self.assertEqual(downloader.metrics.get_counter('xkcd_bytes_downloaded_total'), 0)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith('.png')], [])
+        self.assertEqual([comic.comic_id for comic in plan.comics],
+                         list(range(1, self.server.comic_count + 1)))
+        self.assertEqual(plan.comics[3].size, len(self.server.get_image(4)))
+        self.assertEqual(summary['comics to download'], self.server.comic_count)
+        plan.write(f'{self.directory.name}/plan.json')
+        with self._create_downloader('async') as downloader:
+            downloader.execute_plan(DownloadPlan.read(f'{self.directory.name}/plan.json'))
+        self.assertEqual(downloader.get_count_of_comic_downloads, self.server.comic_count)
+
+    def test_second_run_makes_a_single_request(self):
+        with self._create_downloader('sync') as downloader:
+            downloader.make_download()
+        requests_before = self.server.request_count
+        with self._create_downloader('sync') as downloader:
+            downloader.make_download()
+        self.assertEqual(self.server.request_count - requests_before, 1)
+        self.assertEqual(downloader.get_count_of_comic_downloads, 0)
+
+    def test_collect_metrics_of_the_run(self):
+        with self._create_downloader('pipeline') as downloader:
+            downloader.make_download()
+        metrics = downloader.metrics
+        comic_count = self.server.comic_count
+        image_bytes = sum(len(self.server.get_image(comic_id)) for comic_id in range(1, comic_count + 1))
+        self.assertEqual(metrics.get_counter('xkcd_comics_downloaded_total'), comic_count)
+        self.assertEqual(metrics.get_counter('xkcd_bytes_downloaded_total'), image_bytes)
+        self.assertEqual(metrics.get_counter('xkcd_responses_total', status_code=200), 2 * comic_count + 1)
+        for phase in ['metadata', 'image_fetch', 'hash', 'write', 'persist']:
+            histogram = metrics.get_histogram('xkcd_phase_duration_seconds', phase=phase)
+            self.assertEqual(histogram['count'], comic_count, phase)
+        self.assertEqual(metrics.get_gauge('xkcd_requests_in_flight'), 0)
+
+    def test_count_retries_and_failures_by_status_code(self):
+        with FakeXkcdServer(comic_count=20, image_size=10, error_rate=0.5, seed=3) as server:
+            with get_engine_class('sync')(directory=self.directory.name, api_url=server.api_url,
+                                          rate_limit=None, retry_backoff=0, retries=1) as downloader:
+                downloader.make_download()
+        metrics = downloader.metrics
+        self.assertGreater(metrics.get_counter('xkcd_retries_total', reason=503), 0)
+        self.assertGreater(metrics.get_counter('xkcd_request_failures_total', status_code=503), 0)
+        self.assertEqual(metrics.get_counter('xkcd_comics_failed_total'),
+                         metrics.get_counter('xkcd_request_failures_total', status_code=503))
+
+    def test_watch_polls_with_conditional_requests_and_downloads_new_comics(self):
+        with FakeXkcdServer(comic_count=3, image_size=10) as server:
+            downloader = get_engine_class('sync')(directory=self.directory.name, api_url=server.api_url,
+                                                  rate_limit=None, watch_interval=0.02)
+            watcher = threading.Thread(target=downloader.watch)
+            watcher.start()
+            try:
+                self._wait_for(lambda: downloader.get_count_of_comic_downloads == 3)
+                polls = downloader.metrics.get_counter('xkcd_responses_total', status_code=304)
+                self._wait_for(lambda: downloader.metrics.get_counter(
+                    'xkcd_responses_total', status_code=304) >= polls + 3)
+                # One 200 for the first poll, then a metadata and an image request per comic.
+                self.assertEqual(downloader.metrics.get_counter('xkcd_responses_total', status_code=200), 7)
+                server.comic_count = 5
+                self._wait_for(lambda: downloader.get_count_of_comic_downloads == 5)
+            finally:
+                downloader.request_stop()
+                watcher.join()
+                downloader.close()
+        self.assertEqual(downloader.metrics.get_counter('xkcd_responses_total', status_code=200), 12)
+
+    def test_workers_share_the_lease_queue_and_take_over_leases_of_a_crashed_worker(self):
+        lease_queue_file = f'{self.directory.name}/leases.sqlite3'
+        settings = {'directory': self.directory.name, 'api_url': self.server.api_url, 'rate_limit': None,
+                    'lease_queue_file': lease_queue_file, 'lease_batch_size': 2, 'lease_seconds': 0.3}
+        with get_engine_class('sync')(worker_id='crashed', **settings) as crashed_worker:
+            crashed_worker._get_lease_queue().add(range(1, self.server.comic_count + 1))
+            crashed_worker._get_lease_queue().claim('crashed', 3)
+        workers = [get_engine_class(engine)(worker_id=engine, **settings) for engine in ['sync', 'async']]
+        threads = [threading.Thread(target=worker.make_download) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for worker in workers:
+            worker.close()
+        downloads = sum(worker.get_count_of_comic_downloads for worker in workers)
+        self.assertEqual(downloads, self.server.comic_count)
+        self.assertEqual(len([name for name in os.listdir(self.directory.name) if name.endswith('.png')]),
+                         self.server.comic_count)
+
+    def _wait_for(self, condition, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
+class TestRunScenario(unittest.TestCase):
+    def test_report_throughput_latency_and_bytes(self):
+        with FakeXkcdServer(comic_count=5, image_size=200) as server:
+            result = run_scenario('async', server.api_url, {'rate_limit': None, 'concurrency': 2})
+        self.assertEqual(result['comics_downloaded'], 5)
+        self.assertEqual(result['bytes_written'], 5 * 200)
+        self.assertGreater(result['comics_per_second'], 0)
+        self.assertLessEqual(result['latency_p50_seconds'], result['latency_p99_seconds'])
+        logging.disable(logging.NOTSET)
+
+    def test_percentile_interpolates_between_values(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(percentile([5], 99), 5)
+        self.assertIsNone(percentile([], 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from src.http_cache import HttpCache
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'http_cache.sqlite3')
+        self.cache = HttpCache(self.path, max_size_bytes=1024)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_get_returns_stored_validators_and_body(self):
+        self.cache.store('https://xkcd.com/info.0.json', etag='"abc"', last_modified='Mon, 01 Jan 2024',
+                         body=b'{"num": 1}')
+        entry = self.cache.get('https://xkcd.com/info.0.json')
+        self.assertEqual(entry['etag'], '"abc"')
+        self.assertEqual(entry['last_modified'], 'Mon, 01 Jan 2024')
+        self.assertEqual(entry['body'], b'{"num": 1}')
+        self.assertIsNone(entry['stored_name'])
+
+    def test_get_returns_none_for_unknown_url(self):
+        self.assertIsNone(self.cache.get('https://xkcd.com/1/info.0.json'))
+
+    def test_evict_least_recently_used_entries_when_size_exceeds_limit(self):
+        for comic_id in range(1, 4):
+            self.cache.store(f'https://xkcd.com/{comic_id}/info.0.json', etag='"e"', body=b'x' * 150)
+        self.cache.get('https://xkcd.com/1/info.0.json')
+        self.cache.store('https://xkcd.com/4/info.0.json', etag='"e"', body=b'x' * 150)
+        self.assertIsNotNone(self.cache.get('https://xkcd.com/1/info.0.json'))
+        self.assertIsNone(self.cache.get('https://xkcd.com/2/info.0.json'))
+        self.assertLessEqual(self.cache.total_size, self.cache.max_size_bytes)
+
+    def test_not_store_entry_larger_than_limit(self):
+        self.cache.store('https://xkcd.com/info.0.json', etag='"e"', body=b'x' * 2048)
+        self.assertIsNone(self.cache.get('https://xkcd.com/info.0.json'))
+        self.assertEqual(self.cache.total_size, 0)
+
+    def test_total_size_is_restored_after_reopening(self):
+        self.cache.store('https://xkcd.com/info.0.json', etag='"e"', body=b'x' * 100)
+        total_size = self.cache.total_size
+        self.cache.close()
+        self.cache = HttpCache(self.path, max_size_bytes=1024)
+        self.assertEqual(self.cache.total_size, total_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import logging
+import threading
+import unittest
+
+from src.log import ComicSampler, StructuredFormatter, configure_logging, logger, stop_logging
+
+
+class ThreadRecordingValue:
+    def __init__(self) -> None:
+        self.formatted_in = []
+
+    def __str__(self) -> str:
+        self.formatted_in.append(threading.current_thread().name)
+        return 'value'
+
+
+class TestStructuredFormatter(unittest.TestCase):
+    def test_append_structured_fields(self):
+        record = logging.LogRecord('xkcd', logging.INFO, __file__, 1, 'Comic id: %s saved', (7,), None)
+        record.comic_id = 7
+        record.bytes = 1024
+        record.duration = 0.25
+        formatter = StructuredFormatter('%(levelname)s %(message)s')
+        self.assertEqual(formatter.format(record),
+                         'INFO Comic id: 7 saved comic_id=7 bytes=1024 duration=0.250')
+
+    def test_keep_message_without_fields(self):
+        record = logging.LogRecord('xkcd', logging.INFO, __file__, 1, 'Watch stopped', (), None)
+        self.assertEqual(StructuredFormatter('%(message)s').format(record), 'Watch stopped')
+
+
+class TestComicSampler(unittest.TestCase):
+    def _create_record(self, level: int, comic_id: int = None) -> logging.LogRecord:
+        record = logging.LogRecord('xkcd', level, __file__, 1, 'message', (), None)
+        if comic_id is not None:
+            record.comic_id = comic_id
+        return record
+
+    def test_sample_info_lines_of_a_fraction_of_the_comics(self):
+        sampler = ComicSampler(0.1)
+        kept = [comic_id for comic_id in range(1, 10001)
+                if sampler.filter(self._create_record(logging.INFO, comic_id))]
+        self.assertAlmostEqual(len(kept) / 10000, 0.1, delta=0.01)
+        self.assertEqual(kept, [comic_id for comic_id in range(1, 10001)
+                                if sampler.filter(self._create_record(logging.INFO, comic_id))])
+
+    def test_keep_warnings_and_lines_without_comic(self):
+        sampler = ComicSampler(0)
+        self.assertTrue(sampler.filter(self._create_record(logging.WARNING, 1)))
+        self.assertTrue(sampler.filter(self._create_record(logging.INFO)))
+        self.assertFalse(sampler.filter(self._create_record(logging.INFO, 1)))
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def tearDown(self):
+        stop_logging()
+        logger.setLevel(logging.NOTSET)
+
+    def test_format_and_write_records_on_the_listener_thread(self):
+        stream = io.StringIO()
+        configure_logging('INFO', stream=stream)
+        value = ThreadRecordingValue()
+        logger.info('Comic id: %s, title: %s', 1, value, extra={'comic_id': 1, 'phase': 'metadata'})
+        logger.debug('Not written %s', value)
+        stop_logging()
+        self.assertTrue(stream.getvalue().endswith('Comic id: 1, title: value comic_id=1 phase=metadata\n'))
+        self.assertEqual(len(value.formatted_in), 1)
+        self.assertNotEqual(value.formatted_in[0], threading.current_thread().name)
+
+    def test_configure_again_replaces_the_handler(self):
+        first_stream = io.StringIO()
+        second_stream = io.StringIO()
+        configure_logging('INFO', stream=first_stream)
+        configure_logging('WARNING', stream=second_stream)
+        logger.info('Skipped')
+        logger.warning('Written once')
+        stop_logging()
+        self.assertEqual(first_stream.getvalue(), '')
+        self.assertEqual(second_stream.getvalue().count('Written once'), 1)
+        self.assertEqual(len(logger.handlers), 0)
+        self.assertTrue(logger.propagate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.metadata_catalog import MetadataCatalog
+
+
+class TestMetadataCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'catalog.sqlite3')
+        self.catalog = MetadataCatalog(self.path)
+        self.metadata = {
+            comic_id: {'num': comic_id, 'title': title, 'img': f'https://imgs.xkcd.com/comics/{comic_id}.png',
+                       'year': '2006', 'month': month, 'day': day, 'alt': 'alt text'}
+            for comic_id, title, month, day in [(123, 'Centrifugal Force', '6', '9'),
+                                                (124, 'Blogofractal', '6', '12'),
+                                                (125, 'Force 100%', '6', '14')]}
+        for comic_id, metadata in self.metadata.items():
+            self.catalog.record(comic_id, metadata)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.directory.cleanup()
+
+    def test_get_returns_complete_metadata(self):
+        self.assertEqual(self.catalog.get(123), self.metadata[123])
+        self.assertEqual(self.catalog.get_img_url(124), 'https://imgs.xkcd.com/comics/124.png')
+        self.assertIsNone(self.catalog.get(1))
+        self.assertIsNone(self.catalog.get_img_url(1))
+
+    def test_contains_len_and_comic_ids(self):
+        self.assertIn(123, self.catalog)
+        self.assertNotIn(1, self.catalog)
+        self.assertEqual(len(self.catalog), 3)
+        self.assertEqual(self.catalog.get_comic_ids(), [123, 124, 125])
+
+    def test_find_by_title_ignores_case_and_escapes_wildcards(self):
+        self.assertEqual([metadata['num'] for metadata in self.catalog.find_by_title('force')], [123, 125])
+        self.assertEqual([metadata['num'] for metadata in self.catalog.find_by_title('100%')], [125])
+        self.assertEqual([metadata['num'] for metadata in self.catalog.find_by_title('_')], [])
+        self.assertEqual(list(self.catalog.find_by_title('centrifugal force', exact=True)),
+                         [self.metadata[123]])
+
+    def test_find_by_date_and_date_range(self):
+        self.assertEqual([metadata['num'] for metadata in self.catalog.find_by_date('2006-06-12')], [124])
+        self.assertEqual([metadata['num'] for metadata in self.catalog.find_by_date(
+            datetime.date(2006, 6, 10), datetime.date(2006, 6, 30))], [124, 125])
+
+    def test_find_loads_records_lazily(self):
+        for comic_id in range(1, 201):
+            self.catalog.record(comic_id, {'num': comic_id, 'title': f'Comic {comic_id}'})
+        results = self.catalog.find_by_title('comic')
+        self.assertEqual(next(results)['num'], 1)
+        self.assertEqual(len(list(results)), 199)
+
+    def test_record_replaces_metadata_and_persists_after_reopening(self):
+        self.catalog.record(123, dict(self.metadata[123], title='Centrifugal'))
+        self.catalog.close()
+        self.catalog = MetadataCatalog(self.path)
+        self.assertEqual(self.catalog.get(123)['title'], 'Centrifugal')
+        self.assertEqual(len(self.catalog), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from src.metrics import Histogram, MetricsRegistry
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe_counts_values_in_cumulative_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 3.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.to_dict(), {'count': 4, 'sum': 3.65, 'min': 0.05, 'max': 3.0,
+                                               'buckets': {'0.1': 2, '1.0': 3, '+Inf': 4}})
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry(buckets=(0.5,))
+
+    def test_counters_are_kept_per_label_set(self):
+        self.metrics.increment('xkcd_request_failures_total', status_code=503)
+        self.metrics.increment('xkcd_request_failures_total', status_code=503)
+        self.metrics.increment('xkcd_request_failures_total', status_code=404)
+        self.assertEqual(self.metrics.get_counter('xkcd_request_failures_total', status_code=503), 2)
+        self.assertEqual(self.metrics.get_counter('xkcd_request_failures_total', status_code=404), 1)
+        self.assertEqual(self.metrics.get_counter('xkcd_retries_total'), 0)
+
+    def test_track_in_flight_gauge(self):
+        with self.metrics.track_in_flight('xkcd_requests_in_flight'):
+            with self.metrics.track_in_flight('xkcd_requests_in_flight'):
+                self.assertEqual(self.metrics.get_gauge('xkcd_requests_in_flight'), 2)
+        self.assertEqual(self.metrics.get_gauge('xkcd_requests_in_flight'), 0)
+
+    def test_time_observes_duration_even_when_block_raises(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.time('xkcd_phase_duration_seconds', phase='metadata'):
+                raise ValueError
+        histogram = self.metrics.get_histogram('xkcd_phase_duration_seconds', phase='metadata')
+        self.assertEqual(histogram['count'], 1)
+
+    def test_increment_from_many_threads(self):
+        threads = [threading.Thread(target=lambda: [self.metrics.increment('xkcd_bytes_downloaded_total', 2)
+                                                    for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.metrics.get_counter('xkcd_bytes_downloaded_total'), 16000)
+
+    def test_prometheus_text_format(self):
+        self.metrics.increment('xkcd_comics_skipped_total', reason='not "an" image')
+        self.metrics.observe('xkcd_phase_duration_seconds', 0.25, phase='hash')
+        self.assertEqual(self.metrics.to_prometheus_text(), (
+            '# TYPE xkcd_comics_skipped_total counter\n'
+            'xkcd_comics_skipped_total{reason="not \\"an\\" image"} 1\n'
+            '# TYPE xkcd_phase_duration_seconds histogram\n'
+            'xkcd_phase_duration_seconds_bucket{phase="hash",le="0.5"} 1\n'
+            'xkcd_phase_duration_seconds_bucket{phase="hash",le="+Inf"} 1\n'
+            'xkcd_phase_duration_seconds_sum{phase="hash"} 0.25\n'
+            'xkcd_phase_duration_seconds_count{phase="hash"} 1\n'))
+
+    def test_write_json_summary(self):
+        self.metrics.increment('xkcd_comics_downloaded_total', 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            self.metrics.write_json(path)
+            with open(path) as metrics_file:
+                summary = json.load(metrics_file)
+            self.assertEqual(os.listdir(directory), ['metrics.json'])
+        self.assertEqual(summary, {'counters': {'xkcd_comics_downloaded_total': 3}, 'gauges': {},
+                                   'histograms': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import tempfile
+import threading
+import unittest
+
+from src.pipeline_downloader import PipelineStage, PipelineXkcdDownloader
+from src.xkcd_downloader import SpooledImage
+from unittest.mock import patch
+
+
+class TestPipelineStage(unittest.TestCase):
+    def test_raises_value_error_without_workers(self):
+        with self.assertRaises(ValueError):
+            PipelineStage('stage', lambda item: item, worker_count=0, queue_size=1)
+
+    def test_pass_results_to_next_stage_and_drop_none(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        first = PipelineStage('first', lambda item: (item * 10,) if item % 2 else None, 3, queue_size=2)
+        second = PipelineStage('second', collect, 2, queue_size=2)
+        first.start(second)
+        second.start()
+        for item in range(1, 11):
+            first.put(item)
+        first.close()
+        first.join()
+        second.join()
+        self.assertEqual(sorted(results), [10, 30, 50, 70, 90])
+        self.assertEqual(first.get_stats()['processed'], 10)
+        self.assertEqual(second.get_stats()['processed'], 5)
+
+    def test_keep_working_when_handler_raises(self):
+        stage = PipelineStage('stage', lambda item: 1 / item, 1, queue_size=4)
+        stage.start()
+        with self.assertLogs('xkcd') as captured_log:
+            for item in [0, 1, 2]:
+                stage.put(item)
+            stage.close()
+            stage.join()
+        self.assertEqual(captured_log.output[0], 'ERROR:xkcd:ZeroDivisionError in pipeline stage stage for '
+                                                 'item: (0,)')
+        self.assertEqual(stage.get_stats()['processed'], 3)
+
+    def test_bounded_queue_blocks_producer(self):
+        release = threading.Event()
+        stage = PipelineStage('stage', lambda item: release.wait(), 1, queue_size=1)
+        stage.start()
+        stage.put(1)
+        stage.put(2)
+        producer = threading.Thread(target=stage.put, args=(3,))
+        producer.start()
+        producer.join(timeout=0.1)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(stage.get_stats()['queue_depth'], 1)
+        release.set()
+        producer.join()
+        stage.close()
+        stage.join()
+
+
+class TestMakeDownloadMethod(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = PipelineXkcdDownloader(directory=self.directory.name, metadata_workers=4,
+                                               fetch_workers=4, persist_workers=2, queue_size=2)
+        self.max_index = 20
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._persist_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._fetch_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_image_comic_url')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_last_index_from_api')
+    def test_every_comic_goes_through_all_stages(self, mock_get_last_index, mock_get_image_comic_url,
+                                                 mock_fetch_image_file, mock_persist_image_file):
+        mock_get_last_index.return_value = self.max_index
+        mock_get_image_comic_url.side_effect = lambda comic_id: None if comic_id == 404 else f'url-{comic_id}'
+        mock_fetch_image_file.side_effect = lambda comic_id, url: SpooledImage(
+            str(comic_id), 'png', f'.tmp-{comic_id}', 1, {})
+        self.instance.make_download()
+        persisted = sorted(call.args[0] for call in mock_persist_image_file.call_args_list)
+        self.assertEqual(persisted, list(range(1, self.max_index + 1)))
+        mock_persist_image_file.assert_any_call(7, 'url-7', SpooledImage('7', 'png', '.tmp-7', 1, {}))
+        stats = {stats['stage']: stats for stats in self.instance.get_stage_stats()}
+        self.assertEqual([stats[stage]['processed'] for stage in ['metadata', 'fetch', 'persist']],
+                         [self.max_index] * 3)
+        self.assertEqual(stats['fetch']['queue_depth'], 0)
+
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._persist_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._fetch_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_image_comic_url')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_last_index_from_api')
+    def test_stages_overlap(self, mock_get_last_index, mock_get_image_comic_url, mock_fetch_image_file,
+                            mock_persist_image_file):
+        mock_get_last_index.return_value = self.max_index
+        first_comic_persisted = threading.Event()
+        overlapped = []
+
+        def resolve(comic_id):
+            # The last comic only resolves once the first one is persisted, which never happens if the
+            # stages run one after the other.
+            if comic_id == self.max_index:
+                overlapped.append(first_comic_persisted.wait(10))
+            return 'url'
+
+        mock_get_image_comic_url.side_effect = resolve
+        mock_fetch_image_file.return_value = 'image'
+        mock_persist_image_file.side_effect = (
+            lambda comic_id, *args: comic_id == 1 and first_comic_persisted.set())
+        self.instance.make_download()
+        self.assertEqual(overlapped, [True])
+
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._persist_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._fetch_image_file_for_comic')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_image_comic_url')
+    @patch('src.pipeline_downloader.PipelineXkcdDownloader._get_last_index_from_api')
+    def test_resolved_comics_finish_after_stop_is_requested(self, mock_get_last_index,
+                                                            mock_get_image_comic_url, mock_fetch_image_file,
+                                                            mock_persist_image_file):
+        mock_get_last_index.return_value = self.max_index
+
+        def resolve_and_stop(comic_id):
+            if comic_id == 3:
+                self.instance.request_stop()
+            return f'url-{comic_id}'
+
+        mock_get_image_comic_url.side_effect = resolve_and_stop
+        mock_fetch_image_file.side_effect = lambda comic_id, url: SpooledImage(
+            str(comic_id), 'png', f'.tmp-{comic_id}', 1, {})
+        self.instance.make_download()
+        resolved = sorted(call.args[0] for call in mock_get_image_comic_url.call_args_list)
+        persisted = sorted(call.args[0] for call in mock_persist_image_file.call_args_list)
+        self.assertLess(len(resolved), self.max_index)
+        self.assertEqual(persisted, resolved)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.progress_journal import ProgressJournal
+
+
+class TestProgressJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'progress.journal')
+        self.journal = ProgressJournal(self.path, sync_every=3, sync_interval=60)
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def test_replay_keeps_last_state_of_each_comic(self):
+        self.journal.record(1, ProgressJournal.FAILED, reason='image request failed')
+        self.journal.record(1, ProgressJournal.DONE, file_name='a.png')
+        self.journal.record(2, ProgressJournal.SKIPPED, reason='not an image')
+        self.journal.close()
+        self.journal = ProgressJournal(self.path)
+        self.assertEqual(self.journal.get(1), {'comic_id': 1, 'state': 'done', 'file_name': 'a.png'})
+        self.assertEqual(self.journal.get(2)['state'], 'skipped')
+        self.assertEqual(len(self.journal), 2)
+
+    def test_replay_drops_half_written_last_line(self):
+        self.journal.record(1, ProgressJournal.DONE, file_name='a.png')
+        self.journal.close()
+        with open(self.path, 'ab') as journal_file:
+            journal_file.write(b'{"comic_id":2,"sta')
+        self.journal = ProgressJournal(self.path)
+        self.journal.record(3, ProgressJournal.DONE, file_name='c.png')
+        self.journal.close()
+        self.journal = ProgressJournal(self.path)
+        self.assertEqual(sorted(self.journal.get_states()), [1, 3])
+
+    @patch('src.progress_journal.os.fsync')
+    def test_fsync_in_batches(self, mock_fsync):
+        for comic_id in range(1, 8):
+            self.journal.record(comic_id, ProgressJournal.DONE, file_name=f'{comic_id}.png')
+        self.assertEqual(mock_fsync.call_count, 2)
+        self.journal.close()
+        self.assertEqual(mock_fsync.call_count, 3)
+
+    def test_compact_superseded_lines_on_open(self):
+        for _ in range(5):
+            self.journal.record(1, ProgressJournal.FAILED, reason='image request failed')
+        self.journal.record(1, ProgressJournal.DONE, file_name='a.png')
+        self.journal.close()
+        self.journal = ProgressJournal(self.path)
+        with open(self.path, 'rb') as journal_file:
+            self.assertEqual(len(journal_file.readlines()), 1)
+        self.assertEqual(self.journal.get(1)['state'], 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
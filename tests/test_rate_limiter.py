@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from src.rate_limiter import AimdLimiter, HostRateController, TokenBucket, parse_retry_after
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_returns_seconds(self):
+        self.assertEqual(parse_retry_after('7'), 7.0)
+
+    def test_returns_seconds_until_http_date(self):
+        retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(retry_at), 30, delta=2)
+
+    def test_returns_none_for_missing_or_invalid_value(self):
+        for value in [None, '', 'soon']:
+            self.assertIsNone(parse_retry_after(value))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_allow_burst_then_limit_to_rate(self):
+        bucket = TokenBucket(rate=50, capacity=5)
+        start = time.monotonic()
+        for _ in range(10):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 * 0.9)
+
+    def test_block_for_delays_next_acquire(self):
+        bucket = TokenBucket(rate=None, capacity=1)
+        bucket.block_for(0.1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class TestAimdLimiter(unittest.TestCase):
+    def test_increase_limit_by_one_per_window_of_healthy_responses(self):
+        limiter = AimdLimiter(initial_limit=4, latency_threshold=1.0)
+        for _ in range(3):
+            limiter.record_success(0.1)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(2):
+            limiter.record_success(0.1)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_not_increase_limit_when_latency_is_above_threshold(self):
+        limiter = AimdLimiter(initial_limit=4, latency_threshold=1.0)
+        for _ in range(10):
+            limiter.record_success(2.0)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_halve_limit_once_per_cooldown_on_throttle(self):
+        limiter = AimdLimiter(initial_limit=16, decrease_cooldown=60)
+        limiter.record_throttle()
+        limiter.record_throttle()
+        self.assertEqual(limiter.limit, 8)
+
+    def test_limit_stays_between_min_and_max(self):
+        limiter = AimdLimiter(initial_limit=2, min_limit=2, max_limit=3, decrease_cooldown=0)
+        limiter.record_throttle()
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(20):
+            limiter.record_success(0.0)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_acquire_blocks_when_limit_is_reached(self):
+        limiter = AimdLimiter(initial_limit=1)
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        waiter.join(timeout=0.05)
+        self.assertTrue(waiter.is_alive())
+        limiter.release()
+        waiter.join(timeout=1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class TestHostRateController(unittest.TestCase):
+    def test_record_throttle_cuts_limit_and_pauses_host(self):
+        controller = HostRateController(None, 1, AimdLimiter(initial_limit=8))
+        controller.record_throttle(0.1)
+        self.assertEqual(controller.aimd_limiter.limit, 4)
+        start = time.monotonic()
+        with controller:
+            pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(controller.aimd_limiter.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
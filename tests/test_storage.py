@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from src.storage import DirectoryStorage, PackStorage
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _create_temporary_file(self, content: bytes) -> tuple:
+        with tempfile.NamedTemporaryFile(dir=self.directory.name, prefix='.tmp-',
+                                         delete=False) as temporary_file:
+            temporary_file.write(content)
+        return f'{hashlib.md5(content).hexdigest()}.png', temporary_file.name
+
+
+class TestDirectoryStorage(StorageTestCase):
+    def test_store_moves_temporary_file_to_its_name(self):
+        storage = DirectoryStorage(self.directory.name)
+        name, temporary_file_path = self._create_temporary_file(b'xkcd comics')
+        storage.store(name, temporary_file_path)
+        self.assertTrue(storage.contains(name))
+        self.assertEqual(storage.read(name), b'xkcd comics')
+        self.assertEqual(storage.get_size(name), 11)
+        self.assertEqual(storage.list_names(), {name})
+
+    def test_sync_temporary_file_before_moving_it(self):
+        storage = DirectoryStorage(self.directory.name)
+        name, temporary_file_path = self._create_temporary_file(b'xkcd comics')
+        calls = []
+        with mock.patch('os.fsync', side_effect=lambda fd: calls.append(('fsync', os.fstat(fd).st_size))), \
+                mock.patch('os.replace', side_effect=lambda *paths: calls.append(('replace',) + paths)):
+            storage.store(name, temporary_file_path)
+        self.assertEqual(calls, [('fsync', 11),
+                                 ('replace', temporary_file_path, f'{self.directory.name}/{name}')])
+
+
+class TestPackStorage(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = PackStorage(self.directory.name, sync_every=2, sync_interval=60)
+
+    def tearDown(self):
+        self.storage.close()
+        super().tearDown()
+
+    def _pack_path(self) -> str:
+        return f'{self.directory.name}/{PackStorage.PACK_FILE_NAME}'
+
+    def test_store_appends_to_pack_and_reads_back(self):
+        stored = {}
+        for content in [b'first image', b'second image', b'third image']:
+            name, temporary_file_path = self._create_temporary_file(content)
+            self.storage.store(name, temporary_file_path)
+            stored[name] = content
+            self.assertFalse(os.path.exists(temporary_file_path))
+        self.assertEqual(self.storage.list_names(), set(stored))
+        for name, content in stored.items():
+            self.assertEqual(self.storage.read(name), content)
+            self.assertEqual(self.storage.get_size(name), len(content))
+        self.assertEqual(sorted(os.listdir(self.directory.name))[:2],
+                         [PackStorage.PACK_FILE_NAME, PackStorage.INDEX_FILE_NAME])
+
+    def test_same_name_is_stored_once(self):
+        for _ in range(2):
+            name, temporary_file_path = self._create_temporary_file(b'same image')
+            self.storage.store(name, temporary_file_path)
+        self.assertEqual(len(self.storage.list_names()), 1)
+        self.assertEqual(os.path.getsize(self._pack_path()),
+                         PackStorage.RECORD_HEADER.size + len(name) + len(b'same image'))
+
+    def test_index_is_committed_in_batches(self):
+        index = sqlite3.connect(f'{self.directory.name}/{PackStorage.INDEX_FILE_NAME}')
+        self.storage.store(*self._create_temporary_file(b'first image'))
+        self.assertEqual(index.execute('SELECT COUNT(*) FROM packed_files').fetchone()[0], 0)
+        self.storage.store(*self._create_temporary_file(b'second image'))
+        self.assertEqual(index.execute('SELECT COUNT(*) FROM packed_files').fetchone()[0], 2)
+        index.close()
+
+    def test_recover_records_whose_index_rows_were_lost(self):
+        name, temporary_file_path = self._create_temporary_file(b'unindexed image')
+        self.storage.store(name, temporary_file_path)
+        self.storage._pending.clear()
+        self.storage.close()
+        with open(self._pack_path(), 'ab') as pack_file:
+            pack_file.write(PackStorage.RECORD_HEADER.pack(PackStorage.RECORD_MAGIC, 36, 100) + b'torn')
+        self.storage = PackStorage(self.directory.name)
+        self.assertEqual(self.storage.read(name), b'unindexed image')
+        self.assertEqual(os.path.getsize(self._pack_path()),
+                         PackStorage.RECORD_HEADER.size + len(name) + len(b'unindexed image'))
+
+    def test_discarded_last_record_is_not_recovered_after_reopening(self):
+        kept_name, temporary_file_path = self._create_temporary_file(b'kept image')
+        self.storage.store(kept_name, temporary_file_path)
+        discarded_name, temporary_file_path = self._create_temporary_file(b'discarded image')
+        self.storage.store(discarded_name, temporary_file_path)
+        self.storage.discard(discarded_name)
+        self.storage.close()
+        self.storage = PackStorage(self.directory.name)
+        self.assertEqual(self.storage.list_names(), {kept_name})
+        name, temporary_file_path = self._create_temporary_file(b'discarded image')
+        self.storage.store(name, temporary_file_path)
+        self.assertEqual(self.storage.read(discarded_name), b'discarded image')
+
+    def test_export_writes_plain_files(self):
+        names = [self._create_temporary_file(content) for content in [b'first image', b'second image']]
+        for name, temporary_file_path in names:
+            self.storage.store(name, temporary_file_path)
+        output_directory = f'{self.directory.name}/exported'
+        self.assertEqual(self.storage.export(output_directory), 2)
+        self.assertEqual(self.storage.export(output_directory), 0)
+        for name, _ in names:
+            with open(f'{output_directory}/{name}', 'rb') as exported_file:
+                self.assertEqual(exported_file.read(), self.storage.read(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+
+from src.tracing import TraceRecorder, profile_run
+
+
+def busy_worker():
+    return sum(number * number for number in range(10000))
+
+
+class TestTraceRecorder(unittest.TestCase):
+    def test_nested_spans_inherit_comic_id(self):
+        tracer = TraceRecorder()
+        with tracer.span('image_fetch', 7):
+            with tracer.span('make_request', url='https://imgs.xkcd.com') as span_args:
+                span_args['status'] = 200
+        with tracer.span('make_request'):
+            pass
+        events = tracer.get_events()
+        self.assertEqual([(event['name'], event['args']) for event in events], [
+            ('make_request', {'url': 'https://imgs.xkcd.com', 'status': 200, 'comic_id': 7}),
+            ('image_fetch', {'comic_id': 7}),
+            ('make_request', {})])
+        self.assertLessEqual(events[1]['ts'], events[0]['ts'])
+        self.assertGreaterEqual(events[1]['dur'], events[0]['dur'])
+
+    def test_chrome_trace_names_every_thread(self):
+        tracer = TraceRecorder()
+        # All workers are alive at once, as in a pool, so no thread id is reused.
+        barrier = threading.Barrier(3)
+
+        def work(comic_id: int) -> None:
+            with tracer.span('persist', comic_id):
+                barrier.wait()
+
+        threads = [threading.Thread(target=work, args=(comic_id,), name=f'worker-{comic_id}')
+                   for comic_id in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        trace = tracer.to_chrome_trace()
+        thread_names = {event['tid']: event['args']['name'] for event in trace['traceEvents']
+                        if event['ph'] == 'M'}
+        spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual(sorted(thread_names.values()), ['worker-0', 'worker-1', 'worker-2'])
+        self.assertEqual({thread_names[event['tid']]: event['args']['comic_id'] for event in spans},
+                         {'worker-0': 0, 'worker-1': 1, 'worker-2': 2})
+
+    def test_drop_events_over_the_limit(self):
+        tracer = TraceRecorder(max_events=2)
+        for _ in range(5):
+            with tracer.span('make_request'):
+                pass
+        self.assertEqual(len(tracer.get_events()), 2)
+        self.assertEqual(tracer.dropped_events, 3)
+        self.assertEqual(tracer.to_chrome_trace()['otherData'], {'dropped_events': 3})
+
+
+class TestProfileRun(unittest.TestCase):
+    def test_merge_profiles_of_the_worker_threads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.pstats')
+            with profile_run(path):
+                thread = threading.Thread(target=busy_worker)
+                thread.start()
+                busy_worker()
+                thread.join()
+            calls = {function_name: stats[1]
+                     for (_, _, function_name), stats in pstats.Stats(path).stats.items()}
+        self.assertEqual(calls['busy_worker'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.comic_manifest import ComicManifest
+from src.progress_journal import ProgressJournal
+from src.storage import DirectoryStorage, PackStorage
+from src.verify import StoreProblem, StoreVerifier, hash_file
+
+
+class VerifyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifest = ComicManifest(f'{self.directory.name}/manifest.sqlite3')
+        self.journal = ProgressJournal(f'{self.directory.name}/progress.journal')
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.manifest.close()
+        self.journal.close()
+        self.directory.cleanup()
+
+    def _store(self, storage, comic_id: int, content: bytes, recorded: bool = True) -> str:
+        name = f'{hashlib.md5(content).hexdigest()}.png'
+        with tempfile.NamedTemporaryFile(dir=self.directory.name, prefix='.tmp-',
+                                         delete=False) as temporary_file:
+            temporary_file.write(content)
+        storage.store(name, temporary_file.name)
+        if recorded:
+            self.manifest.record(comic_id, f'https://imgs.xkcd.com/{comic_id}.png', name[:32], name,
+                                 len(content))
+        return name
+
+
+class TestHashFile(VerifyTestCase):
+    def test_hash_file_and_empty_file(self):
+        path = f'{self.directory.name}/image.png'
+        with open(path, 'wb') as image_file:
+            image_file.write(b'xkcd comics')
+        self.assertEqual(hash_file(path), (hashlib.md5(b'xkcd comics').hexdigest(), 11))
+        open(path, 'wb').close()
+        self.assertEqual(hash_file(path), (hashlib.md5().hexdigest(), 0))
+
+
+class TestVerifyDirectoryStorage(VerifyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = DirectoryStorage(self.directory.name)
+        self.intact_name = self._store(self.storage, 1, b'intact image')
+        self.corrupt_name = self._store(self.storage, 2, b'corrupt image')
+        self.truncated_name = self._store(self.storage, 3, b'truncated image')
+        self.orphaned_name = self._store(self.storage, 4, b'orphaned image', recorded=False)
+        self.missing_name = f'{hashlib.md5(b"missing image").hexdigest()}.png'
+        self.manifest.record(5, 'https://imgs.xkcd.com/5.png', self.missing_name[:32], self.missing_name, 13)
+        self.journal_name = f'{hashlib.md5(b"journal image").hexdigest()}.png'
+        self.journal.record(6, ProgressJournal.DONE, file_name=self.journal_name)
+        with open(f'{self.directory.name}/{self.corrupt_name}', 'r+b') as image_file:
+            image_file.write(b'C')
+        with open(f'{self.directory.name}/{self.truncated_name}', 'r+b') as image_file:
+            image_file.truncate(4)
+        with open(f'{self.directory.name}/leases.sqlite3', 'wb') as other_file:
+            other_file.write(b'not an image')
+
+    def _get_problems(self, report) -> list:
+        return sorted((problem.name, problem.problem) for problem in report.problems)
+
+    def test_report_corrupt_truncated_orphaned_and_missing_files(self):
+        report = StoreVerifier(self.storage, self.manifest, self.journal, workers=1).verify()
+        self.assertEqual(report.checked, 4)
+        self.assertIn(StoreProblem(self.truncated_name, 'truncated', '4 of 15 bytes'), report.problems)
+        self.assertEqual(self._get_problems(report), sorted([
+            (self.corrupt_name, 'corrupt'), (self.truncated_name, 'truncated'),
+            (self.orphaned_name, 'orphaned'), (self.missing_name, 'missing'),
+            (self.journal_name, 'missing')]))
+        self.assertEqual(report.quarantined, [])
+
+    def test_hash_batches_in_a_process_pool(self):
+        with mock.patch.object(StoreVerifier, 'BATCH_SIZE', 1):
+            report = StoreVerifier(self.storage, self.manifest, self.journal, workers=2).verify()
+        single_process_report = StoreVerifier(self.storage, self.manifest, self.journal, workers=1).verify()
+        self.assertEqual(report, single_process_report)
+
+    def test_quarantine_moves_bad_files_out_of_the_store(self):
+        quarantine_directory = f'{self.directory.name}/quarantine'
+        verifier = StoreVerifier(self.storage, self.manifest, self.journal, workers=1)
+        report = verifier.verify(quarantine_directory)
+        self.assertEqual(sorted(report.quarantined),
+                         sorted([self.corrupt_name, self.truncated_name, self.orphaned_name]))
+        self.assertEqual(sorted(os.listdir(quarantine_directory)), sorted(report.quarantined))
+        self.assertTrue(self.storage.contains(self.intact_name))
+        self.assertFalse(self.storage.contains(self.corrupt_name))
+        report = StoreVerifier(self.storage, self.manifest, self.journal, workers=1).verify()
+        self.assertEqual(report.checked, 1)
+        self.assertEqual({problem.problem for problem in report.problems}, {'missing'})
+
+
+class TestVerifyPackStorage(VerifyTestCase):
+    def test_report_and_quarantine_corrupt_record(self):
+        storage = PackStorage(self.directory.name)
+        intact_name = self._store(storage, 1, b'intact image')
+        corrupt_name = self._store(storage, 2, b'corrupt image')
+        storage.sync()
+        offset, _ = storage.get_records()[corrupt_name]
+        with open(storage.pack_path, 'r+b') as pack_file:
+            pack_file.seek(offset)
+            pack_file.write(b'C')
+        quarantine_directory = f'{self.directory.name}/quarantine'
+        report = StoreVerifier(storage, self.manifest, self.journal, workers=1).verify(quarantine_directory)
+        self.assertEqual(report.checked, 2)
+        self.assertEqual([(problem.name, problem.problem) for problem in report.problems],
+                         [(corrupt_name, 'corrupt')])
+        with open(f'{quarantine_directory}/{corrupt_name}', 'rb') as quarantined_file:
+            self.assertEqual(quarantined_file.read(), b'Corrupt image')
+        self.assertTrue(storage.contains(intact_name))
+        self.assertFalse(storage.contains(corrupt_name))
+        storage.close()
+        storage = PackStorage(self.directory.name)
+        self.assertEqual(storage.list_names(), {intact_name})
+        storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from src.work_queue import LeaseQueue, is_in_shard, parse_shard_spec
+
+
+class TestShardSpec(unittest.TestCase):
+    def test_parse_shard_spec(self):
+        for spec in ['2/4', '2 of 4', (2, 4)]:
+            self.assertEqual(parse_shard_spec(spec), (2, 4))
+
+    def test_raises_value_error_for_invalid_spec(self):
+        for spec in ['0/4', '5/4', 'two/4', '1/2/3', (3, 2)]:
+            with self.assertRaises(ValueError):
+                parse_shard_spec(spec)
+
+    def test_every_comic_belongs_to_exactly_one_shard(self):
+        for comic_id in range(1, 101):
+            shards = [index for index in range(1, 4) if is_in_shard(comic_id, (index, 3))]
+            self.assertEqual(len(shards), 1)
+        self.assertEqual([comic_id for comic_id in range(1, 10) if is_in_shard(comic_id, (2, 3))], [2, 5, 8])
+
+
+class TestLeaseQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'leases.sqlite3')
+        self.queue = LeaseQueue(self.path, lease_seconds=60)
+        self.queue.add(range(1, 11))
+
+    def tearDown(self):
+        self.queue.close()
+        self.directory.cleanup()
+
+    def test_claim_hands_out_each_comic_once(self):
+        self.assertEqual(self.queue.claim('a', 4), [1, 2, 3, 4])
+        self.assertEqual(self.queue.claim('b', 4), [5, 6, 7, 8])
+        self.assertEqual(self.queue.get_counts(), {'pending': 2, 'leased': 8, 'done': 0})
+
+    def test_add_keeps_leases_of_other_workers(self):
+        self.queue.claim('a', 3)
+        self.queue.add(range(1, 13))
+        self.assertEqual(self.queue.get_counts(), {'pending': 9, 'leased': 3, 'done': 0})
+        self.assertEqual(self.queue.claim('b', 3), [4, 5, 6])
+
+    def test_add_hands_out_again_comics_done_in_an_earlier_run(self):
+        self.queue.complete('a', self.queue.claim('a', 3))
+        self.queue.add([2])
+        self.assertEqual(self.queue.get_counts(), {'pending': 8, 'leased': 0, 'done': 2})
+        self.assertEqual(self.queue.claim('b', 1), [2])
+
+    def test_expired_lease_is_claimed_again(self):
+        self.queue.lease_seconds = -1
+        self.queue.claim('crashed', 3)
+        self.queue.lease_seconds = 60
+        self.assertEqual(self.queue.claim('b', 3), [1, 2, 3])
+        self.queue.complete('crashed', [1, 2, 3])
+        self.assertEqual(self.queue.get_counts()['done'], 0)
+
+    def test_heartbeat_keeps_lease(self):
+        self.queue.lease_seconds = 0.05
+        self.queue.claim('a', 3)
+        time.sleep(0.03)
+        self.assertEqual(self.queue.heartbeat('a'), 3)
+        time.sleep(0.03)
+        self.assertEqual(self.queue.claim('b', 3), [4, 5, 6])
+
+    def test_release_returns_comics_to_the_queue(self):
+        self.queue.release('a', self.queue.claim('a', 2))
+        self.assertEqual(self.queue.claim('b', 2), [1, 2])
+
+    def test_concurrent_workers_never_claim_the_same_comic(self):
+        self.queue.add(range(11, 501))
+        claimed = []
+        lock = threading.Lock()
+
+        def work(owner):
+            queue = LeaseQueue(self.path)
+            while True:
+                comic_ids = queue.claim(owner, 7)
+                if not comic_ids:
+                    break
+                with lock:
+                    claimed.extend(comic_ids)
+                queue.complete(owner, comic_ids)
+            queue.close()
+
+        workers = [threading.Thread(target=work, args=(f'worker-{number}',)) for number in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(claimed), list(range(1, 501)))
+
+
+if __name__ == '__main__':
+    unittest.main()
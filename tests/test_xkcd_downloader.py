@@ -1,9 +1,16 @@
+import io
 import os
 import requests
+import signal
+import tempfile
+import threading
+import time
 import unittest
 
 from requests.exceptions import HTTPError, Timeout, ConnectionError, InvalidURL
+from src.download_plan import DownloadPlan, PlannedComic
 from src.xkcd_downloader import XkcdDownloader
+from unittest import mock
 from unittest.mock import patch, mock_open
 
 
@@ -19,6 +26,24 @@ class DubleRequests:
     def json(self):
         return self._json
 
+    def iter_content(self, chunk_size: int = 1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class TestInitMethod(unittest.TestCase):
+    def test_settings_override_class_attributes_on_instance(self):
+        instance = XkcdDownloader(timeout=3)
+        self.assertEqual(instance.TIMEOUT, 3)
+        self.assertEqual(XkcdDownloader.TIMEOUT, 10)
+
+    def test_raises_type_error_for_unknown_setting(self):
+        with self.assertRaises(TypeError):
+            XkcdDownloader(not_a_setting=1)
+
 
 class TesteCreateDirectoryMethod(unittest.TestCase):
     def setUp(self):
@@ -38,18 +63,18 @@ class TesteCreateDirectoryMethod(unittest.TestCase):
     @patch('os.mkdir')
     def test_displays_especific_log_msg_when_directory_has_been_created(self, mock_mkdir):
         mock_mkdir.side_effect = None
-        with self.assertLogs() as captured_log:
+        with self.assertLogs('xkcd') as captured_log:
             self.instance._create_directory()
-        self.assertEqual(captured_log.output[0], f'INFO:root:The directory: "{self.instance.DIRECTORY}/" '
+        self.assertEqual(captured_log.output[0], f'INFO:xkcd:The directory: "{self.instance.DIRECTORY}/" '
                                                  'has been created')
 
     @patch('os.mkdir')
     def test_displays_especific_log_msg_when_directory_alredy_exists(self, mock_mkdir):
         mock_mkdir.side_effect = FileExistsError
         self.instance._create_directory()
-        with self.assertLogs() as captured_log:
+        with self.assertLogs('xkcd') as captured_log:
             self.instance._create_directory()
-        self.assertEqual(captured_log.output[0], f'INFO:root:The directory: "{self.instance.DIRECTORY}/" '
+        self.assertEqual(captured_log.output[0], f'INFO:xkcd:The directory: "{self.instance.DIRECTORY}/" '
                                                  'alredy exists')
 
     @patch('os.mkdir')
@@ -57,10 +82,10 @@ class TesteCreateDirectoryMethod(unittest.TestCase):
         exceptions = [OSError, PermissionError, FileNotFoundError]
         for expt in exceptions:
             mock_mkdir.side_effect = expt
-            with self.assertLogs() as captured_log:
+            with self.assertLogs('xkcd') as captured_log:
                 with self.assertRaises(SystemExit):
                     self.instance._create_directory()
-            self.assertEqual(captured_log.output[0], f'ERROR:root:{expt.__name__} when create directory '
+            self.assertEqual(captured_log.output[0], f'ERROR:xkcd:{expt.__name__} when create directory '
                                                      f'"{self.instance.DIRECTORY}/"')
 
 
@@ -68,131 +93,418 @@ class TestCreateFileInLocalStorageMethod(unittest.TestCase):
     def setUp(self):
         self.instance = XkcdDownloader()
         self.file_name = 'test_file.bin'
-        self.file_content = b'test binary content'
+        self.temporary_file_path = f'{self.instance.DIRECTORY}/.tmp-test_file'
         self.info_log_msg = 'Lorem ipsum'
         self.error_log_msg = 'Dolor sit amet'
+        # The directory storage syncs the temporary file before moving it.
+        open(self.temporary_file_path, 'wb').close()
+        self.addCleanup(self.instance._remove_temporary_file, self.temporary_file_path)
 
-    @patch('builtins.open', new_callable=mock_open())
-    def test_call_open_and_write_with_correct_arguments(self, mock_open):
-        self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+    @patch('os.replace')
+    def test_call_replace_with_correct_arguments(self, mock_replace):
+        self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
                                                     self.info_log_msg, self.error_log_msg)
-        mock_open.assert_called_once_with(f'{self.instance.DIRECTORY}/test_file.bin', 'wb')
-        mock_open.return_value.__enter__().write.assert_called_once_with(self.file_content)
+        mock_replace.assert_called_once_with(self.temporary_file_path,
+                                             f'{self.instance.DIRECTORY}/test_file.bin')
 
     def test_create_file_in_local_storage(self):
         self.instance.DIRECTORY = '.'
-        self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+        with open('.tmp-test_file', 'wb') as temporary_file:
+            temporary_file.write(b'test binary content')
+        self.instance._create_file_in_local_storage(self.file_name, '.tmp-test_file',
                                                     self.info_log_msg, self.error_log_msg)
         self.assertTrue(os.path.isfile(self.file_name))
+        self.assertFalse(os.path.isfile('.tmp-test_file'))
         os.remove(f'{self.instance.DIRECTORY}/{self.file_name}')
 
-    @patch('builtins.open', new_callable=mock_open())
-    def test_display_especific_log_msg_when_file_has_been_created(self, mock_open):
-        mock_open.side_effect = None
-        with self.assertLogs() as captured_log:
-            self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+    @patch('os.replace')
+    def test_display_especific_log_msg_when_file_has_been_created(self, mock_replace):
+        mock_replace.side_effect = None
+        with self.assertLogs('xkcd') as captured_log:
+            self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
                                                         self.info_log_msg, self.error_log_msg)
-        self.assertEqual(captured_log.output[0], f'INFO:root:{self.info_log_msg}')
+        self.assertEqual(captured_log.output[0], f'INFO:xkcd:{self.info_log_msg}')
 
-    @patch('builtins.open', new_callable=mock_open())
-    def test_display_especific_log_msg_when_exceptions_are_raised(self, mock_open):
+    @patch('os.replace')
+    def test_display_especific_log_msg_when_exceptions_are_raised(self, mock_replace):
         known_execptions = [IsADirectoryError, PermissionError, FileNotFoundError]
         for exeption in known_execptions:
-            mock_open.side_effect = exeption
-            with self.assertLogs() as captured_log:
-                self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+            mock_replace.side_effect = exeption
+            open(self.temporary_file_path, 'wb').close()
+            with self.assertLogs('xkcd') as captured_log:
+                self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
                                                             self.info_log_msg, self.error_log_msg)
-            self.assertEqual(captured_log.output[0], f'ERROR:root:{exeption.__name__} {self.error_log_msg}')
+            self.assertEqual(captured_log.output[0], f'ERROR:xkcd:{exeption.__name__} {self.error_log_msg}')
 
-    @patch('builtins.open', new_callable=mock_open())
-    def test_increment_count_of_comic_downloads_attribute_when_file_has_been_saved(self, mock_open):
-        mock_open.side_effect = None
-        self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+    @patch('os.replace', side_effect=PermissionError)
+    def test_remove_temporary_file_when_to_save_file_fails(self, mock_replace):
+        self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
+                                                    self.info_log_msg, self.error_log_msg)
+        self.assertFalse(os.path.isfile(self.temporary_file_path))
+
+    @patch('os.replace')
+    def test_increment_count_of_comic_downloads_attribute_when_file_has_been_saved(self, mock_replace):
+        mock_replace.side_effect = None
+        self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
                                                     self.info_log_msg, self.error_log_msg)
         self.assertEqual(1, self.instance._count_of_comic_downloads)
 
-    @patch('builtins.open', new_callable=mock_open())
-    def test_not_increment_count_of_comic_downloads_attribute_when_to_save_file_fails(self, mock_open):
-        mock_open.side_effect = Exception
-        self.instance._create_file_in_local_storage(self.file_name, self.file_content,
+    @patch('os.replace')
+    def test_not_increment_count_of_comic_downloads_attribute_when_to_save_file_fails(self, mock_replace):
+        mock_replace.side_effect = Exception
+        self.instance._create_file_in_local_storage(self.file_name, self.temporary_file_path,
                                                     self.info_log_msg, self.error_log_msg)
         self.assertEqual(0, self.instance._count_of_comic_downloads)
 
 
 class TestMakeRequestMethod(unittest.TestCase):
     def setUp(self):
-        self.instance = XkcdDownloader()
+        self.instance = XkcdDownloader(retries=0)
         self.test_url = 'https://www.xkcd.com'
         self.except_log_msg = 'Lorem ipsum'
 
-    @patch('requests.get')
-    def test_call_requests_get_with_correct_arguments(self, mock_requests):
+    @patch('requests.Session.get')
+    def test_call_session_get_with_correct_arguments(self, mock_requests):
         self.instance._make_request(self.test_url, self.except_log_msg)
         mock_requests.assert_called_once_with(self.test_url, headers=self.instance.HEADERS,
-                                              timeout=self.instance.TIMEOUT)
+                                              timeout=self.instance.TIMEOUT, stream=False)
+
+    @patch('requests.Session.get')
+    def test_call_session_get_with_timeout_configured_for_host(self, mock_requests):
+        self.instance.HOSTS_CONFIG = {'www.xkcd.com': {'timeout': 42}}
+        self.instance._make_request(self.test_url, self.except_log_msg)
+        mock_requests.assert_called_once_with(self.test_url, headers=self.instance.HEADERS, timeout=42,
+                                              stream=False)
 
-    @patch('requests.get', return_value=requests.models.Response())
+    @patch('requests.Session.get', return_value=requests.models.Response())
     def test_returns_requests_instance_when_http_response_is_sucesful(self, mock_requests):
         response = self.instance._make_request(self.test_url, self.except_log_msg)
         self.assertIsInstance(response, requests.models.Response)
 
-    @patch('requests.get', return_value=requests.models.Response())
+    @patch('requests.Session.get', return_value=requests.models.Response())
     def test_display_especific_log_msg_when_exceptions_are_raised(self, mock_requests):
         known_exeptions = [HTTPError, Timeout, ConnectionError, InvalidURL]
         for exception in known_exeptions:
             mock_requests.side_effect = exception
-            with self.assertLogs() as captured_log:
+            with self.assertLogs('xkcd') as captured_log:
                 self.instance._make_request(self.test_url, self.except_log_msg)
-            self.assertEqual(captured_log.output[0], f'ERROR:root:{exception.__name__} '
+            self.assertEqual(captured_log.output[0], f'ERROR:xkcd:{exception.__name__} '
                                                      f'{self.except_log_msg}')
 
 
-class TestGetMd5FromFileMethod(unittest.TestCase):
+class TestHttpCacheInMakeRequestMethod(unittest.TestCase):
     def setUp(self):
-        self.instance = XkcdDownloader()
-        self.content_to_md5 = [[b'phrase to test MD5 generator method', 'ebdda56737bb8d7e5c1e056a48c4aacc'],
-                               [b'xkcd comics', '733050eabfd65f2120a5ec201273a369']]
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
+        self.url = 'https://xkcd.com/info.0.json'
+        self.body = b'{"num": 123}'
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    def _response(self, status_code: int, headers: dict = {}, content: bytes = b''):
+        response = requests.models.Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response.raw = io.BytesIO(content)
+        return response
+
+    @patch('requests.Session.get')
+    def test_store_validators_and_body_of_json_responses(self, mock_requests):
+        mock_requests.return_value = self._response(
+            200, {'Content-Type': 'application/json', 'ETag': '"v1"'}, self.body)
+        self.instance._make_request(self.url, 'Lorem ipsum')
+        entry = self.instance._get_http_cache().get(self.url)
+        self.assertEqual((entry['etag'], entry['body']), ('"v1"', self.body))
+
+    @patch('requests.Session.get')
+    def test_send_validators_and_restore_body_when_response_is_not_modified(self, mock_requests):
+        self.instance._get_http_cache().store(self.url, etag='"v1"', last_modified='Mon, 01 Jan 2024',
+                                              body=self.body)
+        mock_requests.return_value = self._response(304)
+        response = self.instance._make_request(self.url, 'Lorem ipsum')
+        headers = mock_requests.call_args.kwargs['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(headers['If-Modified-Since'], 'Mon, 01 Jan 2024')
+        self.assertEqual(response.json(), {'num': 123})
+
+    @patch('requests.Session.get')
+    def test_not_send_validators_for_image_whose_file_is_gone(self, mock_requests):
+        img_url = 'https://imgs.xkcd.com/comics/centrifugal_force.png'
+        self.instance._get_http_cache().store(img_url, etag='"v1"', stored_name='missing.png')
+        mock_requests.return_value = self._response(200)
+        self.instance._make_request(img_url, 'Lorem ipsum')
+        self.assertNotIn('If-None-Match', mock_requests.call_args.kwargs['headers'])
+
+    @patch('requests.Session.get')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_record_unchanged_image_in_manifest_without_downloading_it(self, mock_get_image_comic_url,
+                                                                        mock_requests):
+        img_url = 'https://imgs.xkcd.com/comics/centrifugal_force.png'
+        img_name_file = '733050eabfd65f2120a5ec201273a369.png'
+        with open(f'{self.directory.name}/{img_name_file}', 'wb') as img_file:
+            img_file.write(b'xkcd comics')
+        self.instance._get_http_cache().store(img_url, etag='"v1"', stored_name=img_name_file)
+        mock_get_image_comic_url.return_value = img_url
+        mock_requests.return_value = self._response(304)
+        self.instance._download_image_file_for_comic(123)
+        self.assertEqual(mock_requests.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+        self.assertEqual(self.instance._get_manifest().get(123)['file_name'], img_name_file)
+        self.assertEqual(self.instance.get_count_of_comic_downloads, 0)
+
+
+class TestThrottlingInMakeRequestMethod(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name, retries=2, retry_backoff=0)
+        self.url = 'https://imgs.xkcd.com/comics/centrifugal_force.png'
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    def _response(self, status_code: int, headers: dict = {}):
+        response = requests.models.Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response.raw = io.BytesIO(b'')
+        return response
+
+    @patch('requests.Session.get')
+    def test_retry_throttled_request_after_retry_after(self, mock_requests):
+        mock_requests.side_effect = [self._response(429, {'Retry-After': '0.05'}), self._response(200)]
+        with self.assertLogs('xkcd') as captured_log, patch('time.sleep') as mock_sleep:
+            response = self.instance._make_request(self.url, 'Lorem ipsum')
+        mock_sleep.assert_any_call(0.05)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(captured_log.output[0], 'WARNING:xkcd:Error 429 Lorem ipsum, retrying in 0.1s')
+
+    @patch('requests.Session.get')
+    def test_return_throttled_response_when_retries_are_exhausted(self, mock_requests):
+        mock_requests.side_effect = [self._response(503) for _ in range(3)]
+        response = self.instance._make_request(self.url, 'Lorem ipsum')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_requests.call_count, 3)
+
+    @patch('requests.Session.get')
+    def test_cut_host_concurrency_limit_on_throttling(self, mock_requests):
+        mock_requests.side_effect = [self._response(429), self._response(200)]
+        self.instance._make_request(self.url, 'Lorem ipsum')
+        limiter = self.instance._get_rate_controller(self.url).aimd_limiter
+        self.assertLess(limiter.limit, self.instance.AIMD_INITIAL_LIMIT)
+
+    @patch('requests.Session.get')
+    def test_hold_the_host_slot_until_a_streamed_body_is_read(self, mock_requests):
+        response = self._response(200)
+        response.raw = io.BytesIO(b'image body')
+        mock_requests.return_value = response
+        rate_controller = self.instance._get_rate_controller(self.url)
+        with patch.object(rate_controller, 'record_success') as mock_record_success:
+            response = self.instance._make_request(self.url, 'Lorem ipsum', stream=True)
+            self.assertEqual(rate_controller.aimd_limiter.in_flight, 1)
+            self.assertEqual(self.instance.metrics.get_gauge('xkcd_requests_in_flight'), 1)
+            self.assertEqual(b''.join(response.iter_content(chunk_size=4)), b'image body')
+            mock_record_success.assert_not_called()
+            response.close()
+            mock_record_success.assert_called_once()
+            response.close()
+        self.assertEqual(rate_controller.aimd_limiter.in_flight, 0)
+        self.assertEqual(self.instance.metrics.get_gauge('xkcd_requests_in_flight'), 0)
+
+    @patch('requests.Session.get')
+    def test_streamed_body_closed_before_its_end_is_not_a_success(self, mock_requests):
+        response = self._response(200)
+        response.raw = io.BytesIO(b'image body')
+        mock_requests.return_value = response
+        rate_controller = self.instance._get_rate_controller(self.url)
+        with patch.object(rate_controller, 'record_success') as mock_record_success:
+            self.instance._make_request(self.url, 'Lorem ipsum', stream=True).close()
+        mock_record_success.assert_not_called()
+        self.assertEqual(rate_controller.aimd_limiter.in_flight, 0)
+
+    def test_rate_controllers_are_per_host(self):
+        self.assertIs(self.instance._get_rate_controller(self.url),
+                      self.instance._get_rate_controller('https://imgs.xkcd.com/comics/other.png'))
+        self.assertIsNot(self.instance._get_rate_controller(self.url),
+                         self.instance._get_rate_controller('https://xkcd.com/info.0.json'))
 
-    def test_returns_md5_from_binary_content(self):
-        for content in self.content_to_md5:
-            self.assertEqual(self.instance._get_md5_from_file(content[0]), content[1])
+
+class TestRetriesInMakeRequestMethod(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name, retries=2, retry_backoff=0.01)
+        self.url = 'https://xkcd.com/info.0.json'
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    @patch('requests.Session.get')
+    def test_retry_transient_exceptions(self, mock_requests):
+        response = requests.models.Response()
+        response.status_code = 200
+        mock_requests.side_effect = [Timeout, ConnectionError, response]
+        with self.assertLogs('xkcd') as captured_log:
+            self.assertIs(self.instance._make_request(self.url, 'Lorem ipsum'), response)
+        self.assertTrue(captured_log.output[0].startswith('WARNING:xkcd:Timeout Lorem ipsum, retrying in'))
+        self.assertEqual(mock_requests.call_count, 3)
+
+    @patch('requests.Session.get', side_effect=InvalidURL)
+    def test_not_retry_permanent_exceptions(self, mock_requests):
+        with self.assertLogs('xkcd') as captured_log:
+            self.assertIsNone(self.instance._make_request(self.url, 'Lorem ipsum'))
+        self.assertEqual(captured_log.output, ['ERROR:xkcd:InvalidURL Lorem ipsum'])
+        self.assertEqual(mock_requests.call_count, 1)
+
+    @patch('requests.Session.get')
+    def test_retry_server_errors_but_not_client_errors(self, mock_requests):
+        for status_code, expected_calls in [(502, 3), (404, 1)]:
+            mock_requests.reset_mock()
+            response = requests.models.Response()
+            response.status_code = status_code
+            response.raw = io.BytesIO(b'')
+            mock_requests.side_effect = None
+            mock_requests.return_value = response
+            self.assertEqual(self.instance._make_request(self.url, 'Lorem ipsum').status_code, status_code)
+            self.assertEqual(mock_requests.call_count, expected_calls)
+
+    @patch('random.uniform', side_effect=lambda low, high: high)
+    def test_retry_delay_grows_exponentially_up_to_maximum(self, mock_uniform):
+        self.instance.RETRY_BACKOFF_MAX = 0.03
+        delays = [self.instance._get_retry_delay(attempt) for attempt in range(3)]
+        self.assertEqual(delays, [0.01, 0.02, 0.03])
+
+
+class TestFailedComicsQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name, retries=0)
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    def test_record_failed_comic_in_manifest(self, mock_make_request):
+        mock_make_request.return_value = DubleRequests(503)
+        self.instance._download_image_file_for_comic(7)
+        mock_make_request.return_value = None
+        self.instance._download_image_file_for_comic(7)
+        failure = self.instance._get_manifest().get_failures()[7]
+        self.assertEqual((failure['reason'], failure['attempts']), ('request to xkcd API failed', 2))
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    def test_retry_failed_comics_downloads_only_failed_ids(self, mock_download_img_file):
+        self.instance._record_failed_comic(3, 'HTTP 503 from xkcd API')
+        self.instance._record_failed_comic(9, 'image request failed')
+        self.instance.retry_failed_comics()
+        self.assertEqual([call.args[0] for call in mock_download_img_file.call_args_list], [3, 9])
+
+    def test_successful_download_removes_comic_from_failed_queue(self):
+        self.instance._record_failed_comic(3, 'image request failed')
+        self.instance._get_manifest().record(3, 'https://imgs.xkcd.com/comics/a.png', 'a' * 32,
+                                             f'{"a" * 32}.png', 1)
+        self.assertEqual(self.instance._get_manifest().get_failed_comic_ids(), [])
+
+
+class TestGetSessionMethod(unittest.TestCase):
+    def setUp(self):
+        self.instance = XkcdDownloader(hosts_config={'imgs.xkcd.com': {'pool_maxsize': 3, 'max_retries': 5}})
+
+    def tearDown(self):
+        self.instance.close()
+
+    def test_reuse_session_in_the_same_thread(self):
+        self.assertIs(self.instance._get_session(), self.instance._get_session())
+
+    def test_threads_get_own_session_sharing_the_same_adapters(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.instance._get_session()))
+        thread.start()
+        thread.join()
+        main_session = self.instance._get_session()
+        self.assertIsNot(sessions[0], main_session)
+        url = 'https://imgs.xkcd.com/comics/centrifugal_force.png'
+        self.assertIs(sessions[0].get_adapter(url), main_session.get_adapter(url))
+
+    def test_mount_adapter_configured_for_host(self):
+        session = self.instance._get_session()
+        adapter = session.get_adapter('https://imgs.xkcd.com/comics/centrifugal_force.png')
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.total, 5)
+        default_adapter = session.get_adapter('https://xkcd.com/info.0.json')
+        self.assertEqual(default_adapter._pool_maxsize, self.instance.POOL_MAXSIZE)
+        self.assertEqual(default_adapter.max_retries.total, self.instance.MAX_RETRIES)
+
+    def test_close_discards_sessions(self):
+        session = self.instance._get_session()
+        self.instance.close()
+        self.assertIsNot(session, self.instance._get_session())
 
 
 class TestSaveComicImgFileInLocalStorageMethod(unittest.TestCase):
     def setUp(self):
         self.instance = XkcdDownloader()
         self.name_img_file = 'img_test.png'
-        self.img_file_content = b'content img file'
+        self.temporary_file_path = f'{self.instance.DIRECTORY}/.tmp-img_test'
         self.comic_id = 136
 
     @patch('src.xkcd_downloader.XkcdDownloader._create_directory')
     @patch('os.path.isfile', return_value=True)
     def test_call_isfile_with_correct_argument(self, mock_isfile, mock_create_directory):
-        self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.img_file_content,
+        self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.temporary_file_path,
                                                             self.comic_id)
         mock_isfile.assert_called_once_with(f'{self.instance.DIRECTORY}/{self.name_img_file}')
 
     @patch('src.xkcd_downloader.XkcdDownloader._create_file_in_local_storage')
     @patch('os.path.isfile', return_value=False)
     def test_call_create_directory_with_correct_argument(self, mock_isfile, mock_create_directory):
-        info_log_msg = f'Comic id: {self.comic_id} has been saved with name: {self.name_img_file}'
-        error_log_msg = (f'when save file image for comic id: {self.comic_id} '
-                         f'with name: {self.name_img_file}')
-        self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.img_file_content,
+        self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.temporary_file_path,
                                                             self.comic_id)
-        mock_create_directory.assert_called_once_with(file_name=self.name_img_file,
-                                                      file_content=self.img_file_content,
-                                                      info_log_msg=info_log_msg, error_log_msg=error_log_msg)
+        mock_create_directory.assert_called_once_with(
+            file_name=self.name_img_file, temporary_file_path=self.temporary_file_path,
+            info_log_msg='Comic id: %s has been saved with name: %s',
+            error_log_msg='when save file image for comic id: %s with name: %s', comic_id=self.comic_id)
 
     @patch('src.xkcd_downloader.XkcdDownloader._create_file_in_local_storage')
     @patch('os.path.isfile', return_value=True)
     def test_display_log_message_when_file_returns_true(self, mock_isfile, mock_create_file_in_local):
-        with self.assertLogs() as captured_log:
-            self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.img_file_content,
+        with self.assertLogs('xkcd') as captured_log:
+            self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.temporary_file_path,
                                                                 self.comic_id)
-        self.assertEqual(captured_log.output[0], f'INFO:root:File of Comic id: {self.comic_id} alredy exits '
+        self.assertEqual(captured_log.output[0], f'INFO:xkcd:File of Comic id: {self.comic_id} alredy exits '
                                                  f'with name: {self.name_img_file}')
 
+    @patch('os.path.isfile', return_value=True)
+    def test_remove_temporary_file_when_file_alredy_exists(self, mock_isfile):
+        open(self.temporary_file_path, 'wb').close()
+        self.instance._save_comic_img_file_in_local_storage(self.name_img_file, self.temporary_file_path,
+                                                            self.comic_id)
+        self.assertFalse(os.path.exists(self.temporary_file_path))
+
+
+    def test_concurrent_writers_of_the_same_image_leave_one_complete_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            instance = XkcdDownloader(directory=directory)
+            content = os.urandom(256 * 1024)
+            temporary_file_paths = []
+            for _ in range(8):
+                with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-',
+                                                 delete=False) as temporary_file:
+                    temporary_file.write(content)
+                temporary_file_paths.append(temporary_file.name)
+            writers = [threading.Thread(target=instance._save_comic_img_file_in_local_storage,
+                                        args=(self.name_img_file, temporary_file_path, self.comic_id))
+                       for temporary_file_path in temporary_file_paths]
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+            self.assertEqual(os.listdir(directory), [self.name_img_file])
+            with open(f'{directory}/{self.name_img_file}', 'rb') as img_file:
+                self.assertEqual(img_file.read(), content)
+
 
 class TestContentIsAImageMethod(unittest.TestCase):
     def setUp(self):
@@ -209,13 +521,18 @@ class TestContentIsAImageMethod(unittest.TestCase):
 
 class TestGetImageComicUrlMethod(unittest.TestCase):
     def setUp(self):
-        self.instance = XkcdDownloader()
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
         self.comic_id = 123
         self.url = f'{self.instance.API_URL[0]}{self.comic_id}{self.instance.API_URL[1]}'
         self.log_message = f'in request comic id: {self.comic_id} from xkcd API'
         self.json = {"img": "https://imgs.xkcd.com/comics/centrifugal_force.png",
                      "title": "Centrifugal Force"}
 
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
     @patch('src.xkcd_downloader.XkcdDownloader._make_request', return_value=None)
     def test_call_make_request_with_correct_arguments(self, mock_make_request):
         self.instance._get_image_comic_url(self.comic_id)
@@ -227,13 +544,29 @@ class TestGetImageComicUrlMethod(unittest.TestCase):
         url_returned = self.instance._get_image_comic_url(self.comic_id)
         self.assertEqual(url_returned, 'https://imgs.xkcd.com/comics/centrifugal_force.png')
 
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    def test_parse_response_once_and_record_metadata_in_catalog(self, mock_make_request):
+        response = DubleRequests(200, json=self.json)
+        response.json = mock.Mock(return_value=self.json)
+        mock_make_request.return_value = response
+        self.instance._get_image_comic_url(self.comic_id)
+        response.json.assert_called_once_with()
+        self.assertEqual(self.instance._get_catalog().get(self.comic_id), self.json)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    def test_return_url_from_catalog_without_request(self, mock_make_request):
+        self.instance._get_catalog().record(self.comic_id, self.json)
+        url_returned = self.instance._get_image_comic_url(self.comic_id)
+        self.assertEqual(url_returned, 'https://imgs.xkcd.com/comics/centrifugal_force.png')
+        mock_make_request.assert_not_called()
+
     @patch('src.xkcd_downloader.XkcdDownloader._make_request')
     def test_display_especific_log_msg_when_status_code_is_not_200(self, mock_make_request):
         list_status_code = [403, 404, 500]
         for status_code in list_status_code:
-            expected_log_msg = (f'WARNING:root:Error {status_code} in xkcd API request from '
+            expected_log_msg = (f'WARNING:xkcd:Error {status_code} in xkcd API request from '
                                 f'comic id: {self.comic_id}')
-            with self.assertLogs() as captured_log:
+            with self.assertLogs('xkcd') as captured_log:
                 mock_make_request.return_value = DubleRequests(status_code)
                 self.instance._get_image_comic_url(self.comic_id)
                 self.assertEqual(captured_log.output[0], expected_log_msg)
@@ -241,7 +574,8 @@ class TestGetImageComicUrlMethod(unittest.TestCase):
 
 class TesteDownloadImageFileForComicMethod(unittest.TestCase):
     def setUp(self):
-        self.instance = XkcdDownloader()
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
         self.comic_id = 123
         self.comic_img_url = 'https://imgs.xkcd.com/comics/centrifugal_force.png'
         self.headers_not_img = {"Content-Type": "text/"}
@@ -252,6 +586,10 @@ class TesteDownloadImageFileForComicMethod(unittest.TestCase):
         extencion = self.headers_img['Content-Type'][6:]
         self.file_name = f'{self.file_md5}.{extencion}'
 
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
     @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url', return_value=None)
     def test_call_get_comic_id_with_correct_arguments(self, mock_get_image_comic_url):
         self.instance._download_image_file_for_comic(self.comic_id)
@@ -263,7 +601,8 @@ class TesteDownloadImageFileForComicMethod(unittest.TestCase):
         mock_get_image_comic_url.return_value = self.comic_img_url
         self.instance._download_image_file_for_comic(self.comic_id)
         mock_make_request.assert_called_once_with(url=self.comic_img_url,
-                                                  except_log_message=self.except_log_msg)
+                                                  except_log_message=self.except_log_msg, stream=True,
+                                                  attempts=mock.ANY)
 
     @patch('src.xkcd_downloader.XkcdDownloader._content_is_a_image', return_value=False)
     @patch('src.xkcd_downloader.XkcdDownloader._make_request')
@@ -275,31 +614,153 @@ class TesteDownloadImageFileForComicMethod(unittest.TestCase):
         self.instance._download_image_file_for_comic(self.comic_id)
         mock_content_is_a_image.assert_called_once_with(self.headers_not_img)
 
+    def _image_response(self, body_error: Exception = None) -> requests.models.Response:
+        response = requests.models.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'image/png'
+        response.raw = io.BytesIO(self.file_content)
+        if body_error is not None:
+            response.raw.read = mock.Mock(side_effect=[self.file_content[:4], body_error])
+        return response
+
+    @patch('requests.Session.get')
+    def test_request_and_stream_retries_share_one_budget(self, mock_requests):
+        self.instance.RETRIES = 2
+        self.instance.RETRY_BACKOFF = 0
+        broken_stream = requests.exceptions.ChunkedEncodingError
+        for responses, stored in [([ConnectionError, self._image_response(broken_stream),
+                                    self._image_response()], True),
+                                  ([ConnectionError, self._image_response(broken_stream),
+                                    self._image_response(broken_stream), self._image_response()], False)]:
+            with self.subTest(stored=stored), self.assertLogs('xkcd'):
+                mock_requests.reset_mock()
+                mock_requests.side_effect = responses
+                spooled_image = self.instance._fetch_image_file_for_comic(self.comic_id, self.comic_img_url)
+                self.assertEqual(mock_requests.call_count, 3)
+                self.assertEqual(spooled_image is not None, stored)
+                if spooled_image is not None:
+                    self.instance._remove_temporary_file(spooled_image.temporary_file_path)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._get_manifest')
     @patch('src.xkcd_downloader.XkcdDownloader._save_comic_img_file_in_local_storage')
     @patch('src.xkcd_downloader.XkcdDownloader._content_is_a_image', return_value=True)
     @patch('src.xkcd_downloader.XkcdDownloader._make_request')
     @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
     def test_call__save_comic_img_file_in_local_storage_with_correct_arguments(
         self, mock_get_image_comic_url, moc_make_request, mock_content_is_a_image,
-        mock_save_comic_img_file_in_local_storage
+        mock_save_comic_img_file_in_local_storage, mock_get_manifest
        ):
         mock_get_image_comic_url.return_value = self.comic_img_url
         moc_make_request.return_value = DubleRequests(status_code=200, headers=self.headers_img,
                                                       content=self.file_content)
         self.instance._download_image_file_for_comic(self.comic_id)
-        mock_save_comic_img_file_in_local_storage.assert_called_once_with(self.file_name, self.file_content,
-                                                                          self.comic_id)
+        save_call_args = mock_save_comic_img_file_in_local_storage.call_args.args
+        name_img_file, temporary_file_path, comic_id = save_call_args
+        self.assertEqual((name_img_file, comic_id), (self.file_name, self.comic_id))
+        self.assertEqual(os.path.dirname(temporary_file_path), self.directory.name)
+        with open(temporary_file_path, 'rb') as temporary_file:
+            self.assertEqual(temporary_file.read(), self.file_content)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_stream_image_into_file_named_by_md5(self, mock_get_image_comic_url, mock_make_request):
+        self.instance.CHUNK_SIZE = 4
+        mock_get_image_comic_url.return_value = self.comic_img_url
+        mock_make_request.return_value = DubleRequests(status_code=200, headers=self.headers_img,
+                                                       content=self.file_content)
+        self.instance._download_image_file_for_comic(self.comic_id)
+        bookkeeping_files = (self.instance.MANIFEST_FILE_NAME, self.instance.HTTP_CACHE_FILE_NAME,
+                             self.instance.JOURNAL_FILE_NAME)
+        stored_files = [name for name in os.listdir(self.directory.name)
+                        if not name.startswith(bookkeeping_files)]
+        self.assertEqual(stored_files, [self.file_name])
+        with open(f'{self.directory.name}/{self.file_name}', 'rb') as img_file:
+            self.assertEqual(img_file.read(), self.file_content)
+        self.assertEqual(self.instance.get_count_of_comic_downloads, 1)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_remove_temporary_file_when_stream_is_interrupted(self, mock_get_image_comic_url,
+                                                              mock_make_request):
+        response = DubleRequests(status_code=200, headers=self.headers_img, content=self.file_content)
+
+        def interrupted_stream(chunk_size):
+            yield self.file_content[:4]
+            raise ConnectionError
+
+        response.iter_content = interrupted_stream
+        mock_get_image_comic_url.return_value = self.comic_img_url
+        mock_make_request.return_value = response
+        self.instance.RETRY_BACKOFF = 0
+        with self.assertLogs('xkcd') as captured_log:
+            self.instance._download_image_file_for_comic(self.comic_id)
+        self.assertEqual(captured_log.output[-1], 'ERROR:xkcd:ConnectionError when download image file '
+                                                  f'for comic id: {self.comic_id}')
+        self.assertEqual(mock_make_request.call_count, self.instance.RETRIES + 1)
+        self.assertEqual([name for name in os.listdir(self.directory.name)
+                          if name.startswith(self.instance.TEMPORARY_FILE_PREFIX)], [])
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_retry_image_whose_stream_breaks_partway(self, mock_get_image_comic_url, mock_make_request):
+        broken_response = DubleRequests(status_code=200, headers=self.headers_img,
+                                        content=self.file_content)
+
+        def broken_stream(chunk_size):
+            yield self.file_content[:4]
+            raise requests.exceptions.ChunkedEncodingError
+
+        broken_response.iter_content = broken_stream
+        mock_get_image_comic_url.return_value = self.comic_img_url
+        complete_response = DubleRequests(status_code=200, headers=self.headers_img,
+                                          content=self.file_content)
+        mock_make_request.side_effect = [broken_response, complete_response]
+        self.instance.RETRY_BACKOFF = 0
+        with self.assertLogs('xkcd') as captured_log:
+            self.instance._download_image_file_for_comic(self.comic_id)
+        self.assertTrue(captured_log.output[0].startswith('WARNING:xkcd:ChunkedEncodingError while streaming '
+                                                          f'image for comic id: {self.comic_id}, retrying'))
+        self.assertEqual(mock_make_request.call_count, 2)
+        self.assertEqual([name for name in os.listdir(self.directory.name)
+                          if name.startswith(self.instance.TEMPORARY_FILE_PREFIX) or name.endswith('.png')],
+                         [self.file_name])
+        with open(f'{self.directory.name}/{self.file_name}', 'rb') as img_file:
+            self.assertEqual(img_file.read(), self.file_content)
+        self.assertEqual(self.instance._get_manifest().get_failed_comic_ids(), [])
+        self.assertEqual(self.instance.metrics.get_counter('xkcd_retries_total',
+                                                           reason='ChunkedEncodingError'), 1)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._get_manifest')
+    @patch('src.xkcd_downloader.XkcdDownloader._save_comic_img_file_in_local_storage')
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_record_comic_in_manifest_when_file_is_stored(self, mock_get_image_comic_url, mock_make_request,
+                                                          mock_save_comic_img_file_in_local_storage,
+                                                          mock_get_manifest):
+        mock_get_image_comic_url.return_value = self.comic_img_url
+        mock_make_request.return_value = DubleRequests(status_code=200, headers=self.headers_img,
+                                                       content=self.file_content)
+        for stored in [True, False]:
+            mock_get_manifest.reset_mock()
+            mock_save_comic_img_file_in_local_storage.return_value = stored
+            self.instance._download_image_file_for_comic(self.comic_id)
+            os.remove(mock_save_comic_img_file_in_local_storage.call_args.args[1])
+            if stored:
+                mock_get_manifest().record.assert_called_once_with(
+                    self.comic_id, self.comic_img_url, self.file_md5, self.file_name, len(self.file_content))
+            else:
+                mock_get_manifest().record.assert_not_called()
 
     @patch('src.xkcd_downloader.XkcdDownloader._content_is_a_image', return_value=False)
     @patch('src.xkcd_downloader.XkcdDownloader._make_request')
     @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
     def test_display_specific_log_msg_when_response_is_not_a_image(self, mock_get_image_comic_url,
                                                                    moc_make_request, mock_content_is_a_image):
-        expected_log_msg = f'INFO:root:The file for comic id: {self.comic_id} is not a image'
+        expected_log_msg = f'INFO:xkcd:The file for comic id: {self.comic_id} is not a image'
         mock_get_image_comic_url.return_value = self.comic_img_url
         moc_make_request.return_value = DubleRequests(status_code=200, headers=self.headers_not_img)
         self.instance._download_image_file_for_comic(self.comic_id)
-        with self.assertLogs() as captured_log:
+        with self.assertLogs('xkcd') as captured_log:
             self.instance._download_image_file_for_comic(self.comic_id)
         self.assertEqual(captured_log.output[0], expected_log_msg)
 
@@ -310,9 +771,9 @@ class TesteDownloadImageFileForComicMethod(unittest.TestCase):
         list_status_code = [403, 404, 500]
         for status_code in list_status_code:
             mock_make_request.return_value = DubleRequests(status_code=status_code)
-            expected_log_msg = f'WARNING:root:Error {status_code} in request for comic id: {self.comic_id}'
+            expected_log_msg = f'WARNING:xkcd:Error {status_code} in request for comic id: {self.comic_id}'
             mock_get_image_comic_url.return_value = self.comic_img_url
-            with self.assertLogs() as captured_log:
+            with self.assertLogs('xkcd') as captured_log:
                 self.instance._download_image_file_for_comic(self.comic_id)
             self.assertEqual(captured_log.output[0], expected_log_msg)
 
@@ -338,8 +799,8 @@ class TesteGetLastIndexFromApiMethod(unittest.TestCase):
     @patch('src.xkcd_downloader.XkcdDownloader._make_request', return_value=None)
     def test_display_specific_log_msg_when_response_get_status_code_200(self, mock_make_request):
         mock_make_request.return_value = DubleRequests(status_code=200, json=self.json)
-        expected_log_msg = 'INFO:root:Last comic index (comic id): 123'
-        with self.assertLogs() as captured_log:
+        expected_log_msg = 'INFO:xkcd:Last comic index (comic id): 123'
+        with self.assertLogs('xkcd') as captured_log:
             self.instance._get_last_index_from_api()
         self.assertEqual(captured_log.output[0], expected_log_msg)
 
@@ -348,9 +809,9 @@ class TesteGetLastIndexFromApiMethod(unittest.TestCase):
         list_status_code = [403, 404, 500]
         for status_code in list_status_code:
             mock_make_request.return_value = DubleRequests(status_code=status_code)
-            expected_log_msg = (f'WARNING:root:Error {status_code} when getting last comic index '
+            expected_log_msg = (f'WARNING:xkcd:Error {status_code} when getting last comic index '
                                 'from xkcd API')
-            with self.assertLogs() as captured_log:
+            with self.assertLogs('xkcd') as captured_log:
                 with self.assertRaises(SystemExit):
                     self.instance._get_last_index_from_api()
             self.assertEqual(captured_log.output[0], expected_log_msg)
@@ -371,6 +832,244 @@ class TestMakeDownloadMethod(unittest.TestCase):
         mock_download_img_file.call_args_list == self.args_list
 
 
+class TestGetPendingComicIdsMethod(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
+        self.instance._get_manifest().record(1, 'https://imgs.xkcd.com/comics/a.png', 'a' * 32,
+                                             f'{"a" * 32}.png', 1)
+        self.instance._get_manifest().record(2, 'https://imgs.xkcd.com/comics/b.png', 'b' * 32,
+                                             f'{"b" * 32}.png', 1)
+        open(f'{self.directory.name}/{"a" * 32}.png', 'wb').close()
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    def test_skip_comics_in_manifest_whose_file_exists(self):
+        self.assertEqual(self.instance._get_pending_comic_ids(4), [2, 3, 4])
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=1)
+    def test_make_download_does_not_request_known_comics(self, mock_get_last_index, mock_download_img_file):
+        self.instance.make_download()
+        mock_download_img_file.assert_not_called()
+
+
+class TestPlanDownload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name, rate_limit=10, plan_bandwidth=1000,
+                                       plan_sample_size=0)
+        self.img_url = 'https://imgs.xkcd.com/comics/a.png'
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    @patch('requests.Session.head')
+    def test_head_request_without_validators(self, mock_head):
+        self.instance._get_http_cache().store(self.img_url, etag='"v1"', body=b'image')
+        mock_head.return_value = DubleRequests(200, headers={'Content-Length': '2048',
+                                                             'Content-Type': 'image/png'})
+        self.assertEqual(self.instance._head_image_file_for_comic(1, self.img_url), (2048, 'image/png'))
+        mock_head.assert_called_once_with(self.img_url, headers=self.instance.HEADERS,
+                                          timeout=self.instance.HOSTS_CONFIG['imgs.xkcd.com']['timeout'],
+                                          allow_redirects=True)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request', return_value=DubleRequests(404))
+    def test_failed_head_request_leaves_size_unknown_without_recording_a_failure(self, mock_make_request):
+        self.assertEqual(self.instance._head_image_file_for_comic(1, self.img_url), (None, None))
+        self.assertEqual(self.instance._get_manifest().get_failed_comic_ids(), [])
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=3)
+    def test_head_only_the_images_of_catalogued_comics(self, mock_get_last_index, mock_make_request):
+        self.instance._get_catalog().record(2, {'title': 'Two', 'img': self.img_url})
+        self.instance._get_journal().record(3, 'skipped', reason='not an image')
+        mock_make_request.return_value = DubleRequests(200, headers={'Content-Length': '2048',
+                                                                     'Content-Type': 'image/png'})
+        plan = self.instance.plan_download()
+        self.assertEqual(plan.comics, [PlannedComic(1, None, None, None),
+                                       PlannedComic(2, self.img_url, 2048, 'image/png')])
+        self.assertEqual(mock_make_request.call_args.kwargs['method'], 'HEAD')
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request', return_value=DubleRequests(503))
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=3)
+    def test_failed_metadata_samples_leave_the_run_state_unchanged(self, mock_get_last_index,
+                                                                   mock_make_request):
+        self.instance.PLAN_SAMPLE_SIZE = 3
+        plan = self.instance.plan_download()
+        self.assertEqual(mock_make_request.call_count, 3)
+        self.assertEqual(plan.comics, [PlannedComic(comic_id, None, None, None) for comic_id in [1, 2, 3]])
+        self.assertEqual(self.instance._get_manifest().get_failed_comic_ids(), [])
+        self.assertEqual(self.instance._get_journal().get_states(), {})
+        self.assertEqual(os.path.getsize(f'{self.directory.name}/{self.instance.JOURNAL_FILE_NAME}'), 0)
+
+    def test_estimate_unknown_sizes_from_the_known_ones(self):
+        plan = DownloadPlan(self.instance.API_URL[0], 1, 4, [
+            PlannedComic(1, self.img_url, 3000, 'image/png'),
+            PlannedComic(2, None, None, None),
+            PlannedComic(3, self.img_url, 1000, 'image/png'),
+            PlannedComic(4, self.img_url, 500, 'text/html'),
+        ], time.time())
+        summary = self.instance.get_plan_summary(plan)
+        self.assertEqual(summary['comics to download'], 4)
+        self.assertEqual(summary['comics not images'], 1)
+        self.assertEqual(summary['metadata requests'], 1)
+        self.assertEqual(summary['estimated bytes'], 6000)
+        self.assertEqual(summary['estimated seconds'], 6.0)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    def test_execute_only_the_comics_of_the_plan_not_done_since(self, mock_download_img_file):
+        self.instance._get_journal().record(5, 'skipped', reason='not an image')
+        plan = DownloadPlan(self.instance.API_URL[0], 1, 9,
+                            [PlannedComic(comic_id, None, None, None) for comic_id in [2, 5, 9]], time.time())
+        self.instance.execute_plan(plan)
+        self.assertEqual([call.args[0] for call in mock_download_img_file.call_args_list], [2, 9])
+
+    def test_refuse_a_plan_made_for_another_api(self):
+        with self.assertRaises(ValueError):
+            self.instance.execute_plan(DownloadPlan('http://localhost:8000/', 1, 1, [], time.time()))
+
+
+class TestResumeFromJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    def test_skip_comics_journaled_as_done_or_skipped(self):
+        open(f'{self.directory.name}/{"c" * 32}.png', 'wb').close()
+        self.instance._get_journal().record(1, 'skipped', reason='not an image')
+        self.instance._get_journal().record(2, 'done', file_name=f'{"c" * 32}.png')
+        self.instance._get_journal().record(3, 'done', file_name=f'{"d" * 32}.png')
+        self.instance._record_failed_comic(4, 'image request failed')
+        self.instance.close()
+        self.instance = XkcdDownloader(directory=self.directory.name)
+        self.assertEqual(self.instance._get_pending_comic_ids(5), [3, 4, 5])
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    def test_journal_comic_that_does_not_exist_as_skipped(self, mock_make_request):
+        mock_make_request.return_value = DubleRequests(404)
+        self.instance._get_image_comic_url(404)
+        self.assertEqual(self.instance._get_journal().get(404)['state'], 'skipped')
+        self.assertEqual(self.instance._get_manifest().get_failed_comic_ids(), [])
+
+    def test_remove_only_stale_temporary_files(self):
+        stale_path = f'{self.directory.name}/{self.instance.TEMPORARY_FILE_PREFIX}stale'
+        fresh_path = f'{self.directory.name}/{self.instance.TEMPORARY_FILE_PREFIX}fresh'
+        for path in [stale_path, fresh_path]:
+            open(path, 'wb').close()
+        stale_time = time.time() - self.instance.STALE_TEMPORARY_FILE_AGE - 1
+        os.utime(stale_path, (stale_time, stale_time))
+        self.instance._remove_stale_temporary_files()
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertTrue(os.path.exists(fresh_path))
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=6)
+    def test_high_water_mark_stops_at_first_comic_not_reached(self, mock_get_last_index,
+                                                              mock_download_img_file):
+        mock_download_img_file.side_effect = lambda comic_id: comic_id != 4 and (
+            self.instance._record_skipped_comic(comic_id, 'not an image'))
+        self.instance.make_download()
+        self.assertEqual(self.instance._get_manifest().get_high_water_mark(), 3)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=5)
+    def test_incremental_run_retries_a_comic_that_failed_earlier(self, mock_get_last_index,
+                                                                 mock_download_img_file):
+        self.instance.INCREMENTAL = True
+        mock_download_img_file.side_effect = lambda comic_id: (
+            self.instance._record_failed_comic(comic_id, 'HTTP 503 from image request') if comic_id == 3
+            else self.instance._record_skipped_comic(comic_id, 'not an image'))
+        self.instance.make_download()
+        self.assertEqual(self.instance._get_manifest().get_high_water_mark(), 2)
+        mock_download_img_file.reset_mock()
+        mock_download_img_file.side_effect = lambda comic_id: self.instance._record_skipped_comic(
+            comic_id, 'not an image')
+        self.instance.make_download()
+        self.assertEqual([call.args[0] for call in mock_download_img_file.call_args_list], [3])
+        self.assertEqual(self.instance._get_manifest().get_high_water_mark(), 5)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=9)
+    def test_incremental_mode_starts_after_high_water_mark(self, mock_get_last_index, mock_download_img_file):
+        self.instance.INCREMENTAL = True
+        self.instance._get_manifest().advance_high_water_mark(6)
+        self.instance.make_download()
+        self.assertEqual([call.args[0] for call in mock_download_img_file.call_args_list], [7, 8, 9])
+
+    def test_shard_keeps_only_its_comic_ids(self):
+        self.instance.close()
+        self.instance = XkcdDownloader(directory=self.directory.name, shard='2/3')
+        self.assertEqual(self.instance._get_pending_comic_ids(9), [2, 5, 8])
+
+    def test_shared_work_uses_the_rollback_journal(self):
+        self.assertEqual(self.instance._get_sqlite_journal_mode(), 'WAL')
+        for settings in [{'shard': '2/3'}, {'lease_queue_file': f'{self.directory.name}/leases.sqlite3'}]:
+            with self.subTest(**settings):
+                instance = XkcdDownloader(directory=self.directory.name, **settings)
+                self.assertEqual(instance._get_sqlite_journal_mode(), 'DELETE')
+                manifest_connection = instance._get_manifest()._connection
+                self.assertEqual(manifest_connection.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+                instance.close()
+        instance = XkcdDownloader(directory=self.directory.name, shard='2/3', sqlite_journal_mode='WAL')
+        self.assertEqual(instance._get_sqlite_journal_mode(), 'WAL')
+        instance.close()
+
+    def test_raises_value_error_for_invalid_shard(self):
+        with self.assertRaises(ValueError):
+            XkcdDownloader(directory=self.directory.name, shard='4/3')
+
+
+class TestStopOnInterrupt(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.instance = XkcdDownloader(directory=self.directory.name)
+
+    def tearDown(self):
+        self.instance.close()
+        self.directory.cleanup()
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=5)
+    def test_first_interrupt_lets_comic_in_flight_finish(self, mock_get_last_index, mock_download_img_file):
+        mock_download_img_file.side_effect = lambda comic_id: os.kill(os.getpid(), signal.SIGINT)
+        with self.assertLogs(level='WARNING') as captured_log:
+            self.instance.make_download()
+        mock_download_img_file.assert_called_once_with(1)
+        self.assertEqual(captured_log.output[-1], 'WARNING:xkcd:Download stopped before the end, '
+                                                  'the next run resumes from the journal')
+        self.assertIs(signal.getsignal(signal.SIGINT), signal.default_int_handler)
+
+    @patch('src.xkcd_downloader.XkcdDownloader._download_image_file_for_comic')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_last_index_from_api', return_value=5)
+    def test_second_interrupt_aborts(self, mock_get_last_index, mock_download_img_file):
+        def interrupt_twice(comic_id):
+            os.kill(os.getpid(), signal.SIGINT)
+            os.kill(os.getpid(), signal.SIGINT)
+        mock_download_img_file.side_effect = interrupt_twice
+        with self.assertRaises(KeyboardInterrupt):
+            self.instance.make_download()
+
+    @patch('src.xkcd_downloader.XkcdDownloader._make_request')
+    @patch('src.xkcd_downloader.XkcdDownloader._get_image_comic_url')
+    def test_abort_while_streaming_removes_temporary_file(self, mock_get_image_comic_url, mock_make_request):
+        response = DubleRequests(status_code=200, headers={'Content-Type': 'image/png'})
+        response.iter_content = mock.Mock(side_effect=KeyboardInterrupt)
+        mock_get_image_comic_url.return_value = 'https://imgs.xkcd.com/comics/a.png'
+        mock_make_request.return_value = response
+        with self.assertRaises(KeyboardInterrupt):
+            self.instance._download_image_file_for_comic(1)
+        self.assertEqual([name for name in os.listdir(self.directory.name)
+                          if name.startswith(self.instance.TEMPORARY_FILE_PREFIX)], [])
+
+
 class TestGetCountOfComicDownloadsMethod(unittest.TestCase):
     def setUp(self):
         self.instance = XkcdDownloader()